@@ -0,0 +1,195 @@
+"""
+ASGI entry point, next to ``morpfw.wsgi:app``.
+
+Morepath, the storages and the transaction manager are synchronous, and
+keep per request state in the execution context: database sessions and
+Elasticsearch clients in context variables, transactions in thread-locals
+of the transaction manager. Each request is therefore handled from start
+to end in one thread of a pool, while the event loop keeps accepting requests
+and streaming responses, so a process serves as many concurrent requests
+as it has threads instead of one per sync worker.
+"""
+import asyncio
+import functools
+import importlib
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from .main import DEFAULT_THREADS
+from .wsgi import load_app, wsgi_factory
+
+#: number of response chunks buffered before the request thread waits for
+#: the client to catch up
+BUFFERED_CHUNKS = 16
+
+APP = {"instance": None}
+
+
+def wsgi_environ(scope, body):
+    """WSGI environ of ASGI http ``scope`` with request ``body``"""
+    server = scope.get("server", None) or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/%s" % scope.get("http_version", "1.1"),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    client = scope.get("client", None)
+    if client:
+        environ["REMOTE_ADDR"] = client[0]
+        environ["REMOTE_PORT"] = str(client[1])
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if name not in ["CONTENT_TYPE", "CONTENT_LENGTH"]:
+            name = "HTTP_" + name
+        if name in environ:
+            sep = "; " if name == "HTTP_COOKIE" else ","
+            value = environ[name] + sep + value
+        environ[name] = value
+    # the body is read in full beforehand, including chunked bodies
+    environ["CONTENT_LENGTH"] = str(len(body))
+    return environ
+
+
+async def _drain(queue):
+    while (await queue.get()) is not None:
+        pass
+
+
+class ASGIApplication(object):
+    """Serve ``wsgi_app`` over ASGI, from a pool of ``threads`` threads.
+    ``startup`` is called on a thread of the pool on lifespan startup"""
+
+    def __init__(self, wsgi_app, threads=DEFAULT_THREADS, startup=None):
+        self.wsgi_app = wsgi_app
+        self.startup = startup
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="morpfw-asgi"
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            raise ValueError("Unsupported ASGI scope type %s" % scope["type"])
+        body = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(BUFFERED_CHUNKS)
+        environ = wsgi_environ(scope, b"".join(body))
+        future = loop.run_in_executor(self.executor, self.handle, environ, loop, queue)
+        try:
+            while True:
+                message = await queue.get()
+                if message is None:
+                    break
+                await send(message)
+        except BaseException:
+            # let the request thread run to completion instead of waiting
+            # on a full queue forever
+            asyncio.ensure_future(_drain(queue))
+            raise
+        await future
+
+    def handle(self, environ, loop, queue):
+        """Run the WSGI application on ``environ``, in a thread of the pool,
+        putting ASGI response messages on ``queue``"""
+
+        def put(message):
+            asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get("sent", False):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [
+                (k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers
+            ]
+            return write
+
+        def send_start():
+            if not response.get("sent", False):
+                response["sent"] = True
+                put(
+                    {
+                        "type": "http.response.start",
+                        "status": response["status"],
+                        "headers": response["headers"],
+                    }
+                )
+
+        def write(data):
+            send_start()
+            if data:
+                put({"type": "http.response.body", "body": data, "more_body": True})
+
+        try:
+            result = self.wsgi_app(environ, start_response)
+            try:
+                for chunk in result:
+                    write(chunk)
+                send_start()
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+            put({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            put(None)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.startup is not None:
+                    loop = asyncio.get_running_loop()
+                    try:
+                        await loop.run_in_executor(self.executor, self.startup)
+                    except Exception as e:
+                        message = {"type": "lifespan.startup.failed", "message": str(e)}
+                        await send(message)
+                        return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def asgi_factory(app_factory, threads=None):
+    if threads is None:
+        threads = int(os.environ.get("MORP_ASGI_THREADS", DEFAULT_THREADS))
+    return ASGIApplication(
+        wsgi_factory(app_factory),
+        threads=threads,
+        startup=functools.partial(load_app, app_factory),
+    )
+
+
+async def app(scope, receive, send):
+    if APP["instance"] is None:
+        app_mod, app_fname = os.environ["MORP_APP_FACTORY"].split(":")
+        app_factory = getattr(importlib.import_module(app_mod), app_fname)
+        APP["instance"] = asgi_factory(app_factory)
+    return await APP["instance"](scope, receive, send)
@@ -8,6 +8,7 @@ from sqlalchemy.orm import relationship
 class User(Base):
 
     __tablename__ = "authmanager_users"
+    __unique_constraint__ = ["username", "deleted"]
 
     username = sa.Column(sa.String(length=256))
     email = sa.Column(sa.String)
@@ -31,6 +32,7 @@ class APIKey(Base):
 class Group(Base):
 
     __tablename__ = "authmanager_groups"
+    __unique_constraint__ = ["groupname", "deleted"]
 
     parent = sa.Column(sa.String(length=256))
     groupname = sa.Column(sa.String(length=256))
@@ -1,6 +1,7 @@
 import hashlib
 
 import sqlalchemy as sa
+from sqlalchemy.sql import select
 from morpfw.crud import errors as cruderrors
 from morpfw.crud.storage.sqlstorage import SQLStorage
 
@@ -17,6 +18,18 @@ def hash(data):
     return hashlib.sha256(data.encode("utf-8")).hexdigest()
 
 
+def _delete_memberships(session, where):
+    # role assignments and memberships of vacuumed users/groups are removed
+    # together with them
+    membership_ids = select([db.Membership.id]).where(where)
+    session.execute(
+        db.RoleAssignment.__table__.delete().where(
+            db.RoleAssignment.membership_id.in_(membership_ids)
+        )
+    )
+    session.execute(db.Membership.__table__.delete().where(where))
+
+
 class UserSQLStorage(SQLStorage, IUserStorage):
     model = UserModel
     orm_model = db.User
@@ -79,17 +92,9 @@ class UserSQLStorage(SQLStorage, IUserStorage):
         u = self.get_by_userid(collection, userid)
         return u.data["password"] == hash(password)
 
-    def vacuum(self):
-        roleassignment_delete = db.RoleAssignment.__table__.delete().where(
-            db.User.deleted.isnot(None)
-        )
-
-        membership_delete = db.Membership.__table__.delete().where(
-            db.User.deleted.isnot(None)
-        )
-        self.session.execute(roleassignment_delete)
-        self.session.execute(membership_delete)
-        return super().vacuum()
+    def _vacuum_batch(self, ids):
+        _delete_memberships(self.session, db.Membership.user_id.in_(ids))
+        super()._vacuum_batch(ids)
 
 
 class APIKeySQLStorage(SQLStorage):
@@ -304,13 +309,6 @@ class GroupSQLStorage(SQLStorage, IGroupStorage):
         if ra:
             self.session.delete(ra)
 
-    def vacuum(self):
-        roleassignment_delete = db.RoleAssignment.__table__.delete().where(
-            db.Group.deleted.isnot(None)
-        )
-        membership_delete = db.Membership.__table__.delete().where(
-            db.Group.deleted.isnot(None)
-        )
-        self.session.execute(roleassignment_delete)
-        self.session.execute(membership_delete)
-        return super().vacuum()
+    def _vacuum_batch(self, ids):
+        _delete_memberships(self.session, db.Membership.group_id.in_(ids))
+        super()._vacuum_batch(ids)
@@ -9,9 +9,10 @@ from ..authn.pas.user.model import CurrentUserModel, UserCollection, UserModel
 from ..authn.pas.utils import has_role
 from ..crud import permission as crudperm
 from ..crud.model import Collection, Model
+from ..crud.permissionfilter import PermissionFilterApp
 
 
-class DefaultAuthzPolicy(morepath.App):
+class DefaultAuthzPolicy(morepath.App, PermissionFilterApp):
     pass
 
 
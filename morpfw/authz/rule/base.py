@@ -0,0 +1,17 @@
+def group_member(request, groupname, identity):
+    """
+    User of ``identity`` if it is a member of ``groupname``. Returns True if
+    the user is an administrator, and False if the user does not exist or
+    is not a member of the group
+    """
+    users = request.get_collection("morpfw.pas.user")
+    user = users.get_by_userid(identity.userid)
+    if user is None:
+        return False
+    if user["is_administrator"]:
+        return True
+
+    if groupname not in [g["groupname"] for g in user.groups()]:
+        return False
+
+    return user
@@ -2,21 +2,28 @@ from ...app import BaseApp as App
 from ...crud import permission as crudperms
 from ...crud.model import Collection, Model
 from ...permission import All
+from .base import group_member
 
 
 @App.authz_rule(name="morpfw.fullaccess")
 def group_policy(groupname, identity, model, permission):
-    request = model.request
-    users = request.get_collection("morpfw.pas.user")
-    user = users.get_by_userid(identity.userid)
-    if user["is_administrator"]:
+    user = group_member(model.request, groupname, identity)
+    if isinstance(user, bool):
+        return user
+
+    if issubclass(permission, All):
         return True
 
-    if groupname not in [g["groupname"] for g in user.groups()]:
-        return False
+    return False
+
+
+@App.authz_filter(name="morpfw.fullaccess")
+def group_filter(groupname, identity, collection, permission):
+    user = group_member(collection.request, groupname, identity)
+    if isinstance(user, bool):
+        return user
 
     if issubclass(permission, All):
         return True
 
     return False
-
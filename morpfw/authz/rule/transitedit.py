@@ -2,18 +2,14 @@ from ...app import BaseApp as App
 from ...crud import permission as crudperms
 from ...crud.model import Collection, Model
 from ...permission import All
+from .base import group_member
 
 
 @App.authz_rule(name="morpfw.transit-edit")
 def group_policy(groupname, identity, model, permission):
-    request = model.request
-    users = request.get_collection("morpfw.pas.user")
-    user = users.get_by_userid(identity.userid)
-    if user["is_administrator"]:
-        return True
-
-    if groupname not in [g["groupname"] for g in user.groups()]:
-        return False
+    user = group_member(model.request, groupname, identity)
+    if isinstance(user, bool):
+        return user
 
     if isinstance(model, Collection):
         if issubclass(permission, crudperms.View):
@@ -32,3 +28,19 @@ def group_policy(groupname, identity, model, permission):
             return True
     return False
 
+
+@App.authz_filter(name="morpfw.transit-edit")
+def group_filter(groupname, identity, collection, permission):
+    user = group_member(collection.request, groupname, identity)
+    if isinstance(user, bool):
+        return user
+
+    if issubclass(permission, crudperms.View):
+        return True
+
+    if issubclass(permission, crudperms.Edit):
+        return True
+
+    if issubclass(permission, crudperms.StateUpdate):
+        return True
+    return False
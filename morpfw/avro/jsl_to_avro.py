@@ -1,6 +1,9 @@
 import jsl
 import copy
 
+# values of free-form dictionaries are stored as JSON encoded strings
+MAP = {'type': 'map', 'values': 'string'}
+
 
 def _avro_field(**kwargs):
     result = {}
@@ -12,13 +15,15 @@ def _avro_field(**kwargs):
 
 def jsl_field_to_avro_field(prop: jsl.BaseField, name, namespace) -> dict:
     if isinstance(prop, jsl.DateTimeField):
-        return _avro_field(name=name, type='string')
+        # dates are serialized as milliseconds since epoch
+        return _avro_field(
+            name=name, type={'type': 'long', 'logicalType': 'timestamp-millis'})
     if isinstance(prop, jsl.StringField):
         return _avro_field(name=name, type='string')
     if isinstance(prop, jsl.IntField):
-        return _avro_field(name=name, type='int')
+        return _avro_field(name=name, type='long')
     if isinstance(prop, jsl.DictField):
-        return _avro_field(name=name, type='map')
+        return _avro_field(name=name, type=MAP)
     if isinstance(prop, jsl.NumberField):
         return _avro_field(name=name, type='double')
     if isinstance(prop, jsl.BooleanField):
@@ -28,19 +33,20 @@ def jsl_field_to_avro_field(prop: jsl.BaseField, name, namespace) -> dict:
             subtype = jsl_to_avro(
                 prop.document_cls, name=name, namespace='%s.%s' % (namespace, name))
             return _avro_field(name=name, type=subtype)
-        return _avro_field(name=name, type='map')
+        return _avro_field(name=name, type=MAP)
     if isinstance(prop, jsl.ArrayField):
         if prop.items:
             if isinstance(prop.items, jsl.DocumentField):
                 subtype = jsl_to_avro(
-                    prop.items.document_cls, namespace='%s.%s' % (namespace, name))
+                    prop.items.document_cls, name=name,
+                    namespace='%s.%s' % (namespace, name))
             elif isinstance(prop.items, jsl.BaseField):
                 subtype = jsl_field_to_avro_field(
                     prop.items, name=prop.name, namespace=namespace)['type']
             else:
                 raise KeyError(prop.items)
-            return _avro_field(name=name, type='array', items=subtype)
-        return _avro_field(name=name, type='array', items='string')
+            return _avro_field(name=name, type={'type': 'array', 'items': subtype})
+        return _avro_field(name=name, type={'type': 'array', 'items': 'string'})
 
     raise KeyError(prop)
 
@@ -56,8 +62,11 @@ def jsl_to_avro(schema, name=None, namespace='schema'):
         avsc['namespace'] = namespace
     for attr, prop in schema._fields.items():
         prop.name = attr
-        fields.append(jsl_field_to_avro_field(
-            prop, name=attr, namespace=namespace))
+        field = jsl_field_to_avro_field(prop, name=attr, namespace=namespace)
+        if not prop.required:
+            field['type'] = ['null', field['type']]
+            field['default'] = None
+        fields.append(field)
 
     avsc['fields'] = fields
     return avsc
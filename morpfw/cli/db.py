@@ -1,18 +1,24 @@
 import copy
 import importlib
+import multiprocessing
 import os
 import sys
 import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 from configparser import RawConfigParser
+from datetime import timedelta
 
 import click
 import morpfw
 import reg
+import transaction
 from alembic.config import CommandLine as AlembicCLI
 from alembic.config import Config as AlembicCfg
 from alembic.config import main as alembic_main
 
 from ..alembic import drop_all
+from ..crud.rollup import reconcile_rollups
 from .cli import cli, confirmation_dialog, load
 
 
@@ -86,24 +92,135 @@ def resetdb(ctx):
         drop_all(request)
 
 
+INTERVAL_UNITS = {
+    "s": "seconds",
+    "m": "minutes",
+    "h": "hours",
+    "d": "days",
+    "w": "weeks",
+}
+
+
+def parse_interval(value):
+    """Parse interval such as ``30d``, ``12h`` or ``90m`` into timedelta"""
+    value = value.strip()
+    unit = INTERVAL_UNITS.get(value[-1:], None)
+    try:
+        if unit is None:
+            return timedelta(days=int(value))
+        return timedelta(**{unit: int(value[:-1])})
+    except ValueError:
+        raise click.BadParameter("Invalid interval '%s'" % value)
+
+
 @cli.command(help="Vacuum database")
+@click.option(
+    "-t",
+    "--type",
+    "typenames",
+    multiple=True,
+    help="Type to vacuum, can be repeated. Defaults to all types",
+)
+@click.option(
+    "-b", "--batch-size", type=int, default=1000, help="Records removed per batch"
+)
+@click.option(
+    "--older-than",
+    default=None,
+    help="Only remove records deleted longer than this ago (eg: 30d, 12h)",
+)
+@click.option(
+    "-w", "--workers", type=int, default=1, help="Number of types vacuumed in parallel"
+)
 @click.pass_context
-def vacuum(ctx):
-    param = load(ctx.obj["settings"])
+def vacuum(ctx, typenames, batch_size, older_than, workers):
+    if older_than:
+        older_than = parse_interval(older_than)
+    settings_file = ctx.obj["settings"]
+    param = load(settings_file)
 
     settings = param["settings"]
 
     with morpfw.request_factory(settings) as request:
-
-        types = request.app.config.type_registry.get_typeinfos(request)
-        for typeinfo in types.values():
-
-            collection = request.get_collection(typeinfo["name"])
-            vacuum_f = getattr(collection.storage, "vacuum", None)
-            if vacuum_f:
-                print("Vacuuming %s" % typeinfo["name"])
-                items = vacuum_f()
-                print("%s record(s) affected" % items)
+        if not typenames:
+            types = request.app.config.type_registry.get_typeinfos(request)
+            typenames = list(types.keys())
+        if workers < 2:
+            for typename in typenames:
+                _vacuum_collection(request, typename, batch_size, older_than)
+            return
+
+    # workers are spawned rather than forked so that they do not inherit
+    # database connections from this process
+    mp_context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+        futures = [
+            pool.submit(_vacuum_type, settings_file, t, batch_size, older_than)
+            for t in typenames
+        ]
+        for future in futures:
+            future.result()
+
+
+def _vacuum_type(settings_file, typename, batch_size, older_than):
+    param = load(settings_file)
+    with morpfw.request_factory(
+        param["settings"], extra_environ={"morpfw.nomemoize": True}
+    ) as request:
+        return _vacuum_collection(request, typename, batch_size, older_than)
+
+
+def _vacuum_collection(request, typename, batch_size, older_than):
+    collection = request.get_collection(typename)
+    vacuum_f = getattr(collection.storage, "vacuum", None)
+    if not vacuum_f:
+        return 0
+    print("Vacuuming %s" % typename)
+    starttime = time.time()
+
+    def commit():
+        # each batch is committed on its own, a new savepoint is needed
+        # for the request to be able to roll back the current batch
+        transaction.commit()
+        request.savepoint = transaction.savepoint()
+
+    def progress(total, last_id):
+        elapsed = time.time() - starttime
+        print(
+            "%s: %s record(s) removed, up to id %s (%.0f/s)"
+            % (typename, total, last_id, total / elapsed if elapsed else total),
+            file=sys.stderr,
+        )
+
+    items = vacuum_f(
+        batch_size=batch_size, older_than=older_than, commit=commit, progress=progress
+    )
+    elapsed = time.time() - starttime
+    print("%s: %s record(s) affected in %.1fs" % (typename, items, elapsed))
+    return items
+
+
+@cli.command(help="Reconcile rollup summary tables")
+@click.option(
+    "-t",
+    "--type",
+    "typenames",
+    multiple=True,
+    help="Type to reconcile, can be repeated. Defaults to all types",
+)
+@click.option(
+    "--stale-only", is_flag=True, help="Only rebuild rollups that went stale"
+)
+@click.pass_context
+def rollup(ctx, typenames, stale_only):
+    param = load(ctx.obj["settings"])
+    with morpfw.request_factory(param["settings"]) as request:
+        result = reconcile_rollups(
+            request, typenames=list(typenames) or None, stale_only=stale_only
+        )
+        for typename, rollups in result.items():
+            for name, buckets in rollups.items():
+                print("%s: %s rebuilt, %s bucket(s)" % (typename, name, buckets))
 
 
 @cli.command(
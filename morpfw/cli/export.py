@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+import morpfw
+import rulez
+
+from ..crud.export import CONTENT_TYPES, iter_export
+from .cli import cli, load
+
+
+@cli.command(help="Export collection as CSV, NDJSON or Avro")
+@click.argument("typename")
+@click.option(
+    "-f",
+    "--format",
+    "fmt",
+    type=click.Choice(sorted(CONTENT_TYPES.keys())),
+    default="ndjson",
+    help="Output format",
+)
+@click.option("-q", "--query", default=None, help="rulez dsl filter query")
+@click.option("--fields", default=None, help="Comma separated fields to export")
+@click.option(
+    "-o",
+    "--output",
+    default="-",
+    help="Output file, '-' for stdout. When using multiple workers, "
+    "each worker writes to OUTPUT with its part number appended",
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=1,
+    help="Number of worker processes, each exporting a range of ids",
+)
+@click.option(
+    "-b", "--batch-size", type=int, default=1000, help="Records fetched per batch"
+)
+@click.pass_context
+def export(ctx, typename, fmt, query, fields, output, workers, batch_size):
+    if fields:
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    fields = fields or None
+    if workers < 2:
+        _export(ctx.obj["settings"], typename, fmt, query, fields, output, batch_size)
+        return
+
+    if output == "-":
+        raise click.UsageError("--output is required when using multiple workers")
+
+    param = load(ctx.obj["settings"])
+    with morpfw.request_factory(param["settings"]) as request:
+        collection = request.get_collection(typename)
+        min_id = collection.min_id()
+        max_id = collection.max_id()
+    if min_id is None:
+        _export(ctx.obj["settings"], typename, fmt, query, fields, output, batch_size)
+        return
+
+    root, ext = os.path.splitext(output)
+    step = (max_id - min_id) // workers + 1
+    jobs = []
+    for i in range(workers):
+        id_range = (min_id + i * step, min_id + (i + 1) * step)
+        path = "%s-%d%s" % (root, i + 1, ext)
+        jobs.append(
+            (ctx.obj["settings"], typename, fmt, query, fields, path, batch_size)
+            + (id_range,)
+        )
+
+    # workers are spawned rather than forked so that they do not inherit
+    # database connections from this process
+    mp_context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+        futures = [pool.submit(_export, *job) for job in jobs]
+        for job, future in zip(jobs, futures):
+            count = future.result()
+            print("%s: %s records" % (job[5], count), file=sys.stderr)
+
+
+def _export(
+    settings_file, typename, fmt, query, fields, output, batch_size, id_range=None
+):
+    param = load(settings_file)
+    with morpfw.request_factory(
+        param["settings"], extra_environ={"morpfw.nomemoize": True}
+    ) as request:
+        collection = request.get_collection(typename)
+        if query:
+            query = collection.searchprovider().parse_query(query)
+        if id_range is not None:
+            bounds = [rulez.field["id"] >= id_range[0], rulez.field["id"] < id_range[1]]
+            query = rulez.and_(*([query] if query else []) + bounds)
+
+        count = 0
+
+        def counted(objs):
+            nonlocal count
+            for obj in objs:
+                count += 1
+                yield obj
+
+        objs = collection.iter_search(
+            query, order_by=("id", "asc"), fields=fields, batch_size=batch_size
+        )
+        chunks = iter_export(collection, counted(objs), fmt, fields=fields)
+        if output == "-":
+            out = sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
+        else:
+            with open(output, "wb") as out:
+                for chunk in chunks:
+                    out.write(chunk)
+        return count
@@ -5,7 +5,7 @@ from alembic.config import CommandLine as AlembicCLI
 from alembic.config import Config as AlembicCfg
 from alembic.config import main as alembic_main
 
-from . import db, elasticstore, register_admin, scheduler, shell, start, worker
+from . import db, elasticstore, export, register_admin, scheduler, shell, start, worker
 from .cli import cli
 from .generate_config import genconfig as genconfig_main
 
@@ -11,8 +11,22 @@ from .cli import cli, load
 @click.option(
     "--workers", default=None, type=int, help="Number of workers to run in  prod mode"
 )
+@click.option(
+    "--worker-class",
+    default=None,
+    help="Gunicorn worker class in prod mode (sync, gthread, gevent)",
+)
+@click.option(
+    "--threads", default=None, type=int, help="Threads per gthread worker in prod mode"
+)
+@click.option(
+    "--preload",
+    default=None,
+    is_flag=True,
+    help="Load the application once in the master process in prod mode",
+)
 @click.pass_context
-def start(ctx, host, port, prod, workers):
+def start(ctx, host, port, prod, workers, worker_class, threads, preload):
 
     param = load(ctx.obj["settings"], host, port)
     if prod:
@@ -23,6 +37,9 @@ def start(ctx, host, port, prod, workers):
             port=param["port"],
             ignore_cli=True,
             workers=workers,
+            worker_class=worker_class,
+            threads=threads,
+            preload=preload,
         )
     else:
         morpfw.run(
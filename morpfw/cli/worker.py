@@ -1,3 +1,4 @@
+import gc
 import socket
 import threading
 from datetime import datetime
@@ -15,6 +16,9 @@ def start_worker(ctx):
     now = datetime.utcnow().strftime(r"%Y%m%d%H%M")
     # scan
     param["factory"](param["settings"], instantiate=False)
+    # pool processes share the scanned configuration with the parent
+    gc.collect()
+    gc.freeze()
     w = param["class"].celery.Worker(hostname="worker%s.%s" % (now, hostname), **ws)
     w.start()
 
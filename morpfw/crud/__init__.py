@@ -1,6 +1,7 @@
 import morepath
 from .app import App
 from . import subscribers
+from . import rollup
 import argparse
 import yaml
 import sqlalchemy
@@ -1,10 +1,11 @@
 import re
 
-from rulez import OperatorNotAllowedError, parse_dsl
+from rulez import OperatorNotAllowedError
 
 from ...interfaces import IAggregateProvider
 from ..errors import UnprocessableError
 from ..model import Collection
+from ..querycache import parse_dsl
 
 
 class AggregateProvider(IAggregateProvider):
@@ -1,3 +1,4 @@
+from .. import rollup
 from ..app import App
 from ..model import Collection
 from .base import AggregateProvider
@@ -5,6 +6,13 @@ from .base import AggregateProvider
 
 class StorageAggregateProvider(AggregateProvider):
     def aggregate(self, query=None, group=None, order_by=None, limit=None):
+        if not query:
+            # answer from precomputed rollup where possible
+            result = rollup.aggregate(
+                self.context, group, order_by=order_by, limit=limit
+            )
+            if result is not None:
+                return result
         return self.storage.aggregate(
             query, group=group, order_by=order_by, limit=limit
         )
@@ -10,13 +10,14 @@ from sqlalchemy.orm import sessionmaker
 
 from . import component as actions
 from . import signals as signals
+from .permissionfilter import PermissionFilterApp
 from .blobstorage.base import NullBlobStorage
 from .model import Model
 
 MARKER = object()
 
 
-class App(JsonSchemaApp, signals.SignalApp):
+class App(JsonSchemaApp, signals.SignalApp, PermissionFilterApp):
 
     dataprovider = dectate.directive(actions.DataProviderAction)
     jsonprovider = dectate.directive(actions.JSONProviderAction)
@@ -36,6 +37,7 @@ class App(JsonSchemaApp, signals.SignalApp):
     typeinfo = dectate.directive(actions.TypeInfoFactoryAction)
     metalink = dectate.directive(actions.MetalinkAction)
     authz_rule = dectate.directive(actions.AuthzRuleAction)
+    authz_filter = dectate.directive(actions.AuthzFilterAction)
 
     def get_storage(self, model, request):
         blobstorage = self.get_blobstorage(model, request)
@@ -88,7 +90,13 @@ class App(JsonSchemaApp, signals.SignalApp):
     def get_authz_rule(self, name):
         raise NotImplementedError(name)
 
-    @reg.dispatch_method(
+    @reg.dispatch(reg.match_key("name"))
+    def get_authz_filter(self, name):
+        return None
+
+    # data and json providers are looked up for every object loaded and
+    # serialized, lookups are cached per combination of classes
+    @morepath.dispatch_method(
         reg.match_class("schema", lambda self, schema, obj, storage: schema),
         reg.match_instance("obj"),
         reg.match_instance("storage"),
@@ -98,7 +106,7 @@ class App(JsonSchemaApp, signals.SignalApp):
             "Dataprovider for %s/%s" % (storage.__class__, obj.__class__)
         )
 
-    @reg.dispatch_method(reg.match_instance("obj"))
+    @morepath.dispatch_method(reg.match_instance("obj"))
     def get_jsonprovider(self, obj):
         raise NotImplementedError("JSONProvider for %s" % obj.__class__)
 
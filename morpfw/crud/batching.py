@@ -1,5 +1,7 @@
 from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
 
+from .cursor import NEXT, PREVIOUS
+
 
 class CollectionBatching(object):
     def __init__(
@@ -11,6 +13,11 @@ class CollectionBatching(object):
         pagesize=20,
         pagenumber=0,
         page_opt="page",
+        cursor=None,
+        cursor_opt="cursor",
+        use_cursor=False,
+        secure=False,
+        count_strategy=None,
     ):
         self.collection = collection
         self.request = request
@@ -21,26 +28,64 @@ class CollectionBatching(object):
         self._items = None
         self._total = None
         self.page_opt = page_opt
+        self.cursor = cursor
+        self.cursor_opt = cursor_opt
+        # when cursor is set, next/previous navigation uses keyset pagination
+        self.use_cursor = use_cursor or bool(cursor)
+        self.secure = secure
+        # see morpfw.crud.counting, defaults to the collection strategy
+        self.count_strategy = count_strategy
 
     def items(self):
         if self._items is None:
-            offset = self.pagesize * self.pagenumber
-            self._items = self.collection.search(
-                query=self.query,
-                limit=self.pagesize,
-                offset=offset,
-                order_by=self.order_by,
-            )
+            if self.cursor:
+                self._items = self.collection.search(
+                    query=self.query,
+                    limit=self.pagesize,
+                    order_by=self.order_by,
+                    cursor=self.cursor,
+                    secure=self.secure,
+                )
+            else:
+                offset = self.pagesize * self.pagenumber
+                self._items = self.collection.search(
+                    query=self.query,
+                    limit=self.pagesize,
+                    offset=offset,
+                    order_by=self.order_by,
+                    secure=self.secure,
+                )
         return self._items
 
+    def next_cursor(self):
+        items = self.items()
+        if not items:
+            return None
+        return self.collection.cursor(items[-1], self.order_by, NEXT)
+
+    def previous_cursor(self):
+        items = self.items()
+        if not items:
+            return None
+        return self.collection.cursor(items[0], self.order_by, PREVIOUS)
+
     def total(self):
         if self._total is None:
-            self._total = self.collection.aggregate(
-                query=self.query,
-                group={"count": {"function": "count", "field": "uuid"}},
-            )[0]["count"]
+            self._total = self.collection.count(
+                self.query, secure=self.secure, strategy=self.count_strategy
+            )
         return self._total
 
+    def total_exact(self):
+        return getattr(self.total(), "exact", True)
+
+    def total_title(self):
+        """Total number of items for display, eg: ``about 1.2M``"""
+        total = self.total()
+        if hasattr(total, "humanize"):
+            return total.humanize()
+        return str(total)
+
     def total_pages(self):
         total = self.total()
         return int(total / self.pagesize) + 1
@@ -54,13 +99,16 @@ class CollectionBatching(object):
         parsed_url = urlparse(url)
         qs = parse_qs(parsed_url.query)
 
-        def get_page_url(page):
+        def get_page_url(page, cursor=None):
             qso = qs.copy()
             for k, v in list(qso.items()):
                 if isinstance(v, list) and len(v) == 1:
                     v = v[0]
                 qso[k] = v
             qso[self.page_opt] = page
+            qso.pop(self.cursor_opt, None)
+            if cursor:
+                qso[self.cursor_opt] = cursor
             return (
                 parsed_url.scheme
                 + "://"
@@ -97,7 +145,10 @@ class CollectionBatching(object):
                 {
                     "page": self.pagenumber - 1,
                     "title": "<",
-                    "url": get_page_url(self.pagenumber - 1),
+                    "url": get_page_url(
+                        self.pagenumber - 1,
+                        self.previous_cursor() if self.use_cursor else None,
+                    ),
                 }
             )
         elif self.pagenumber == 0:
@@ -142,7 +193,8 @@ class CollectionBatching(object):
                 pages.append(
                     {"page": None, "title": "...", "url": None, "state": "disabled"}
                 )
-                if self.pagenumber != self.total_pages() - 1:
+                # last page is unknown when total is an estimate
+                if self.pagenumber != self.total_pages() - 1 and self.total_exact():
                     pages.append(
                         {
                             "page": self.total_pages() - 1,
@@ -155,7 +207,10 @@ class CollectionBatching(object):
                 {
                     "page": self.pagenumber + 1,
                     "title": ">",
-                    "url": get_page_url(self.pagenumber + 1),
+                    "url": get_page_url(
+                        self.pagenumber + 1,
+                        self.next_cursor() if self.use_cursor else None,
+                    ),
                 }
             )
         elif self.pagenumber + 1 == self.total_pages():
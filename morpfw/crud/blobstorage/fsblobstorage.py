@@ -6,7 +6,6 @@ import typing
 from pathlib import Path
 from urllib.parse import urlparse
 from uuid import uuid4
-import warnings
 import morepath
 import morpfw
 
@@ -112,18 +111,11 @@ class FSBlobStorage(BlobStorage):
 @App.blobstorage_factory("fsblob")
 def get_fsblobstorage(request, uri):
     parsed = urlparse(uri)
-    home_env = request.app.home_env
-    if home_env not in os.environ:
-        if 'MORP_WORKDIR' in os.environ:
-            warnings.warn("MORP_WORKDIR environment is deprecated, use %s" %
-                        home_env, DeprecationWarning)
-            home_env = 'MORP_WORKDIR'
-
     if parsed.netloc == "":
         path = parsed.path
     else:
         path = os.path.join(
-            os.environ.get(home_env, os.getcwd()),
+            request.get_home_dir(),
             parsed.netloc,
             *parsed.path.split("/")
         )
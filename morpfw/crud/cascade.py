@@ -0,0 +1,114 @@
+import rulez
+
+from . import signals
+
+#: number of values per ``in`` query or set-based delete
+DEFAULT_BATCH_SIZE = 1000
+
+
+class Step(object):
+    """Objects of one collection removed at one level of a cascade"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.objects = []
+
+    def identifiers(self):
+        return [o.identifier for o in self.objects]
+
+    def blob_uuids(self):
+        result = []
+        for obj in self.objects:
+            result += obj.blob_uuids()
+        return result
+
+
+def _batches(values, batch_size):
+    for i in range(0, len(values), batch_size):
+        yield values[i : i + batch_size]
+
+
+def _fields(request, collection):
+    # fields needed to walk further down the graph and to clean up blobs
+    model = collection.storage.model
+    result = []
+    for bref in getattr(collection.schema, "__backreferences__", None) or []:
+        reference = bref.get_reference(request)
+        if reference is not None and reference.attribute not in result:
+            result.append(reference.attribute)
+    if model.blob_fields and model.blobstorage_field not in result:
+        result.append(model.blobstorage_field)
+    return result
+
+
+def plan(obj, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Objects that are removed by a cascade delete of ``obj``, found by
+    walking ``__backreferences__`` level by level, with one ``in`` query
+    per backreference (per ``batch_size`` referenced values) at each level.
+
+    Returns a list of levels, starting from the direct backreferences of
+    ``obj``, each level being a list of ``Step``, one per collection
+    """
+    request = obj.request
+    seen = set([(obj.collection.schema, obj.identifier)])
+    levels = []
+    parents = [(obj.collection, [obj])]
+    while parents:
+        steps = {}
+        for collection, objs in parents:
+            for bref in getattr(collection.schema, "__backreferences__", None) or []:
+                reference = bref.get_reference(request)
+                if reference is None:
+                    raise ValueError(
+                        "Invalid reference name. %s" % bref.reference_name
+                    )
+                values = []
+                for o in objs:
+                    value = o[reference.attribute]
+                    if value is not None and value not in values:
+                        values.append(value)
+                if not values:
+                    continue
+                child = bref.collection(request)
+                fields = _fields(request, child)
+                for batch in _batches(values, batch_size):
+                    query = rulez.field(reference.name).in_(batch)
+                    for item in child.search(query, fields=fields):
+                        key = (child.schema, item.identifier)
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        step = steps.setdefault(child.schema, Step(child))
+                        step.objects.append(item)
+        levels.append(list(steps.values()))
+        parents = [(s.collection, s.objects) for s in steps.values()]
+    return [level for level in levels if level]
+
+
+def delete(obj, permanent=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Delete objects backreferencing ``obj`` (recursively) using set-based
+    deletes, deepest level first, with one statement per collection per
+    level (per ``batch_size`` objects).
+
+    ``OBJECTS_TOBEDELETED`` is dispatched with the objects of each
+    collection before they are deleted, and ``OBJECTS_DELETED`` after.
+    Per object hooks and ``OBJECT_TOBEDELETED`` are not processed. Blobs of
+    deleted objects are removed. Returns the executed plan
+    """
+    request = obj.request
+    levels = plan(obj, batch_size=batch_size)
+    for level in reversed(levels):
+        for step in level:
+            collection = step.collection
+            dispatch = request.app.dispatcher(signals.OBJECTS_TOBEDELETED)
+            dispatch.dispatch(request, signals.ObjectBatch(collection, step.objects))
+            idfield = request.app.get_identifierfield(collection.schema)
+            for batch in _batches(step.identifiers(), batch_size):
+                collection.delete_where(
+                    rulez.field(idfield).in_(batch), permanent=permanent
+                )
+            for uuid in step.blob_uuids():
+                collection.storage.delete_blob(uuid)
+    return levels
@@ -314,3 +314,19 @@ class AuthzRuleAction(dectate.Action):
 
         app_class.get_authz_rule.register(reg.methodify(factory), name=self.name)
 
+
+class AuthzFilterAction(dectate.Action):
+
+    app_class_arg = True
+
+    def __init__(self, name):
+        self.name = name
+
+    def identifier(self, app_class):
+        return self.name
+
+    def perform(self, obj, app_class):
+        def factory(name):
+            return obj
+
+        app_class.get_authz_filter.register(reg.methodify(factory), name=self.name)
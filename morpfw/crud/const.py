@@ -1 +1,11 @@
 SEPARATOR = '\\'
+
+# covers the default listing query, ``created DESC`` (with ``id`` as keyset
+# tiebreaker) on objects that are not soft-deleted
+DEFAULT_INDEXES = [
+    {
+        "name": "active_created",
+        "fields": [("created", "desc"), ("id", "desc")],
+        "where": {"field": "deleted", "operator": "==", "value": None},
+    }
+]
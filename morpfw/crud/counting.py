@@ -0,0 +1,84 @@
+import json
+import threading
+import time
+
+#: count matching objects on every call
+EXACT = "exact"
+#: ask the backend for a cheap estimate (planner statistics, capped hits)
+ESTIMATE = "estimate"
+#: count matching objects, and reuse the result until it expires
+CACHED = "cached"
+
+STRATEGIES = [EXACT, ESTIMATE, CACHED]
+
+
+class Count(int):
+    """
+    Number of objects. ``exact`` is ``False`` if the number is an estimate,
+    or a lower bound of the actual number
+    """
+
+    def __new__(cls, value, exact=True):
+        obj = super().__new__(cls, value)
+        obj.exact = exact
+        return obj
+
+    def __repr__(self):
+        if self.exact:
+            return "<Count %d>" % self
+        return "<Count ~%d>" % self
+
+    def humanize(self):
+        """Human readable count, eg: ``1234`` or ``about 1.2M``"""
+        if self.exact:
+            return str(int(self))
+        value = int(self)
+        for threshold, suffix in [(10 ** 9, "B"), (10 ** 6, "M"), (10 ** 3, "K")]:
+            if value >= threshold:
+                short = ("%.1f" % (value / threshold)).rstrip("0").rstrip(".")
+                return "about %s%s" % (short, suffix)
+        return "about %d" % value
+
+
+class CountCache(object):
+    """
+    Process-wide cache of exact counts, entries expire after the ttl
+    given when they are stored
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def key(self, collection, query):
+        include_deleted = collection.request.environ.get(
+            "morpfw.sqlstorage.include_deleted", False
+        )
+        return (
+            collection.app.__class__,
+            collection.__class__,
+            json.dumps(query, sort_keys=True, default=str),
+            bool(include_deleted),
+        )
+
+    def get(self, key):
+        entry = self.entries.get(key, None)
+        if entry is None:
+            return None
+        expiry, value = entry
+        if expiry < time.monotonic():
+            with self.lock:
+                self.entries.pop(key, None)
+            return None
+        return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+count_cache = CountCache()
@@ -0,0 +1,68 @@
+import base64
+import json
+from datetime import date, datetime
+
+from dateutil.parser import parse as parse_date
+
+from .errors import UnprocessableError
+
+NEXT = "next"
+PREVIOUS = "previous"
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"t": "datetime", "v": value.isoformat()}
+    if isinstance(value, date):
+        return {"t": "date", "v": value.isoformat()}
+    return {"v": value}
+
+
+def _decode_value(value):
+    t = value.get("t", None)
+    if t == "datetime":
+        return parse_date(value["v"])
+    if t == "date":
+        return parse_date(value["v"]).date()
+    return value["v"]
+
+
+def encode_cursor(values, order_by, direction=NEXT):
+    """
+    Encode keyset values (eg: ``[created, id]`` of the last row of a page)
+    into an opaque, url-safe cursor token
+    """
+    payload = {
+        "k": [_encode_value(v) for v in values],
+        "o": list(order_by),
+        "d": direction,
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, order_by=None):
+    """
+    Decode cursor token into ``(values, direction)``. If ``order_by``
+    is specified, the token must have been generated for the same ordering
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw.decode("utf8"))
+        values = [_decode_value(v) for v in payload["k"]]
+        cursor_order_by = payload["o"]
+        direction = payload["d"]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise UnprocessableError("Invalid cursor '%s'" % token)
+
+    if direction not in [NEXT, PREVIOUS]:
+        raise UnprocessableError("Invalid cursor '%s'" % token)
+
+    if order_by is not None and list(order_by) != cursor_order_by:
+        raise UnprocessableError("Cursor does not match ordering %s" % list(order_by))
+    return values, direction
+
+
+def reverse_order(order_by):
+    col, d = order_by
+    return (col, "asc" if d == "desc" else "desc")
@@ -6,6 +6,7 @@ from inverter import dc2colanderjson
 from inverter.common import dataclass_check_type, dataclass_get_type
 
 from ...interfaces import IDataProvider, ISchema
+from .. import schemaconv, serializer
 from ..app import App
 from ..storage.memorystorage import MemoryStorage
 from ..types import datestr
@@ -91,8 +92,11 @@ class DictProvider(IDataProvider):
         return result
 
     def as_json(self):
-        cschema = dc2colanderjson.convert(self.schema, request=self.storage.request)
-        return cschema().serialize(self.as_dict())
+        cschema = schemaconv.convert(
+            dc2colanderjson, self.schema, request=self.storage.request
+        )
+        serialize = serializer.get_serialize(self.storage.app)
+        return serialize(cschema, self.as_dict(), request=self.storage.request)
 
 
 @App.dataprovider(schema=ISchema, obj=dict, storage=MemoryStorage)
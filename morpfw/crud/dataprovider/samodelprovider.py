@@ -10,10 +10,10 @@ import sqlalchemy as sa
 import sqlalchemy_jsonfield as sajson
 from dateutil.parser import parse as _parse_date
 from inverter import dc2colanderjson
-from inverter.common import dataclass_get_type
 from morpfw.authn.pas.policy import Identity
 
 from ...interfaces import IDataProvider, ISchema
+from .. import schemaconv, serializer
 from ..app import App
 from ..storage.sqlstorage import GUID, Base, MappedTable, SQLStorage
 from ..types import datestr
@@ -30,7 +30,112 @@ def parse_date(datestr):
     return d.replace(tzinfo=None)
 
 
+def _get_value(provider, key):
+    try:
+        return getattr(provider.data, key)
+    except AttributeError:
+        raise KeyError(key)
+
+
+def _get_datetime(provider, key):
+    data = _get_value(provider, key)
+    if data:
+        return data.astimezone(provider.request.timezone())
+    return None
+
+
+def _get_guid(provider, key):
+    data = _get_value(provider, key)
+    if data:
+        return data.hex
+    return None
+
+
+def _get_json(provider, key):
+    data = _get_value(provider, key)
+    if data is not None:
+        return copy.deepcopy(data)
+    return None
+
+
+def _set_value(provider, key, value):
+    setattr(provider.data, key, value)
+
+
+def _set_datetime(provider, key, value):
+    if value:
+        if not isinstance(value, datetime.datetime):
+            value = parse_date(value)
+        value = value.astimezone(pytz.UTC)
+    setattr(provider.data, key, value)
+
+
+def _set_guid(provider, key, value):
+    if value:
+        value = uuid.UUID(value)
+    setattr(provider.data, key, value)
+
+
+class ColumnAccessors(object):
+    """
+    Getters and setters of the columns of ``orm_model``, and defaults of
+    the fields of ``schema``, resolved once per schema and model
+    """
+
+    def __init__(self, schema, orm_model):
+        self.getters = {}
+        self.setters = {}
+        for key, column in orm_model.__table__.c.items():
+            if isinstance(column.type, sa.DateTime):
+                getter, setter = _get_datetime, _set_datetime
+            elif isinstance(column.type, GUID):
+                getter, setter = _get_guid, _set_guid
+            elif isinstance(column.type, sajson.JSONField):
+                getter, setter = _get_json, _set_value
+            else:
+                getter, setter = _get_value, _set_value
+            self.getters[key] = getter
+            self.setters[key] = setter
+
+        # field name -> (is factory, default)
+        self.defaults = {}
+        # (field name, exclude_if_empty)
+        self.fields = []
+        for name, field in schema.__dataclass_fields__.items():
+            if not isinstance(field.default, _MISSING_TYPE):
+                self.defaults[name] = (False, field.default)
+            elif not isinstance(field.default_factory, _MISSING_TYPE):
+                self.defaults[name] = (True, field.default_factory)
+            else:
+                self.defaults[name] = (False, None)
+            self.fields.append((name, field.metadata.get("exclude_if_empty", False)))
+
+
+_accessors: dict = {}
+
+
+def get_accessors(schema, orm_model):
+    key = (schema, orm_model)
+    accessors = _accessors.get(key, None)
+    if accessors is None:
+        accessors = ColumnAccessors(schema, orm_model)
+        _accessors[key] = accessors
+    return accessors
+
+
 class SQLAlchemyModelProvider(IDataProvider):
+
+    __slots__ = (
+        "request",
+        "schema",
+        "data",
+        "orm_model",
+        "columns",
+        "storage",
+        "changed",
+        "accessors",
+    )
+
     def __init__(self, schema, data, storage):
         self.request = storage.request
         self.schema = schema
@@ -39,76 +144,48 @@ class SQLAlchemyModelProvider(IDataProvider):
         self.columns = self.orm_model.__table__.c
         self.storage = storage
         self.changed = False
+        self.accessors = get_accessors(schema, self.orm_model)
 
     def __getitem__(self, key):
-        if isinstance(self.columns[key].type, sa.DateTime):
-            try:
-                data = getattr(self.data, key)
-            except AttributeError:
-                raise KeyError(key)
-            if data:
-                data = data.astimezone(self.request.timezone())
-                return data
-            return None
-        if isinstance(self.columns[key].type, GUID):
-            try:
-                data = getattr(self.data, key)
-            except AttributeError:
-                raise KeyError(key)
-            if data:
-                return data.hex
-            return None
-        if isinstance(self.columns[key].type, sajson.JSONField):
-            try:
-                data = getattr(self.data, key)
-            except AttributeError:
-                raise KeyError(key)
-            if data is not None:
-                return copy.deepcopy(data)
-            return None
         try:
-            return getattr(self.data, key)
-        except AttributeError:
+            getter = self.accessors.getters[key]
+        except KeyError:
             raise KeyError(key)
+        return getter(self, key)
 
     def __setitem__(self, key, value):
-        if key not in self.columns:
+        setter = self.accessors.setters.get(key, None)
+        if setter is None:
             return
-        if value and isinstance(self.columns[key].type, sa.DateTime):
-            if not isinstance(value, datetime.datetime):
-                value = parse_date(value)
-            value = value.astimezone(pytz.UTC)
-        elif value and isinstance(self.columns[key].type, GUID):
-            value = uuid.UUID(value)
-
-        setattr(self.data, key, value)
+        self.load_primary()
+        setter(self, key, value)
 
     def __delitem__(self, key):
+        self.load_primary()
         setattr(self.data, key, None)
 
+    def load_primary(self):
+        """Reload ``data`` from the primary session if it was read through a
+        read replica, so that it can be modified"""
+        self.data = self.storage.primary_object(self.data)
+
     def setdefault(self, key, value):
         if self.get(key):
             return
         self.set(key, value)
 
     def get(self, key, default=_MARKER):
-        if default is _MARKER:
-            attr = self.schema.__dataclass_fields__.get(key, None)
-            if attr:
-                # t = dataclass_get_type(attr)
-                if not isinstance(attr.default, _MISSING_TYPE):
-                    default = attr.default
-                elif not isinstance(attr.default_factory, _MISSING_TYPE):
-                    default = attr.default_factory()
-                else:
-                    default = None
-
-        if default is not _MARKER:
-            try:
-                return self[key]
-            except KeyError:
+        try:
+            return self[key]
+        except KeyError:
+            if default is not _MARKER:
                 return default
-        return self[key]
+            if key not in self.accessors.defaults:
+                raise
+        is_factory, default = self.accessors.defaults[key]
+        if is_factory:
+            return default()
+        return default
 
     def set(self, key, value):
         self[key] = value
@@ -124,27 +201,26 @@ class SQLAlchemyModelProvider(IDataProvider):
         return self.schema.__dataclass_fields__.keys()
 
     def as_dict(self):
-        fields = self.schema.__dataclass_fields__.items()
         result = {}
-        for n, f in fields:
+        for n, exclude_if_empty in self.accessors.fields:
             v = self.get(n)
-            t = dataclass_get_type(f)
-            if not v and t["metadata"]["exclude_if_empty"]:
+            if not v and exclude_if_empty:
                 continue
             result[n] = v
         return result
 
     def as_json(self):
-        fields = self.schema.__dataclass_fields__.items()
         result = {}
-        for n, f in fields:
-            t = dataclass_get_type(f)
+        for n, exclude_if_empty in self.accessors.fields:
             v = self.get(n)
-            if v is None and t["metadata"]["exclude_if_empty"]:
+            if v is None and exclude_if_empty:
                 continue
             result[n] = v
-        cschema = dc2colanderjson.convert(self.schema, request=self.storage.request)
-        result = cschema().serialize(result)
+        cschema = schemaconv.convert(
+            dc2colanderjson, self.schema, request=self.storage.request
+        )
+        serialize = serializer.get_serialize(self.storage.app)
+        result = serialize(cschema, result, request=self.storage.request)
         return result
 
 
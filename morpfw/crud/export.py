@@ -0,0 +1,169 @@
+import csv
+import io
+import json
+import re
+from datetime import date
+
+from inverter import dc2jsl
+from inverter.common import dataclass_get_type
+
+from ..avro.jsl_to_avro import MAP, jsl_to_avro
+from . import schemaconv
+from .errors import UnprocessableError
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "avro": "avro/binary",
+}
+
+EXTENSIONS = {"csv": "csv", "ndjson": "ndjson", "avro": "avro"}
+
+# dates are serialized as days since epoch
+AVRO_DATE = {"type": "int", "logicalType": "date"}
+
+# number of records serialized between each chunk of output
+DEFAULT_CHUNK_SIZE = 500
+
+
+def export_fields(collection, fields=None):
+    """
+    Fields to be exported from ``collection``, all non-hidden fields
+    of the schema if ``fields`` is not specified
+    """
+    schema_fields = collection.schema.__dataclass_fields__
+    hidden = [n for n, f in schema_fields.items() if f.metadata.get("hidden", False)]
+    if fields is None:
+        return [n for n in schema_fields.keys() if n not in hidden]
+    for f in fields:
+        if f not in schema_fields or f in hidden:
+            raise UnprocessableError("Unknown field %s" % f)
+    return list(fields)
+
+
+def export_name(collection):
+    """Type name of ``collection``, or its schema name if it is not a
+    registered type"""
+    try:
+        return collection.name
+    except KeyError:
+        return collection.schema.__name__
+
+
+def avro_schema(collection, fields=None):
+    """Avro record schema of ``collection``, limited to ``fields``"""
+    fields = export_fields(collection, fields)
+    name = re.sub(r"[^A-Za-z0-9_]", "_", export_name(collection))
+    avsc = jsl_to_avro(
+        schemaconv.convert(dc2jsl, collection.schema), name=name, namespace="morpfw"
+    )
+    avsc["fields"] = [f for f in avsc["fields"] if f["name"] in fields]
+    # jsl does not tell dates apart from datetimes
+    schema_fields = collection.schema.__dataclass_fields__
+    for f in avsc["fields"]:
+        if dataclass_get_type(schema_fields[f["name"]])["type"] is not date:
+            continue
+        if isinstance(f["type"], list):
+            f["type"] = ["null", AVRO_DATE]
+        else:
+            f["type"] = AVRO_DATE
+    return avsc
+
+
+def iter_export(collection, objs, format="ndjson", fields=None, chunk_size=None):
+    """
+    Serialize ``objs`` of ``collection`` into ``format`` (``csv``,
+    ``ndjson`` or ``avro``), yielding chunks of bytes so that the result
+    can be written out (or streamed) while objects are still being read
+    from storage
+    """
+    if format not in CONTENT_TYPES:
+        raise UnprocessableError("Unknown export format %s" % format)
+    fields = export_fields(collection, fields)
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    records = (obj.fields_json(fields) for obj in objs)
+    if format == "csv":
+        return _iter_csv(records, fields, chunk_size)
+    if format == "avro":
+        return _iter_avro(records, avro_schema(collection, fields), chunk_size)
+    return _iter_ndjson(records, chunk_size)
+
+
+def _chunks(records, chunk_size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _iter_ndjson(records, chunk_size):
+    for chunk in _chunks(records, chunk_size):
+        yield "".join(json.dumps(r) + "\n" for r in chunk).encode("utf8")
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def _iter_csv(records, fields, chunk_size):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(fields)
+    for chunk in _chunks(records, chunk_size):
+        for r in chunk:
+            writer.writerow([_csv_value(r.get(f, None)) for f in fields])
+        yield buf.getvalue().encode("utf8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf8")
+
+
+def _map_fields(avsc):
+    result = []
+    for f in avsc["fields"]:
+        t = f["type"]
+        if t == MAP or (isinstance(t, list) and MAP in t):
+            result.append(f["name"])
+    return result
+
+
+def _iter_avro(records, avsc, chunk_size):
+    # imported here as fastavro is an optional dependency, and checked
+    # before streaming starts
+    try:
+        from fastavro import parse_schema
+        from fastavro.write import Writer
+    except ImportError:
+        raise UnprocessableError("Avro export requires fastavro to be installed")
+    return _write_avro(
+        records, Writer(io.BytesIO(), parse_schema(avsc)), _map_fields(avsc), chunk_size
+    )
+
+
+def _write_avro(records, writer, map_fields, chunk_size):
+    buf = writer.fo
+    for chunk in _chunks(records, chunk_size):
+        for r in chunk:
+            for f in map_fields:
+                if r.get(f, None):
+                    r[f] = {
+                        k: v if isinstance(v, str) else json.dumps(v)
+                        for k, v in r[f].items()
+                    }
+            writer.write(r)
+        writer.flush()
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    writer.flush()
+    if buf.tell():
+        yield buf.getvalue()
@@ -5,9 +5,11 @@ import logging
 import re
 import warnings
 from logging import warn
+from datetime import datetime
 from uuid import uuid4
 
 import morepath
+import pytz
 import rulez
 from DateTime import DateTime
 from inverter import dc2colanderjson, dc2jsl
@@ -17,14 +19,16 @@ from jsonschema.validators import Draft4Validator
 from morepath import reify
 from rulez import OperatorNotAllowedError
 from rulez import field as rfield
-from rulez import parse_dsl, validate_condition
+from rulez import parse_dsl
 from transitions import Machine
 
 from ..interfaces import ICollection, IModel, IStorage
 from ..memoizer import requestmemoize
 from ..request import Request
-from . import permission, signals
+from . import counting, permission, schemaconv, serializer, signals
+from .cascade import delete as cascade_delete
 from .const import SEPARATOR
+from .cursor import NEXT, PREVIOUS, decode_cursor, encode_cursor, reverse_order
 from .errors import (
     AlreadyExistsError,
     BlobStorageNotImplementedError,
@@ -34,7 +38,13 @@ from .errors import (
     ValidationError,
 )
 from .log import logger
-from .relationship import BackReferenceResolver, ReferenceResolver
+from .querycache import validate_condition
+from .relationship import (
+    BackReferenceResolver,
+    ReferenceResolver,
+    resolve_backreferences_bulk,
+    resolve_references_bulk,
+)
 
 ALLOWED_SEARCH_OPERATORS = [
     "and",
@@ -50,15 +60,28 @@ ALLOWED_SEARCH_OPERATORS = [
     "match",
 ]
 
+DEFAULT_ORDER_BY = ("created", "desc")
+
+DEFAULT_BATCH_SIZE = 500
+
 _marker = object()
 
 
+def _unique_msg(fields, values):
+    return " ".join(f"{c}=({v})" for c, v in zip(fields, values))
+
+
 class Collection(ICollection):
 
     create_view_enabled = True
     search_view_enabled = True
     search_allow_queryobject = True
     aggregate_view_enabled = True
+    export_view_enabled = True
+
+    #: counting strategy used by ``count()``, see ``morpfw.crud.counting``.
+    #: Defaults to ``morpfw.crud.count.strategy`` setting
+    count_strategy = None
 
     exist_exc = AlreadyExistsError
 
@@ -97,9 +120,33 @@ class Collection(ICollection):
             # FIXME: what is this for again? o_O
             self.data = request.app.get_dataprovider(self.schema, data, self.storage)
 
-    def search(self, query=None, offset=0, limit=None, order_by=None, secure=False):
-        objs = self._search(query, offset, limit, order_by, secure)
-        if secure and limit:
+    def search(
+        self,
+        query=None,
+        offset=0,
+        limit=None,
+        order_by=None,
+        secure=False,
+        cursor=None,
+        fields=None,
+        prefetch=None,
+    ):
+        if fields is not None:
+            fields = self.projection(fields, order_by)
+        if secure:
+            query, secure = self._secure_query(query)
+            if query is False:
+                return []
+        if secure:
+            # objects need to be fully loaded for permission checks
+            fields = None
+        if cursor:
+            objs = self._cursor_search(
+                query, cursor, limit, order_by, secure, fields=fields
+            )
+        else:
+            objs = self._search(query, offset, limit, order_by, secure, fields=fields)
+        if not cursor and secure and limit:
             nextpage = {
                 "query": query,
                 "offset": offset + limit,
@@ -109,20 +156,147 @@ class Collection(ICollection):
             while len(objs) < limit:
                 nextobjs = self._search(secure=True, **nextpage)
                 if len(nextobjs) == 0:
-                    return list(objs[:limit])
+                    objs = list(objs[:limit])
+                    break
                 nextpage["offset"] = nextpage["offset"] + limit
                 objs = objs + nextobjs
+        if prefetch:
+            self.prefetch(objs, prefetch)
+        return objs
+
+    def prefetch(self, objs, names):
+        """
+        Resolve references and backreferences ``names`` of ``objs`` with
+        one query per relationship, so that ``Model.resolve_reference`` and
+        ``Model.resolve_backreference`` do not query storage per object
+        """
+        refs = {r.name: r for r in getattr(self.schema, "__references__", [])}
+        brefs = {r.name: r for r in getattr(self.schema, "__backreferences__", [])}
+        for name in names:
+            if name in refs:
+                resolve_references_bulk(objs, refs[name])
+            elif name in brefs:
+                resolve_backreferences_bulk(objs, brefs[name])
+            else:
+                raise UnprocessableError("Unknown reference %s" % name)
+
+    def _cursor_search(
+        self, query, cursor, limit=None, order_by=None, secure=False, fields=None
+    ):
+        if order_by is None:
+            order_by = DEFAULT_ORDER_BY
+        order_by = tuple(order_by)
+        values, direction = decode_cursor(cursor, order_by)
+        seek_order_by = order_by
+        if direction == PREVIOUS:
+            seek_order_by = reverse_order(order_by)
+
+        objs = []
+        while True:
+            page = self._search(
+                query,
+                limit=limit,
+                order_by=seek_order_by,
+                cursor=values,
+                fields=fields,
+            )
+            if secure:
+                objs += self._filter_permitted(page)
+            else:
+                objs += page
+            if not secure or not limit or len(page) < limit or len(objs) >= limit:
+                break
+            values = self.cursor_values(page[-1], seek_order_by)
+
+        if limit:
+            objs = objs[:limit]
+        if direction == PREVIOUS:
+            objs.reverse()
         return objs
 
+    def projection(self, fields, order_by=None):
+        """
+        Fields to be loaded from storage for a search limited to ``fields``,
+        including the fields needed to identify and paginate the results
+        """
+        if order_by is None:
+            order_by = DEFAULT_ORDER_BY
+        schema_fields = self.schema.__dataclass_fields__
+        for f in fields:
+            if f not in schema_fields:
+                raise UnprocessableError("Unknown field %s" % f)
+        required = [
+            self.app.get_identifierfield(self.schema),
+            self.app.get_uuidfield(self.schema),
+            self.storage.cursor_field,
+            order_by[0],
+        ]
+        result = list(fields)
+        for f in required:
+            if f in schema_fields and f not in result:
+                result.append(f)
+        return result
+
+    def cursor_values(self, obj, order_by=None):
+        """Keyset values of ``obj`` for the given ordering"""
+        if order_by is None:
+            order_by = DEFAULT_ORDER_BY
+        cursor_field = self.storage.cursor_field
+        return [obj.data.get(order_by[0]), obj.data.get(cursor_field)]
+
+    def cursor(self, obj, order_by=None, direction=NEXT):
+        """
+        Returns opaque cursor token for the page after (or before, if
+        ``direction`` is ``'previous'``) ``obj``
+        """
+        if order_by is None:
+            order_by = DEFAULT_ORDER_BY
+        return encode_cursor(self.cursor_values(obj, order_by), order_by, direction)
+
     @requestmemoize()
     def all(self):
         return self.search()
 
+    def count(self, query=None, secure=False, strategy=None):
+        """
+        Number of objects matching ``query``, as a ``Count``. ``strategy``
+        is one of ``'exact'``, ``'estimate'`` or ``'cached'``, and defaults
+        to ``count_strategy``
+        """
+        if query is None and not secure and strategy is None:
+            return self._count_all()
+        return self._count(query, secure=secure, strategy=strategy)
+
     @requestmemoize()
-    def count(self):
-        return self.aggregate(group={"count": {"function": "count", "field": "uuid"}})[
-            0
-        ]["count"]
+    def _count_all(self):
+        return self._count()
+
+    def get_count_strategy(self):
+        if self.count_strategy:
+            return self.count_strategy
+        return self.app.get_config("morpfw.crud.count.strategy", counting.EXACT)
+
+    def _count(self, query=None, secure=False, strategy=None):
+        strategy = strategy or self.get_count_strategy()
+        if strategy not in counting.STRATEGIES:
+            raise ValueError("Unknown count strategy %s" % strategy)
+        if secure:
+            query = self._secure_query(query)[0]
+            if query is False:
+                return counting.Count(0)
+        if query:
+            validate_condition(query, ALLOWED_SEARCH_OPERATORS)
+        if strategy == counting.ESTIMATE:
+            return self.storage.estimate_count(self, query)
+        if strategy == counting.CACHED:
+            key = counting.count_cache.key(self, query)
+            result = counting.count_cache.get(key)
+            if result is None:
+                result = self.storage.count(self, query)
+                ttl = self.app.get_config("morpfw.crud.count.cache_ttl", 300)
+                counting.count_cache.set(key, result, ttl)
+            return result
+        return self.storage.count(self, query)
 
     @requestmemoize()
     def max_id(self):
@@ -136,28 +310,143 @@ class Collection(ICollection):
             "min_id"
         ]
 
-    def _search(self, query=None, offset=0, limit=None, order_by=None, secure=False):
+    def _search(
+        self,
+        query=None,
+        offset=0,
+        limit=None,
+        order_by=None,
+        secure=False,
+        cursor=None,
+        fields=None,
+    ):
         if query:
             validate_condition(query, ALLOWED_SEARCH_OPERATORS)
 
         if order_by is None:
-            order_by = ("created", "desc")
+            order_by = DEFAULT_ORDER_BY
+
+        kwargs = {}
+        if cursor is not None:
+            kwargs["cursor"] = cursor
+        if fields is not None:
+            kwargs["fields"] = fields
 
         objs = self.storage.search(
-            self, query, offset=offset, limit=limit, order_by=order_by
+            self, query, offset=offset, limit=limit, order_by=order_by, **kwargs
         )
 
         if secure:
-            objs = list(
-                [
-                    obj
-                    for obj in objs
-                    if self.request.app.permits(self.request, obj, permission.View)
-                ]
-            )
+            objs = self._filter_permitted(objs)
         return list(objs)
 
-    def aggregate(self, query=None, group=None, order_by=None, limit=None):
+    def iter_search(
+        self,
+        query=None,
+        order_by=None,
+        secure=False,
+        fields=None,
+        batch_size=DEFAULT_BATCH_SIZE,
+        detached=False,
+        prefetch=None,
+    ):
+        """
+        Iterate over objects matching ``query`` without loading the whole
+        result set into memory. Results are fetched from storage in batches
+        of ``batch_size``, and ``prefetch`` relationships are resolved per
+        batch.
+
+        If ``detached`` is ``True``, the storage may read through its own
+        connection, so that iteration can continue after the request
+        transaction has been committed (eg: in a streamed response)
+        """
+        if query:
+            validate_condition(query, ALLOWED_SEARCH_OPERATORS)
+        if order_by is None:
+            order_by = DEFAULT_ORDER_BY
+        if fields is not None:
+            fields = self.projection(fields, order_by)
+        if secure:
+            query, secure = self._secure_query(query)
+            if query is False:
+                return iter([])
+        if secure:
+            fields = None
+
+        kwargs = {}
+        if fields is not None:
+            kwargs["fields"] = fields
+        objs = self.storage.iter_search(
+            self,
+            query,
+            order_by=order_by,
+            batch_size=batch_size,
+            detached=detached,
+            **kwargs
+        )
+        if secure:
+            objs = self._iter_permitted(objs)
+        if prefetch:
+            objs = self._iter_prefetched(objs, prefetch, batch_size)
+        return objs
+
+    def _iter_permitted(self, objs):
+        for obj in objs:
+            if self.request.app.permits(self.request, obj, permission.View):
+                yield obj
+
+    def _iter_prefetched(self, objs, prefetch, batch_size):
+        batch = []
+        for obj in objs:
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                self.prefetch(batch, prefetch)
+                yield from batch
+                batch = []
+        if batch:
+            self.prefetch(batch, prefetch)
+            yield from batch
+
+    def permission_filter(self, perm=permission.View):
+        """
+        Rulez query selecting objects on which current identity has
+        ``perm``, see ``App.get_permission_filter``
+        """
+        return self.app.get_permission_filter(self.request, self, perm)
+
+    def _secure_query(self, query):
+        # returns (query, secure), where secure indicates whether results
+        # still need to be checked one by one. query is False if nothing
+        # is permitted
+        filt = self.permission_filter()
+        if filt is None:
+            return query, True
+        if filt is False:
+            return False, False
+        if filt is True:
+            return query, False
+        if query:
+            return rulez.and_(query, filt), False
+        return filt, False
+
+    def _filter_permitted(self, objs):
+        return list(
+            [
+                obj
+                for obj in objs
+                if self.request.app.permits(self.request, obj, permission.View)
+            ]
+        )
+
+    def aggregate(
+        self, query=None, group=None, order_by=None, limit=None, secure=False
+    ):
+        if secure:
+            # objects that can only be checked one by one are not
+            # excluded from aggregates
+            query = self._secure_query(query)[0]
+            if query is False:
+                return []
         if query:
             validate_condition(query, ALLOWED_SEARCH_OPERATORS)
         prov = self.aggregateprovider()
@@ -175,6 +464,246 @@ class Collection(ICollection):
         return None
 
     def create(self, data, deserialize=True, secure=False):
+        data = self._prepare_create(data, deserialize=deserialize, secure=secure)
+        identifier = self.app.get_default_identifier(self.schema, data, self.request)
+        idfield = self.app.get_identifierfield(self.schema)
+        if identifier and not self.storage.enforces_unique([idfield]):
+            if self.get(identifier):
+                raise self.exist_exc(identifier)
+        data = self.set_create_defaults(data)
+        unique_constraint = getattr(self.schema, "__unique_constraint__", None)
+        if unique_constraint and not self.storage.enforces_unique(unique_constraint):
+            unique_search = []
+            msg = []
+            for c in unique_constraint:
+                unique_search.append(rulez.field[c] == data[c])
+                msg.append(f"{c}=({data[c]})")
+            if self.search(rulez.and_(*unique_search)):
+                raise self.exist_exc(" ".join(msg))
+
+        self.update_computed_fields(data)
+        obj = self._create(data)
+        obj.set_initial_state()
+        dispatch = self.request.app.dispatcher(signals.OBJECT_CREATED)
+        dispatch.dispatch(self.request, obj)
+        obj.after_created()
+        obj.save()
+        return obj
+
+    def create_many(
+        self, items, batch_size=DEFAULT_BATCH_SIZE, deserialize=True, secure=False
+    ):
+        """
+        Create objects from an iterable of data in batches of ``batch_size``.
+
+        Each batch is validated up front, checked for existing identifiers
+        and unique constraint violations with a single query, and inserted
+        through ``storage.create_many``. ``OBJECT_CREATED`` is dispatched for
+        each object, followed by ``OBJECTS_CREATED`` for the whole batch.
+        """
+        result = []
+        batch = []
+        for data in items:
+            batch.append(data)
+            if len(batch) >= batch_size:
+                result += self._create_batch(batch, deserialize, secure)
+                batch = []
+        if batch:
+            result += self._create_batch(batch, deserialize, secure)
+        return result
+
+    def _create_batch(self, batch, deserialize=True, secure=False):
+        datas = []
+        identifiers = []
+        for data in batch:
+            data = self._prepare_create(data, deserialize=deserialize, secure=secure)
+            identifiers.append(
+                self.app.get_default_identifier(self.schema, data, self.request)
+            )
+            data = self.set_create_defaults(data)
+            self.update_computed_fields(data)
+            datas.append(data)
+
+        self._check_batch_exists(datas, identifiers)
+        self._set_batch_metadata(datas)
+
+        objs = self.storage.create_many(self, datas)
+        dispatch = self.request.app.dispatcher(signals.OBJECT_CREATED)
+        for obj in objs:
+            obj.set_initial_state()
+            dispatch.dispatch(self.request, obj)
+        self.request.app.dispatcher(signals.OBJECTS_CREATED).dispatch(
+            self.request, signals.ObjectBatch(self, objs)
+        )
+        for obj in objs:
+            obj.after_created()
+            obj.save()
+        return objs
+
+    def upsert(self, data, conflict_fields=None, deserialize=True, secure=False):
+        """
+        Create an object from ``data``, or update the object having the same
+        values on ``conflict_fields`` (defaults to ``__unique_constraint__``)
+        with the values given in ``data``, in a single statement where the
+        storage enforces uniqueness of ``conflict_fields`` (``INSERT .. ON
+        CONFLICT DO UPDATE`` on SQL, update with upsert of the identifier on
+        Elasticsearch).
+
+        Created objects go through the same hooks and signals as ``create``.
+        Updated objects are not loaded beforehand, hence per object update
+        hooks are not triggered, ``OBJECTS_UPDATED`` is dispatched with the
+        identifier and the written values instead. Returns the object.
+        """
+        if conflict_fields is None:
+            conflict_fields = getattr(self.schema, "__unique_constraint__", None)
+        conflict_fields = [f for f in conflict_fields or [] if f != "deleted"]
+        if not conflict_fields:
+            raise UnprocessableError("Upsert requires conflict fields")
+        keys = list(data.keys())
+        data = self._prepare_create(data, deserialize=deserialize, secure=secure)
+        data = self.set_create_defaults(data)
+        self.update_computed_fields(data)
+        protected = self.schema.__protected_fields__
+        values = {
+            k: data[k]
+            for k in keys
+            if k in data and k not in protected and k not in conflict_fields
+        }
+        if "modified" in data:
+            values["modified"] = data["modified"]
+
+        obj, created = self.storage.upsert(self, data, conflict_fields, values)
+        if not created:
+            dispatch = self.request.app.dispatcher(signals.OBJECTS_UPDATED)
+            batch = signals.IdentifierBatch(self, [obj.identifier], values)
+            dispatch.dispatch(self.request, batch)
+            return obj
+        obj.set_initial_state()
+        dispatch = self.request.app.dispatcher(signals.OBJECT_CREATED)
+        dispatch.dispatch(self.request, obj)
+        obj.after_created()
+        obj.save()
+        return obj
+
+    def _check_batch_exists(self, datas, identifiers):
+        identifiers = [i for i in identifiers if i]
+        idfield = self.app.get_identifierfield(self.schema)
+        seen = set()
+        for identifier in identifiers:
+            if identifier in seen:
+                raise self.exist_exc(identifier)
+            seen.add(identifier)
+        if identifiers and not self.storage.enforces_unique([idfield]):
+            existing = self.search(rulez.field[idfield].in_(identifiers), limit=1)
+            if existing:
+                raise self.exist_exc(existing[0].identifier)
+
+        unique_constraint = getattr(self.schema, "__unique_constraint__", None)
+        if not unique_constraint:
+            return
+
+        keys = [tuple(data[c] for c in unique_constraint) for data in datas]
+        seen = set()
+        for key in keys:
+            if key in seen:
+                raise self.exist_exc(_unique_msg(unique_constraint, key))
+            seen.add(key)
+
+        if self.storage.enforces_unique(unique_constraint):
+            return
+        if len(unique_constraint) == 1:
+            query = rulez.field[unique_constraint[0]].in_([k[0] for k in keys])
+        else:
+            query = rulez.or_(
+                *[
+                    rulez.and_(
+                        *[rulez.field[c] == v for c, v in zip(unique_constraint, key)]
+                    )
+                    for key in keys
+                ]
+            )
+        existing = self.search(query, limit=1)
+        if existing:
+            key = tuple(existing[0][c] for c in unique_constraint)
+            raise self.exist_exc(_unique_msg(unique_constraint, key))
+
+    def _set_batch_metadata(self, datas):
+        # fill in the values that OBJECT_CREATED subscribers would otherwise
+        # set after insert, so that the batch does not get updated row by row
+        # right after it is inserted
+        fields = self.schema.__dataclass_fields__.keys()
+        userid = self.request.identity.userid or None
+        for data in datas:
+            if "creator" in fields and data.get("creator", None) is None:
+                data["creator"] = userid
+            obj = self.storage.model(self.request, self, data)
+            if self.app.get_statemachine.by_args(obj).all_matches:
+                self.app.get_statemachine(obj)
+
+    def _where_query(self, query, match_all):
+        if not query:
+            if not match_all:
+                raise UnprocessableError("A query is required, unless match_all is set")
+            return None
+        validate_condition(query, ALLOWED_SEARCH_OPERATORS)
+        return query
+
+    def update_where(self, query, values, deserialize=True, match_all=False):
+        """
+        Update ``values`` on all objects matching rulez ``query`` using a
+        single set-based update on the storage. ``modified`` is maintained.
+        Updating all objects, without ``query``, requires ``match_all``.
+
+        Objects are not loaded, hence per object hooks, ``OBJECT_UPDATED``
+        and computed fields are not triggered. ``OBJECTS_UPDATED`` is
+        dispatched with the affected identifiers instead.
+        """
+        query = self._where_query(query, match_all)
+        fields = self.schema.__dataclass_fields__
+        for k in values.keys():
+            if k not in fields:
+                raise UnprocessableError("Unknown field %s" % k)
+            if k == "state":
+                raise StateUpdateProhibitedError()
+        unique_constraint = getattr(self.schema, "__unique_constraint__", None) or []
+        for c in unique_constraint:
+            if c in values.keys():
+                raise UnprocessableError("%s is not allowed to be updated in bulk" % c)
+        data = self.schema.validate(
+            self.request,
+            values,
+            deserialize=deserialize,
+            update_mode=True,
+            context=self,
+        )
+        data = {k: v for k, v in data.items() if k in values.keys()}
+        if "modified" in fields:
+            data["modified"] = datetime.now(tz=pytz.UTC)
+        identifiers = self.storage.update_where(self, query, data)
+        dispatch = self.request.app.dispatcher(signals.OBJECTS_UPDATED)
+        batch = signals.IdentifierBatch(self, identifiers, data)
+        dispatch.dispatch(self.request, batch)
+        return identifiers
+
+    def delete_where(self, query, permanent=False, match_all=False):
+        """
+        Delete all objects matching rulez ``query`` using a single
+        set-based statement on the storage. Storages that support soft
+        delete set the ``deleted`` timestamp unless ``permanent`` is set.
+        Deleting all objects, without ``query``, requires ``match_all``.
+
+        References, blobs and ``OBJECT_TOBEDELETED`` subscribers are not
+        processed. ``OBJECTS_DELETED`` is dispatched with the affected
+        identifiers instead.
+        """
+        query = self._where_query(query, match_all)
+        identifiers = self.storage.delete_where(self, query, permanent=permanent)
+        batch = signals.IdentifierBatch(self, identifiers)
+        dispatch = self.request.app.dispatcher(signals.OBJECTS_DELETED)
+        dispatch.dispatch(self.request, batch)
+        return identifiers
+
+    def _prepare_create(self, data, deserialize=True, secure=False):
         if secure:
             if "state" in data:
                 raise StateUpdateProhibitedError()
@@ -192,9 +721,9 @@ class Collection(ICollection):
             self.request, data, deserialize=deserialize, context=self
         )
         self.before_create(data)
-        identifier = self.app.get_default_identifier(self.schema, data, self.request)
-        if identifier and self.get(identifier):
-            raise self.exist_exc(identifier)
+        return data
+
+    def set_create_defaults(self, data):
         data = self.storage.set_schema_defaults(data)
         for fname, field in self.schema.__dataclass_fields__.items():
             if data[fname] is not None:
@@ -209,24 +738,7 @@ class Collection(ICollection):
             default_factory = field.metadata.get("default_factory", None)
             if default_factory:
                 data[fname] = default_factory(self, self.request)
-        unique_constraint = getattr(self.schema, "__unique_constraint__", None)
-        if unique_constraint:
-            unique_search = []
-            msg = []
-            for c in unique_constraint:
-                unique_search.append(rulez.field[c] == data[c])
-                msg.append(f"{c}=({data[c]})")
-            if self.search(rulez.and_(*unique_search)):
-                raise self.exist_exc(" ".join(msg))
-
-        self.update_computed_fields(data)
-        obj = self._create(data)
-        obj.set_initial_state()
-        dispatch = self.request.app.dispatcher(signals.OBJECT_CREATED)
-        dispatch.dispatch(self.request, obj)
-        obj.after_created()
-        obj.save()
-        return obj
+        return data
 
     def update_computed_fields(self, data):
         for fn, field in self.schema.__dataclass_fields__.items():
@@ -249,7 +761,7 @@ class Collection(ICollection):
 
     def json(self):
         return {
-            "schema": dc2jsl.convert(self.schema).get_schema(ordered=True),
+            "schema": schemaconv.convert(dc2jsl, self.schema).get_schema(ordered=True),
             "links": self.links(),
         }
 
@@ -361,6 +873,8 @@ class Model(IModel):
         self.app = request.app
         self.data = request.app.get_dataprovider(self.schema, data, self.storage)
         self._cached_identifier = None
+        # relationships resolved through Collection.prefetch
+        self._prefetched = {}
         super().__init__(request, collection, data)
 
     def is_editable(self):
@@ -389,6 +903,11 @@ class Model(IModel):
                     "Record is not allowed to be updated in state %s" % sm.state
                 )
 
+        # update from the data as it is on the primary database, not as read
+        # from a (possibly lagging) read replica
+        load_primary = getattr(self.data, "load_primary", None)
+        if load_primary is not None:
+            load_primary()
         if deserialize:
             data = self.data.as_json()
         else:
@@ -400,7 +919,7 @@ class Model(IModel):
             self.request, data, deserialize=deserialize, update_mode=True, context=self
         )
         unique_constraint = getattr(self.schema, "__unique_constraint__", None)
-        if unique_constraint:
+        if unique_constraint and not self.storage.enforces_unique(unique_constraint):
             unique_search = []
             msg = []
             for c in unique_constraint:
@@ -412,10 +931,13 @@ class Model(IModel):
                     raise self.collection.exist_exc(" ".join(msg))
 
         if deserialize:
-            cschema = dc2colanderjson.convert(self.schema, request=self.request)
-            cs = cschema()
-            cs = cs.bind(context=self, request=self.request)
+            cschema = schemaconv.convert(
+                dc2colanderjson, self.schema, request=self.request
+            )
+            cs = schemaconv.bind(cschema, context=self, request=self.request)
             data = cs.deserialize(data)
+        dispatch = self.request.app.dispatcher(signals.OBJECT_TOBEUPDATED)
+        dispatch.dispatch(self.request, self)
         self.storage.update(self.collection, self.identifier, data)
         dispatch = self.request.app.dispatcher(signals.OBJECT_UPDATED)
         dispatch.dispatch(self.request, self)
@@ -427,18 +949,9 @@ class Model(IModel):
             if compute:
                 data[fn] = compute(self.request, data, self)
 
-    def delete(self, *, cascade=True, **kwargs):
-        dispatch = self.request.app.dispatcher(signals.OBJECT_TOBEDELETED)
-        dispatch.dispatch(self.request, self)
-
-        if cascade:
-            for bref in self.backreferences().values():
-                for refitem in self.resolve_backreference(bref):
-                    refitem.delete(cascade=cascade)
-
-        if not self.before_delete():
-            return
-        blob_uuids = []
+    def blob_uuids(self):
+        """uuids of blobs stored on ``blob_fields`` of this object"""
+        result = []
         for blobfield in self.blob_fields:
             if self.blobstorage_field not in self.data.keys():
                 uuid = None
@@ -449,7 +962,19 @@ class Model(IModel):
             else:
                 uuid = self.data[self.blobstorage_field][blobfield]
             if uuid:
-                blob_uuids.append(uuid)
+                result.append(uuid)
+        return result
+
+    def delete(self, *, cascade=True, **kwargs):
+        dispatch = self.request.app.dispatcher(signals.OBJECT_TOBEDELETED)
+        dispatch.dispatch(self.request, self)
+
+        if cascade:
+            cascade_delete(self, permanent=kwargs.get("permanent", False))
+
+        if not self.before_delete():
+            return
+        blob_uuids = self.blob_uuids()
         self.storage.delete(self.identifier, model=self, **kwargs)
         for blob_uuid in blob_uuids:
             self.storage.delete_blob(blob_uuid)
@@ -469,17 +994,35 @@ class Model(IModel):
             from .schema import Schema
 
             exclude_fields += list(Schema.__dataclass_fields__.keys())
-        cschema = dc2colanderjson.convert(
-            self.schema, exclude_fields=exclude_fields, request=self.request
+        cschema = schemaconv.convert(
+            dc2colanderjson,
+            self.schema,
+            exclude_fields=exclude_fields,
+            request=self.request,
+        )
+        serialize = serializer.get_serialize(self.app)
+        return serialize(
+            cschema, self.data.as_dict(), context=self, request=self.request
         )
-        cs = cschema()
-        cs = cs.bind(context=self, request=self.request)
-        return cs.serialize(self.data.as_dict())
 
     @requestmemoize()
     def base_json(self):
         return self._base_json()
 
+    def fields_json(self, fields):
+        """JSON-safe dictionary of ``fields``, serializing only those fields"""
+        fields = [f for f in fields if f not in self.hidden_fields]
+        cschema = schemaconv.convert(
+            dc2colanderjson, self.schema, include_fields=fields, request=self.request
+        )
+        serialize = serializer.get_serialize(self.app)
+        return serialize(
+            cschema,
+            {f: self.data.get(f) for f in fields},
+            context=self,
+            request=self.request,
+        )
+
     @requestmemoize()
     def data_json(self):
         return self._base_json(exclude_metadata=True)
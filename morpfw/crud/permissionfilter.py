@@ -0,0 +1,79 @@
+import dectate
+import morepath
+import reg
+
+
+class PermissionFilterAction(dectate.Action):
+
+    app_class_arg = True
+
+    def __init__(self, model, permission, identity=morepath.Identity):
+        """Declare a rulez filter that selects objects of ``model`` on which
+        identity has ``permission``.
+
+        The decorated function receives ``identity``, ``collection`` and
+        ``permission`` parameters and should return a rulez query, ``True``
+        if all objects are permitted, ``False`` if none is, or ``None`` if
+        the permission can not be expressed as a query.
+
+        The filter is only used when the permission rule that applies to
+        the objects of the collection is the one registered for ``model``,
+        so that a more specific permission rule is never bypassed.
+        """
+        self.model = model
+        self.permission = permission
+        self.identity = identity
+
+    def identifier(self, app_class):
+        return (self.model, self.permission, self.identity)
+
+    def perform(self, obj, app_class):
+        model = self.model
+
+        def factory(identity, model_class, permission):
+            return model, obj
+
+        app_class._get_permission_filter.register(
+            reg.methodify(factory),
+            identity=self.identity,
+            model_class=self.model,
+            permission=self.permission,
+        )
+
+
+class PermissionFilterApp(dectate.App):
+
+    permission_filter = dectate.directive(PermissionFilterAction)
+
+    @reg.dispatch_method(
+        reg.match_instance("identity"),
+        reg.match_class("model_class"),
+        reg.match_class("permission"),
+    )
+    def _get_permission_filter(self, identity, model_class, permission):
+        return None, None
+
+    def get_permission_filter(self, request, collection, permission):
+        """
+        Returns rulez query selecting objects of ``collection`` on which
+        current identity has ``permission``, ``True`` if all objects are
+        permitted, ``False`` if none is, or ``None`` if objects need to be
+        checked individually
+        """
+        identity = request.identity
+        model_class = collection.storage.model
+        registered, func = self._get_permission_filter(
+            identity, model_class, permission
+        )
+        if func is None:
+            return None
+        identity_class = identity.__class__
+        rule = self._permits.by_predicates(
+            identity=identity_class, obj=model_class, permission=permission
+        ).component
+        registered_rule = self._permits.by_predicates(
+            identity=identity_class, obj=registered, permission=permission
+        ).component
+        if rule is not registered_rule:
+            return None
+        return func(identity, collection, permission)
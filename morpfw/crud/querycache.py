@@ -0,0 +1,195 @@
+import copy
+import re
+import threading
+from collections import OrderedDict
+
+import rulez
+from dateutil.parser import parse as parse_dt
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.elements import BindParameter
+
+DEFAULT_CACHE_SIZE = 1024
+
+# literal values are lifted out of queries and replaced with placeholders,
+# so that queries of the same shape share one compiled condition
+PLACEHOLDER = "\x00rulez:%d\x00"
+PLACEHOLDER_PATTERN = re.compile("\x00rulez:(\\d+)\x00")
+LIFTED_TYPES = (str, int, float, list, tuple)
+
+
+class LRUCache(object):
+    """Thread-safe cache that holds up to ``maxsize`` most recently used
+    entries"""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+dsl_cache = LRUCache()
+condition_cache = LRUCache()
+
+_MISSING = object()
+
+
+def freeze(value):
+    """Hashable key of a rulez query. Values are tagged with their type so
+    that eg: ``1`` and ``True`` do not share a key"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(freeze(v) for v in value))
+    try:
+        hash(value)
+    except TypeError:
+        return (type(value), repr(value))
+    return (type(value), value)
+
+
+def signature(query):
+    """Structure of a rulez query, with literal values replaced by their
+    type"""
+    if isinstance(query, dict):
+        if query.get("value_type", None) is not None:
+            return freeze(query)
+        return tuple(
+            sorted((k, signature(v) if k == "value" else v) for k, v in query.items())
+        )
+    if isinstance(query, (list, tuple)):
+        return (type(query), tuple(signature(v) for v in query))
+    return type(query)
+
+
+def validate_condition(query, allowed_operators=None):
+    """Cached ``rulez.validate_condition``. Validation only depends on
+    operators and value types, hence it is done once per query signature"""
+    if allowed_operators is not None:
+        allowed_operators = tuple(allowed_operators)
+    key = ("validate", signature(query), allowed_operators)
+    if condition_cache.get(key) is None:
+        rulez.validate_condition(query, allowed_operators)
+        condition_cache.set(key, True)
+
+
+def parse_dsl(qs):
+    """Cached ``rulez.parse_dsl``"""
+    result = dsl_cache.get(qs)
+    if result is None:
+        result = rulez.parse_dsl(qs)
+        dsl_cache.set(qs, result)
+    return copy.deepcopy(result)
+
+
+def compile_condition(method, query):
+    """Cached ``rulez.compile_condition``, keyed on the whole query"""
+    key = (method, freeze(query))
+    result = condition_cache.get(key)
+    if result is None:
+        result = rulez.compile_condition(method, query)
+        condition_cache.set(key, result)
+    return result
+
+
+def lift(query, values):
+    """Returns shape of ``query``, with literal values replaced by
+    placeholders. Lifted values are appended to ``values``"""
+    operator = query["operator"]
+    if operator in ["and", "or"]:
+        return dict(query, value=[lift(q, values) for q in query["value"]])
+    value = query.get("value", None)
+    if query.get("field", None) is None or not isinstance(value, LIFTED_TYPES):
+        return query
+    if isinstance(value, (list, tuple)):
+        if any(isinstance(v, dict) for v in value):
+            return query
+    value_type = query.get("value_type", None)
+    if value_type == "date":
+        value = parse_dt(value).date()
+    elif value_type == "datetime":
+        value = parse_dt(value)
+    shape = {k: v for k, v in query.items() if k != "value_type"}
+    placeholder = PLACEHOLDER % len(values)
+    if isinstance(value, (list, tuple)):
+        shape["value"] = [placeholder]
+    else:
+        shape["value"] = placeholder
+    values.append(value)
+    return shape
+
+
+def _bind_map(expr, count):
+    # maps index of lifted value -> (bind parameter key, template), or
+    # None if lifted values can not be traced to bind parameters
+    found = {}
+    for node in visitors.iterate(expr):
+        if not isinstance(node, BindParameter):
+            continue
+        value = node.value
+        if isinstance(value, list) and len(value) == 1:
+            value = value[0]
+        if not isinstance(value, str):
+            continue
+        match = PLACEHOLDER_PATTERN.search(value)
+        if match is None:
+            continue
+        idx = int(match.group(1))
+        if idx in found:
+            return None
+        template = None if value == match.group(0) else value
+        found[idx] = (node.key, template)
+    if len(found) != count:
+        return None
+    return found
+
+
+def sql_condition(query, model):
+    """
+    SQLAlchemy condition of rulez ``query`` against ``model``. Conditions
+    are compiled once per query shape, literal values are then bound to
+    the bind parameters of the cached condition
+    """
+    values = []
+    shape = lift(query, values)
+    key = ("sqlalchemy", model, freeze(shape))
+    entry = condition_cache.get(key, _MISSING)
+    if entry is _MISSING:
+        expr = rulez.compile_condition("sqlalchemy", shape)(model)
+        binds = _bind_map(expr, len(values))
+        entry = (expr, binds) if binds is not None else None
+        condition_cache.set(key, entry)
+    if entry is None:
+        return rulez.compile_condition("sqlalchemy", query)(model)
+    expr, binds = entry
+    if not binds:
+        return expr
+    params = {}
+    for idx, (bindkey, template) in binds.items():
+        value = values[idx]
+        if template is not None:
+            value = template.replace(PLACEHOLDER % idx, str(value))
+        params[bindkey] = value
+    return expr.params(params)
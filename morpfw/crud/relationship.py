@@ -1,5 +1,8 @@
 import rulez
 
+#: number of referenced values fetched per query when prefetching
+PREFETCH_BATCH_SIZE = 500
+
 
 class Reference(object):
     def __init__(
@@ -34,6 +37,11 @@ class ReferenceResolver(object):
 
     def resolve(self):
         value = self.context[self.ref.name]
+        prefetched = getattr(self.context, "_prefetched", {}).get(
+            ("reference", self.ref.name)
+        )
+        if prefetched is not None and prefetched[0] == value:
+            return prefetched[1]
         collection = self.ref.collection(self.request)
         items = collection.search(rulez.field(self.ref.attribute) == value)
         if items:
@@ -93,7 +101,82 @@ class BackReferenceResolver(object):
             raise ValueError("Invalid reference name. %s" % self.bref.reference_name)
 
         value = context[reference.attribute]
+        prefetched = getattr(context, "_prefetched", {}).get(
+            ("backreference", self.bref.name)
+        )
+        if prefetched is not None and prefetched[0] == value:
+            return prefetched[1]
         collection = self.bref.collection(request)
         items = collection.search(rulez.field(reference.name) == value)
         return items
 
+
+def _unique_values(objects, name):
+    result = []
+    seen = set()
+    for obj in objects:
+        value = obj[name]
+        if value is None or value in seen:
+            continue
+        seen.add(value)
+        result.append(value)
+    return result
+
+
+def _fetch(collection, field, values):
+    # one ``in`` query per batch of values
+    for i in range(0, len(values), PREFETCH_BATCH_SIZE):
+        batch = values[i : i + PREFETCH_BATCH_SIZE]
+        for item in collection.search(rulez.field(field).in_(batch)):
+            yield item
+
+
+def resolve_references_bulk(objects, reference: Reference):
+    """
+    Resolve ``reference`` of all ``objects`` with one query per batch of
+    referenced values, instead of one query per object. Results are
+    attached to the objects, so that ``Model.resolve_reference`` does not
+    query the storage again while the reference value is unchanged.
+
+    Returns ``{referenced value: referenced object}``
+    """
+    if not objects:
+        return {}
+    values = _unique_values(objects, reference.name)
+    collection = reference.collection(objects[0].request)
+    result = {}
+    for item in _fetch(collection, reference.attribute, values):
+        result.setdefault(item[reference.attribute], item)
+    for obj in objects:
+        value = obj[reference.name]
+        if value is not None:
+            key = ("reference", reference.name)
+            obj._prefetched[key] = (value, result.get(value, None))
+    return result
+
+
+def resolve_backreferences_bulk(objects, backreference: BackReference):
+    """
+    Resolve ``backreference`` of all ``objects`` with one query per batch
+    of referenced values. Results are attached to the objects, so that
+    ``Model.resolve_backreference`` does not query the storage again.
+
+    Returns ``{referenced value: [referencing objects]}``
+    """
+    if not objects:
+        return {}
+    request = objects[0].request
+    reference = backreference.get_reference(request)
+    if reference is None:
+        raise ValueError("Invalid reference name. %s" % backreference.reference_name)
+    values = _unique_values(objects, reference.attribute)
+    collection = backreference.collection(request)
+    result = {value: [] for value in values}
+    for item in _fetch(collection, reference.name, values):
+        result.setdefault(item[reference.name], []).append(item)
+    for obj in objects:
+        value = obj[reference.attribute]
+        if value is not None:
+            key = ("backreference", backreference.name)
+            obj._prefetched[key] = (value, result[value])
+    return result
@@ -0,0 +1,440 @@
+import copy
+import hashlib
+import json
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytz
+import sqlalchemy as sa
+import sqlalchemy_jsonfield as sajson
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.declarative import declarative_base
+
+from ..request import REPLICA_READS_KEY, request_factory
+from ..signal.app import SignalApp
+from . import model, signals
+from .app import App
+from .storage.sqlstorage import BaseMixin, SQLStorage
+
+#: functions that bucket a field value into a group
+DIMENSIONS = ["year", "month", "day", "date", "hourly"]
+#: functions that are maintained incrementally within a group
+METRICS = ["count", "sum", "avg", "min", "max"]
+
+#: metadata of the rollup tables, separate from ``morpfw.sql.Base.metadata``:
+#: applications that declare rollups create these tables themselves, eg: by
+#: adding it to the ``target_metadata`` of their migrations
+metadata = sa.MetaData()
+
+RollupBase = declarative_base(cls=BaseMixin, metadata=metadata)
+
+
+class RollupState(RollupBase):
+
+    __tablename__ = "morpfw_rollup"
+    __indexes__: list = []
+
+    name = sa.Column(sa.String(length=1024), unique=True, nullable=False)
+    stale = sa.Column(sa.Boolean, default=True)
+    reconciled = sa.Column(sa.DateTime(timezone=True))
+
+
+class RollupBucket(RollupBase):
+
+    __tablename__ = "morpfw_rollup_bucket"
+    __table_args__ = (sa.UniqueConstraint("rollup", "key"),)
+    __indexes__: list = []
+
+    rollup = sa.Column(sa.String(length=1024), nullable=False, index=True)
+    key = sa.Column(sa.String(length=64), nullable=False)
+    data = sa.Column(sajson.JSONField)
+
+
+def _utc(value):
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(pytz.UTC)
+    return value
+
+
+def _jsonable(value):
+    value = _utc(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return value.hex
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _bucket_value(function, value):
+    # same values as the date_part and to_char of SQLStorage.aggregate,
+    # date_part returns double precision
+    value = _utc(value)
+    if value is None or function is None:
+        return _jsonable(value)
+    if function == "year":
+        return float(value.year)
+    if function == "month":
+        return float(value.month)
+    if function == "day":
+        return float(value.day)
+    if function == "date":
+        return value.strftime("%Y-%m-%d")
+    return value.strftime("%Y-%m-%d %H:00 UTC")
+
+
+class Rollup(object):
+    """
+    Named rollup of a collection, declared in ``Schema.__rollups__`` as
+    ``{name: group}``, where ``group`` takes the same structure as the
+    ``group`` parameter of ``Collection.aggregate``
+    """
+
+    def __init__(self, schema, name, group):
+        self.schema = schema
+        self.name = name
+        self.id = "%s.%s:%s" % (schema.__module__, schema.__qualname__, name)
+        self.group = group
+        self.dimensions = {}
+        self.metrics = {}
+        for k, v in group.items():
+            if isinstance(v, str):
+                self.dimensions[k] = (None, v)
+            elif v["function"] in DIMENSIONS:
+                self.dimensions[k] = (v["function"], v["field"])
+            elif v["function"] in METRICS:
+                self.metrics[k] = (v["function"], v["field"])
+            else:
+                raise ValueError("Unknown function %s" % v["function"])
+        self.fields = set(
+            [f for _, f in self.dimensions.values()]
+            + [f for _, f in self.metrics.values()]
+        )
+
+    def matches(self, group):
+        """Whether ``group`` can be answered from this rollup: same group
+        by columns, and a subset of its aggregate columns"""
+        if not group:
+            return False
+        for k, v in group.items():
+            if self.group.get(k, None) != v:
+                return False
+        return all(k in group for k in self.dimensions.keys())
+
+    def contribution(self, data):
+        """Returns ``(key, dimensions, values)`` of object ``data``"""
+        dims = {}
+        for k, (function, field) in self.dimensions.items():
+            dims[k] = _bucket_value(function, data.get(field, None))
+        values = {}
+        for k, (function, field) in self.metrics.items():
+            values[k] = _jsonable(data.get(field, None))
+        raw = json.dumps([dims[k] for k in sorted(dims.keys())])
+        return hashlib.sha1(raw.encode("utf8")).hexdigest(), dims, values
+
+    def empty(self, dims):
+        return {"dims": dims, "rows": 0, "metrics": {}}
+
+    def accumulate(self, data, values, sign=1):
+        """
+        Add (or remove, if ``sign`` is negative) ``values`` into bucket
+        ``data``. Returns ``False`` if the bucket can not be maintained
+        incrementally, ie: when the current min/max value is removed
+        """
+        ok = True
+        data["rows"] += sign
+        metrics = data["metrics"]
+        for k, (function, field) in self.metrics.items():
+            value = values[k]
+            if value is None:
+                continue
+            current = metrics.get(k, None)
+            if function == "count":
+                metrics[k] = (current or 0) + sign
+            elif function == "sum":
+                metrics[k] = (current or 0) + sign * value
+            elif function == "avg":
+                total, count = current or [0, 0]
+                metrics[k] = [total + sign * value, count + sign]
+            elif sign > 0:
+                if current is None:
+                    metrics[k] = value
+                elif function == "min" and value < current:
+                    metrics[k] = value
+                elif function == "max" and value > current:
+                    metrics[k] = value
+            elif value == current:
+                ok = False
+        return ok and data["rows"] >= 0
+
+    def result(self, data, group):
+        row = {}
+        for k in group.keys():
+            if k in self.dimensions:
+                row[k] = data["dims"][k]
+                continue
+            function = self.metrics[k][0]
+            value = data["metrics"].get(k, None)
+            if function == "count":
+                value = value or 0
+            elif function == "avg":
+                value = value[0] / value[1] if value and value[1] else None
+            row[k] = value
+        return row
+
+    def apply(self, session, data, sign=1):
+        """Add (or remove) object ``data`` into its bucket. Returns
+        ``False`` if the rollup went stale"""
+        key, dims, values = self.contribution(data)
+        q = (
+            session.query(RollupBucket)
+            .filter(RollupBucket.rollup == self.id, RollupBucket.key == key)
+            .with_for_update()
+        )
+        bucket = q.first()
+        if bucket is None:
+            if sign < 0:
+                return False
+            try:
+                with session.begin_nested():
+                    bucket = RollupBucket(
+                        rollup=self.id, key=key, data=self.empty(dims)
+                    )
+                    session.add(bucket)
+            except IntegrityError:
+                # created by a concurrent transaction
+                bucket = q.first()
+        data = copy.deepcopy(bucket.data)
+        ok = self.accumulate(data, values, sign)
+        if data["rows"] <= 0:
+            session.delete(bucket)
+        else:
+            bucket.data = data
+        return ok
+
+
+_rollups: dict = {}
+
+
+def get_rollups(collection):
+    """Rollups declared on the schema of ``collection``. Rollups are only
+    maintained for collections on SQL storages"""
+    if not isinstance(collection.storage, SQLStorage):
+        return []
+    schema = collection.schema
+    result = _rollups.get(schema, None)
+    if result is None:
+        declared = getattr(schema, "__rollups__", None) or {}
+        result = [Rollup(schema, n, g) for n, g in sorted(declared.items())]
+        _rollups[schema] = result
+    return result
+
+
+def _get_state(session, rollup, lock=None):
+    # lock is None, "share" (incremental updates) or "update" (reconcile),
+    # so that incremental updates wait while the rollup is rebuilt
+    q = session.query(RollupState).filter(RollupState.name == rollup.id)
+    if lock == "share":
+        q = q.with_for_update(read=True)
+    elif lock == "update":
+        q = q.with_for_update()
+    state = q.first()
+    if state is not None or lock is None:
+        return state
+    try:
+        with session.begin_nested():
+            # rollups start stale, until they are reconciled for the first
+            # time with existing objects
+            state = RollupState(name=rollup.id, stale=True)
+            session.add(state)
+    except IntegrityError:
+        state = q.first()
+    return state
+
+
+def _update(obj, sign):
+    rollups = get_rollups(obj.collection)
+    if not rollups:
+        return
+    session = obj.collection.storage.session
+    for rollup in rollups:
+        state = _get_state(session, rollup, lock="share")
+        if state.stale:
+            continue
+        if not rollup.apply(session, obj.data, sign):
+            state.stale = True
+
+
+def add(obj):
+    """Add ``obj`` into the rollups of its collection"""
+    _update(obj, 1)
+
+
+def remove(obj):
+    """Remove ``obj`` from the rollups of its collection"""
+    _update(obj, -1)
+
+
+@contextmanager
+def updating(obj):
+    """Move ``obj`` to its new buckets when it is modified within the
+    block without going through ``Model.update``"""
+    remove(obj)
+    yield obj
+    add(obj)
+
+
+def mark_stale(collection, fields=None):
+    """Mark rollups of ``collection`` stale, limited to rollups that use
+    any of ``fields`` if specified"""
+    rollups = get_rollups(collection)
+    if not rollups:
+        return
+    session = collection.storage.session
+    for rollup in rollups:
+        if fields is not None and not rollup.fields.intersection(fields):
+            continue
+        _get_state(session, rollup, lock="update").stale = True
+
+
+def aggregate(collection, group, order_by=None, limit=None):
+    """
+    Answer aggregate ``group`` of all objects of ``collection`` from a
+    matching rollup. Returns ``None`` if there is no matching rollup that
+    is up to date
+    """
+    if order_by is not None:
+        if order_by[0] not in (group or {}) or order_by[1] not in ["asc", "desc"]:
+            return None
+    for rollup in get_rollups(collection):
+        if not rollup.matches(group):
+            continue
+        session = collection.storage.session
+        state = _get_state(session, rollup)
+        if state is None or state.stale:
+            continue
+        q = session.query(RollupBucket.data).filter(RollupBucket.rollup == rollup.id)
+        result = [rollup.result(data, group) for (data,) in q]
+        if not result and not rollup.dimensions:
+            # same as aggregating over an empty table
+            result = [rollup.result(rollup.empty({}), group)]
+        if order_by is not None:
+            col = order_by[0]
+            result.sort(
+                key=lambda r: (r[col] is None, r[col]), reverse=order_by[1] == "desc"
+            )
+        if limit is not None:
+            result = result[:limit]
+        return result
+    return None
+
+
+@contextmanager
+def _primary_reads(request):
+    """Read objects from the primary databases within the block"""
+    environ = request.environ
+    replica_reads = environ.get(REPLICA_READS_KEY, True)
+    environ[REPLICA_READS_KEY] = False
+    try:
+        yield
+    finally:
+        environ[REPLICA_READS_KEY] = replica_reads
+
+
+def rebuild(collection, rollup, batch_size=1000):
+    """Recompute buckets of ``rollup`` from all objects of
+    ``collection``. Returns the number of buckets"""
+    session = collection.storage.session
+    state = _get_state(session, rollup, lock="update")
+    buckets = {}
+    # a lagging read replica would leave out recent changes of a rollup that
+    # is then marked up to date
+    with _primary_reads(collection.request):
+        objs = collection.iter_search(order_by=("id", "asc"), batch_size=batch_size)
+        for obj in objs:
+            key, dims, values = rollup.contribution(obj.data)
+            data = buckets.setdefault(key, rollup.empty(dims))
+            rollup.accumulate(data, values)
+    session.query(RollupBucket).filter(RollupBucket.rollup == rollup.id).delete(
+        synchronize_session=False
+    )
+    session.add_all(
+        [RollupBucket(rollup=rollup.id, key=k, data=d) for k, d in buckets.items()]
+    )
+    state.stale = False
+    state.reconciled = datetime.now(tz=pytz.UTC)
+    session.flush()
+    return len(buckets)
+
+
+def reconcile(collection, stale_only=False, batch_size=1000):
+    """Rebuild rollups of ``collection``, only the ones that went stale if
+    ``stale_only`` is set. Returns ``{rollup name: number of buckets}``"""
+    result = {}
+    for rollup in get_rollups(collection):
+        if stale_only:
+            state = _get_state(collection.storage.session, rollup)
+            if state is not None and not state.stale:
+                continue
+        result[rollup.name] = rebuild(collection, rollup, batch_size=batch_size)
+    return result
+
+
+def reconcile_rollups(request, typenames=None, stale_only=False):
+    """
+    Reconcile rollups of all registered types (or of ``typenames``). This
+    is run periodically by the ``morpfw.rollup.reconcile`` cron job when
+    ``morpfw.rollup.reconcile.enabled`` is set
+    """
+    if typenames is None:
+        types = request.app.config.type_registry.get_typeinfos(request)
+        typenames = list(types.keys())
+    result = {}
+    for typename in typenames:
+        collection = request.get_collection(typename)
+        result[typename] = reconcile(collection, stale_only=stale_only)
+    return result
+
+
+@SignalApp.cron(name="morpfw.rollup.reconcile", minute="*/15")
+def reconcile_rollups_job(request_options):
+    # checked before building the app of the request
+    configuration = request_options["settings"].get("configuration", None) or {}
+    if not configuration.get("morpfw.rollup.reconcile.enabled", False):
+        return
+    with request_factory(**request_options) as request:
+        stale_only = request.app.get_config("morpfw.rollup.reconcile.stale_only", True)
+        reconcile_rollups(request, stale_only=stale_only)
+
+
+@App.subscribe(signal=signals.OBJECT_CREATED, model=model.Model)
+def rollup_add_created(app, request, obj, signal):
+    add(obj)
+
+
+@App.subscribe(signal=signals.OBJECT_TOBEUPDATED, model=model.Model)
+def rollup_remove_updated(app, request, obj, signal):
+    remove(obj)
+
+
+@App.subscribe(signal=signals.OBJECT_UPDATED, model=model.Model)
+def rollup_add_updated(app, request, obj, signal):
+    add(obj)
+
+
+@App.subscribe(signal=signals.OBJECT_TOBEDELETED, model=model.Model)
+def rollup_remove_deleted(app, request, obj, signal):
+    remove(obj)
+
+
+@App.subscribe(signal=signals.OBJECTS_UPDATED, model=model.Collection)
+def rollup_stale_updated(app, request, batch, signal):
+    mark_stale(batch.collection, fields=batch.values.keys())
+
+
+@App.subscribe(signal=signals.OBJECTS_DELETED, model=model.Collection)
+def rollup_stale_deleted(app, request, batch, signal):
+    mark_stale(batch.collection)
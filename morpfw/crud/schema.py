@@ -10,7 +10,9 @@ import colander
 from inverter import dc2colander, dc2colanderjson
 
 from ..interfaces import ISchema
+from . import schemaconv
 from .app import App
+from .const import DEFAULT_INDEXES
 from .errors import FieldValidationError, FormValidationError, ValidationError
 from .relationship import BackReference, Reference
 
@@ -25,28 +27,32 @@ class BaseSchema(ISchema):
 
         if not update_mode:
             if json:
-                cschema = dc2colanderjson.convert(cls, request=request)
+                cschema = schemaconv.convert(dc2colanderjson, cls, request=request)
             else:
-                cschema = dc2colander.convert(
-                    cls, request=request, default_tzinfo=request.timezone()
+                cschema = schemaconv.convert(
+                    dc2colander, cls, request=request, default_tzinfo=request.timezone()
                 )
 
         else:
             if json:
-                cschema = dc2colanderjson.convert(
-                    cls, request=request, include_fields=data.keys(), mode="update",
+                cschema = schemaconv.convert(
+                    dc2colanderjson,
+                    cls,
+                    request=request,
+                    include_fields=data.keys(),
+                    mode="update",
                 )
             else:
-                cschema = dc2colander.convert(
+                cschema = schemaconv.convert(
+                    dc2colander,
                     cls,
                     request=request,
                     include_fields=data.keys(),
                     mode="update",
                     default_tzinfo=request.timezone(),
                 )
-        cs = cschema()
         # FIXME: need to pass context here
-        cs = cs.bind(request=request, **kwargs)
+        cs = schemaconv.bind(cschema, request=request, **kwargs)
         if not deserialize:
             # FIXME: can we skip this and immediately validate?
 
@@ -97,6 +103,8 @@ class Schema(BaseSchema):
     )
 
     __unique_constraint__ = []  # type: ignore
+    __indexes__ = DEFAULT_INDEXES  # type: ignore
+    __rollups__ = {}  # type: ignore
     __references__ = []  # type: ignore
     __backreferences__ = []  # type: ignore
     __validators__ = []  # type: ignore
@@ -0,0 +1,203 @@
+import contextlib
+import contextvars
+import copy
+import dataclasses
+import functools
+from collections.abc import KeysView
+
+import colander
+from inverter import dc2colander, dc2colanderESjson, dc2colanderjson
+
+from .querycache import LRUCache
+
+# request that schemas are bound to in the current execution context
+current = contextvars.ContextVar("morpfw.schemaconv.request", default=None)
+
+#: converters that accept a ``request``, and produce colander schemas
+COLANDER_CONVERTERS = [dc2colander, dc2colanderjson, dc2colanderESjson]
+
+schema_cache = LRUCache()
+
+
+class RequestProxy(object):
+    """
+    Stands in for the request in cached schemas, forwarding to the request
+    the schema is used with (see ``bound_request``). Validators, preparers
+    and widget factories receive this proxy
+    """
+
+    def __getattr__(self, name):
+        return getattr(current_request(), name)
+
+    def __setattr__(self, name, value):
+        setattr(current_request(), name, value)
+
+    def __bool__(self):
+        return bool(current_request())
+
+    def __repr__(self):
+        return "<RequestProxy of %r>" % current_request()
+
+
+request_proxy = RequestProxy()
+
+
+def current_request():
+    return current.get()
+
+
+@contextlib.contextmanager
+def bound_request(request):
+    """Resolve the request proxy of cached schemas to ``request`` within
+    the block"""
+    token = current.set(request)
+    try:
+        yield
+    finally:
+        current.reset(token)
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset, KeysView)):
+        return frozenset(value)
+    return value
+
+
+def _thaw(value):
+    # inverter extends some of the lists it is given
+    if isinstance(value, (tuple, set, frozenset, KeysView)):
+        return list(value)
+    return value
+
+
+def convert(converter, schema, request=None, **kwargs):
+    """
+    Cached ``converter.convert(schema, **kwargs)``, where ``converter`` is
+    one of the inverter modules. Conversions are keyed on ``schema``, the
+    converter and its parameters (eg: include and exclude fields, mode and
+    timezone) and are shared by all requests.
+
+    Colander schemas are converted against a proxy of the request, which
+    resolves to the ``request`` binding of ``bind``, ``serialize`` and
+    ``deserialize``. ``request`` is not used otherwise
+    """
+    colander_converter = converter in COLANDER_CONVERTERS
+    key = (converter, schema, _freeze(kwargs))
+    result = schema_cache.get(key)
+    if result is None:
+        kwargs = {k: _thaw(v) for k, v in kwargs.items()}
+        if colander_converter:
+            kwargs["request"] = request_proxy
+        result = converter.convert(schema, **kwargs)
+        if colander_converter:
+            result._morpfw_template = Template(schema, result)
+        schema_cache.set(key, result)
+    return result
+
+
+def _has_deferred(node):
+    for name in dir(node):
+        if isinstance(getattr(node, name), colander.deferred):
+            return True
+    return any(_has_deferred(child) for child in node.children)
+
+
+def _default_factories(schema, node):
+    # inverter evaluates default factories (and empty dict/list/set
+    # defaults) once per conversion, these are re-evaluated on every use
+    # of a cached schema instead
+    result = {}
+    fields = schema.__dataclass_fields__
+    for child in node.children:
+        field = fields.get(child.name, None)
+        factory = getattr(field, "default_factory", dataclasses.MISSING)
+        if factory is not dataclasses.MISSING and factory is not None:
+            result[child.name] = factory
+        elif isinstance(child.default, (dict, list, set)):
+            result[child.name] = functools.partial(copy.deepcopy, child.default)
+    return result
+
+
+class Template(object):
+    """Shared instance of a cached colander schema, from which bound
+    instances are copied"""
+
+    def __init__(self, schema, cschema):
+        self.instance = cschema()
+        self.deferred = _has_deferred(self.instance)
+        self.factories = _default_factories(schema, self.instance)
+
+
+def _template(cschema):
+    return cschema._morpfw_template
+
+
+def _set_bindings(node, bindings):
+    node.bindings = bindings
+    for child in node.children:
+        _set_bindings(child, bindings)
+
+
+def _with_request(request, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with bound_request(request):
+            return method(*args, **kwargs)
+
+    return wrapper
+
+
+def bind(cschema, **bindings):
+    """
+    Instance of ``cschema`` bound to ``bindings``, serializing and
+    deserializing with the ``request`` binding. Schemas without deferred
+    values are copied from a template, and only have their bindings set
+    """
+    template = _template(cschema)
+    if template.deferred:
+        cs = template.instance.bind(**bindings)
+    else:
+        cs = template.instance.clone()
+        _set_bindings(cs, bindings)
+    for child in cs.children:
+        factory = template.factories.get(child.name, None)
+        if factory is None:
+            continue
+        child.default = factory()
+        if child.missing is not colander.required:
+            child.missing = factory()
+    request = bindings.get("request", None)
+    cs.serialize = _with_request(request, cs.serialize)
+    cs.deserialize = _with_request(request, cs.deserialize)
+    return cs
+
+
+def serialize(cschema, appstruct, **bindings):
+    """Serialize ``appstruct`` with ``cschema``, for the ``request``
+    binding. Other ``bindings`` are only applied if the schema has deferred
+    values"""
+    template = _template(cschema)
+    if template.deferred:
+        return bind(cschema, **bindings).serialize(appstruct)
+    missing = [n for n in template.factories.keys() if n not in appstruct]
+    if missing:
+        appstruct = dict(appstruct)
+        for n in missing:
+            appstruct[n] = template.factories[n]()
+    with bound_request(bindings.get("request", None)):
+        return template.instance.serialize(appstruct)
+
+
+def deserialize(cschema, cstruct, **bindings):
+    """Deserialize ``cstruct`` with ``cschema``, for the ``request``
+    binding. Other ``bindings`` are only applied if the schema has deferred
+    values, or if default values are needed"""
+    template = _template(cschema)
+    if template.deferred or any(
+        n not in cstruct for n in template.factories.keys()
+    ):
+        return bind(cschema, **bindings).deserialize(cstruct)
+    with bound_request(bindings.get("request", None)):
+        return template.instance.deserialize(cstruct)
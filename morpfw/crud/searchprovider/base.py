@@ -1,7 +1,8 @@
 from ..errors import UnprocessableError
 from ..model import Collection
+from ..querycache import parse_dsl
 from ...interfaces import ISearchProvider
-from rulez import parse_dsl, OperatorNotAllowedError
+from rulez import OperatorNotAllowedError
 
 
 class SearchProvider(ISearchProvider):
@@ -0,0 +1,175 @@
+import copy
+from datetime import date, datetime
+
+import colander
+from inverter import dc2colander, dc2colanderjson
+from morepath.request import Response
+
+from ..exc import ConfigurationError
+from . import schemaconv
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+#: serialize through colander schemas
+COLANDER = "colander"
+#: serialize through functions generated from colander schemas
+CODEGEN = "codegen"
+
+BACKENDS = [COLANDER, CODEGEN]
+
+EPOCH = date(1970, 1, 1)
+
+# type of colander field -> expression serializing ``v``, identical to
+# ``node.serialize(v)`` for the common value types, falling back to the
+# colander node (``n``) for the others
+EXPRESSIONS = {
+    dc2colanderjson.Str: "None if v is None else v if type(v) is str else {n}(v)",
+    dc2colanderjson.Int: "None if v is None else v if type(v) is int else {n}(v)",
+    dc2colanderjson.Float: (
+        "None if v is None else v if type(v) is float else {n}(v)"
+    ),
+    dc2colanderjson.Boolean: "True if v else False",
+    dc2colanderjson.Date: (
+        "None if not v else (v - EPOCH).days if type(v) is date else {n}(v)"
+    ),
+    dc2colanderjson.DateTime: (
+        "None if not v else int(v.timestamp() * 1000) "
+        "if type(v) is datetime and v.tzinfo is not None else {n}(v)"
+    ),
+    dc2colander.Mapping: (
+        "{{}} if v is None else copy_json(v) if type(v) is dict else {n}(v)"
+    ),
+    colander.List: "v",
+    colander.Set: "v",
+}
+
+_JSON_SCALARS = (str, int, float, bool, type(None))
+
+
+def copy_json(value):
+    """``copy.deepcopy`` of JSON-like ``value``, faster on dicts and lists
+    of plain values"""
+    t = type(value)
+    if t is dict:
+        return {k: copy_json(v) for k, v in value.items()}
+    if t is list:
+        return [copy_json(v) for v in value]
+    if t in _JSON_SCALARS:
+        return value
+    return copy.deepcopy(value)
+
+
+def get_backend(app):
+    """Serializer backend configured through ``morpfw.crud.serializer``"""
+    backend = app.get_config("morpfw.crud.serializer", COLANDER)
+    if backend not in BACKENDS:
+        raise ConfigurationError("Unknown serializer backend %s" % backend)
+    return backend
+
+
+def _expression(node):
+    if type(node) is not dc2colander.SchemaNode:
+        return None
+    if node.default is colander.null or node.default is colander.drop:
+        return None
+    if isinstance(node.typ, colander.Mapping):
+        if node.children or node.typ.unknown != "preserve":
+            return None
+    return EXPRESSIONS.get(type(node.typ), None)
+
+
+def _field_source(idx, node, factory):
+    # statements that serialize field ``node`` of the mapping into ``result``
+    name = repr(node.name)
+    lines = ["    v = appstruct.get(%s, null)" % name]
+    if factory is not None:
+        lines.append("    if v is null: v = f%d()" % idx)
+    expr = _expression(node)
+    if expr is None:
+        lines.append("    v = n%d(v)" % idx)
+        lines.append("    if v is not drop: result[%s] = v" % name)
+        return lines
+    if factory is None:
+        lines.append("    if v is null: v = d%d" % idx)
+    lines.append("    result[%s] = %s" % (name, expr.format(n="n%d" % idx)))
+    return lines
+
+
+def compile_serializer(cschema):
+    """
+    Generate a function that serializes mappings identically to colander
+    schema class ``cschema``. Returns ``None`` if the schema can not be
+    compiled, ie: it has deferred values or does not ignore unknown keys
+    """
+    template = schemaconv._template(cschema)
+    instance = template.instance
+    if template.deferred or getattr(instance.typ, "unknown", None) != "ignore":
+        return None
+    if any(node.default is colander.drop for node in instance.children):
+        return None
+    namespace = {
+        "null": colander.null,
+        "drop": colander.drop,
+        "date": date,
+        "datetime": datetime,
+        "EPOCH": EPOCH,
+        "copy_json": copy_json,
+    }
+    lines = ["def serialize(appstruct):", "    result = {}"]
+    for idx, node in enumerate(instance.children):
+        factory = template.factories.get(node.name, None)
+        namespace["n%d" % idx] = node.serialize
+        namespace["d%d" % idx] = node.default
+        namespace["f%d" % idx] = factory
+        lines += _field_source(idx, node, factory)
+    lines.append("    return result")
+    exec(compile("\n".join(lines), "<serializer %r>" % cschema, "exec"), namespace)
+    return namespace["serialize"]
+
+
+def _serializer(cschema):
+    template = schemaconv._template(cschema)
+    try:
+        return template.serializer
+    except AttributeError:
+        template.serializer = compile_serializer(cschema)
+    return template.serializer
+
+
+def serialize(cschema, appstruct, **bindings):
+    """
+    Same as ``schemaconv.serialize``, through a function generated from
+    ``cschema``. Invalid data is serialized again through colander, which
+    raises the same error the colander backend would
+    """
+    fn = _serializer(cschema)
+    if fn is None or type(appstruct) is not dict:
+        return schemaconv.serialize(cschema, appstruct, **bindings)
+    try:
+        return fn(appstruct)
+    except colander.Invalid:
+        return schemaconv.serialize(cschema, appstruct, **bindings)
+
+
+def get_serialize(app):
+    """``serialize`` function of the backend configured on ``app``"""
+    if get_backend(app) == CODEGEN:
+        return serialize
+    return schemaconv.serialize
+
+
+def render_json(content, request):
+    """
+    Same as ``morepath.render_json``, encoding through orjson when it is
+    available and the ``codegen`` backend is enabled
+    """
+    content = request.app._dump_json(content, request)
+    if orjson is None or get_backend(request.app) != CODEGEN:
+        return Response(json_body=content, content_type="application/json")
+    return Response(
+        body=orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS),
+        content_type="application/json",
+    )
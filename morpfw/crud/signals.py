@@ -7,9 +7,45 @@ import reg
 from . import pubsub
 
 OBJECT_CREATED = "morpfw.object_created"
+OBJECT_TOBEUPDATED = "morpfw.object_tobeupdated"
 OBJECT_UPDATED = "morpfw.object_updated"
 OBJECT_TOBEDELETED = "morpfw.object_tobedeleted"
 BLOB_UPDATED = "morpfw.blob_updated"
+OBJECTS_CREATED = "morpfw.objects_created"
+OBJECTS_UPDATED = "morpfw.objects_updated"
+OBJECTS_TOBEDELETED = "morpfw.objects_tobedeleted"
+OBJECTS_DELETED = "morpfw.objects_deleted"
+
+
+class ObjectBatch(object):
+    """Batch of objects of a collection, dispatched against the collection"""
+
+    def __init__(self, collection, objects):
+        self.collection = collection
+        self.objects = objects
+
+    def __iter__(self):
+        return iter(self.objects)
+
+    def __len__(self):
+        return len(self.objects)
+
+
+class IdentifierBatch(ObjectBatch):
+    """Identifiers of objects affected by a set-based update or delete,
+    together with the values that were written"""
+
+    def __init__(self, collection, identifiers, values=None):
+        super().__init__(collection, identifiers)
+        self.identifiers = identifiers
+        self.values = values or {}
+
+
+def _event_target(self, request, obj, signal):
+    if isinstance(obj, ObjectBatch):
+        return obj.collection
+    return obj
+
 
 def _get_identifier(obj):
     if inspect.isclass(obj):
@@ -52,7 +88,7 @@ class SignalApp(dectate.App):
     subscribe = dectate.directive(Connect)
 
     @reg.dispatch_method(
-        reg.match_instance("model", lambda self, request, obj, signal: obj),
+        reg.match_instance("model", _event_target),
         reg.match_key("signal", lambda self, request, obj, signal: signal),
     )
     def _events(self, request, obj, signal):
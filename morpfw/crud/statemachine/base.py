@@ -3,6 +3,7 @@ import typing
 from transitions import Machine
 
 from ...interfaces import IStateMachine
+from .. import rollup
 
 
 class StateMachine(IStateMachine):
@@ -33,7 +34,14 @@ class StateMachine(IStateMachine):
             return None
 
     def _set_state(self, val):
-        self._context.data["state"] = val
+        old = self._get_state()
+        if old is None or old == val:
+            self._context.data["state"] = val
+            return
+        # transitions do not go through Model.update, rollups that group
+        # on state need to be moved explicitly
+        with rollup.updating(self._context):
+            self._context.data["state"] = val
 
     state = property(_get_state, _set_state)
 
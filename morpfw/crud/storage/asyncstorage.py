@@ -0,0 +1,106 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import transaction
+
+
+class AsyncStorage(object):
+    """
+    Async variant of the storage API of ``storage`` (any ``IStorage``, eg:
+    ``SQLStorage``, ``ElasticSearchStorage`` or the PAS storages), for use
+    from coroutines without blocking the event loop on database and
+    Elasticsearch round-trips.
+
+    Calls run on a thread of ``executor``, not in the context of the
+    caller: they use a database session and transaction of their own,
+    separate from those of the request that the storage belongs to.
+    Changes made through ``AsyncStorage`` are not committed with the
+    request, use ``run`` to commit (or abort) them, and share one executor
+    between the storages of a unit of work. ``executor`` must have a single
+    thread, as sessions and transactions are scoped to the thread.
+
+    Without ``executor``, one is created and shut down by ``close``, or on
+    leaving ``async with``, eg::
+
+        async with AsyncStorage(collection.storage) as storage:
+            obj = await storage.create(collection, data)
+            await storage.run(transaction.commit)
+    """
+
+    def __init__(self, storage, executor=None):
+        self.storage = storage
+        self.owns_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1)
+        self.executor = executor
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Shut the executor down, if it was created by this storage,
+        aborting what was not committed and closing its sessions"""
+        if self.owns_executor:
+            self.executor.submit(self._release)
+            self.executor.shutdown(wait=True)
+
+    def _release(self):
+        transaction.abort()
+        clear = getattr(self.storage.request, "clear_db_session", None)
+        if clear is not None:
+            clear()
+
+    async def run(self, fn, *args, **kwargs):
+        """Run ``fn(*args, **kwargs)`` in the thread of the storage"""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(fn, *args, **kwargs)
+        return await loop.run_in_executor(self.executor, call)
+
+    async def create(self, collection, data):
+        return await self.run(self.storage.create, collection, data)
+
+    async def create_many(self, collection, datas):
+        return await self.run(self.storage.create_many, collection, datas)
+
+    async def upsert(self, collection, data, conflict_fields, values):
+        return await self.run(
+            self.storage.upsert, collection, data, conflict_fields, values
+        )
+
+    async def search(self, collection, query=None, *args, **kwargs):
+        return await self.run(self.storage.search, collection, query, *args, **kwargs)
+
+    async def aggregate(self, query=None, group=None, order_by=None, limit=None):
+        return await self.run(
+            self.storage.aggregate, query, group=group, order_by=order_by, limit=limit
+        )
+
+    async def count(self, collection, query=None):
+        return await self.run(self.storage.count, collection, query)
+
+    async def get(self, collection, identifier):
+        return await self.run(self.storage.get, collection, identifier)
+
+    async def get_by_id(self, collection, id):
+        return await self.run(self.storage.get_by_id, collection, id)
+
+    async def get_by_uuid(self, collection, uuid):
+        return await self.run(self.storage.get_by_uuid, collection, uuid)
+
+    async def update(self, collection, identifier, data):
+        return await self.run(self.storage.update, collection, identifier, data)
+
+    async def update_where(self, collection, query, data):
+        return await self.run(self.storage.update_where, collection, query, data)
+
+    async def delete(self, identifier, model, **kwargs):
+        return await self.run(self.storage.delete, identifier, model, **kwargs)
+
+    async def delete_where(self, collection, query, permanent=False):
+        return await self.run(
+            self.storage.delete_where, collection, query, permanent=permanent
+        )
@@ -1,5 +1,9 @@
 import copy
+
+import rulez
+
 from ..blobstorage.base import NullBlobStorage
+from ..counting import Count
 from ..errors import BlobStorageNotImplementedError
 from ...interfaces import IStorage
 
@@ -8,6 +12,9 @@ class BaseStorage(IStorage):
 
     use_transactions = True
 
+    #: unique field used as tiebreaker for keyset (cursor) pagination
+    cursor_field = "id"
+
     blobstorage = None
 
     @property
@@ -28,6 +35,70 @@ class BaseStorage(IStorage):
         obj = self.model.schema(**data)
         return obj.__dict__
 
+    def create_many(self, collection, datas):
+        return [self.create(collection, data) for data in datas]
+
+    def enforces_unique(self, fields):
+        """
+        Whether the storage itself rejects records duplicating the values of
+        ``fields`` (eg: through a unique index), raising
+        ``collection.exist_exc`` on create and update. Uniqueness is checked
+        with a query before writing otherwise
+        """
+        return False
+
+    def upsert(self, collection, data, conflict_fields, values):
+        """
+        Create a record from ``data``, or write ``values`` on the record
+        having the same values on ``conflict_fields``. Returns the model and
+        whether it was created. This default implementation looks the
+        record up first, storages override it with an atomic operation
+        """
+        query = rulez.and_(*[rulez.field[f] == data[f] for f in conflict_fields])
+        existing = self.search(collection, query, limit=1)
+        if not existing:
+            return self.create(collection, data), True
+        identifier = existing[0].identifier
+        self.update(collection, identifier, values)
+        return self.get(collection, identifier), False
+
+    def iter_search(
+        self,
+        collection,
+        query=None,
+        order_by=None,
+        fields=None,
+        batch_size=1000,
+        detached=False,
+    ):
+        kwargs = {}
+        if fields is not None:
+            kwargs["fields"] = fields
+        return iter(self.search(collection, query, order_by=order_by, **kwargs))
+
+    def count(self, collection, query=None):
+        result = self.aggregate(
+            query, group={"count": {"function": "count", "field": "uuid"}}
+        )
+        return Count(result[0]["count"] if result else 0)
+
+    def estimate_count(self, collection, query=None):
+        return self.count(collection, query)
+
+    def update_where(self, collection, query, data):
+        identifiers = []
+        for obj in self.search(collection, query):
+            self.update(collection, obj.identifier, data)
+            identifiers.append(obj.identifier)
+        return identifiers
+
+    def delete_where(self, collection, query, permanent=False):
+        identifiers = []
+        for obj in self.search(collection, query):
+            self.delete(obj.identifier, model=obj, permanent=permanent)
+            identifiers.append(obj.identifier)
+        return identifiers
+
 #	def create(self, data):
 #		raise NotImplementedError
 #
@@ -1,13 +1,17 @@
 import copy
 import json
+from datetime import date, datetime, timezone
 from pprint import pprint
 from typing import Optional
 
 import elasticsearch.exceptions as es_exc
+import elasticsearch.helpers as es_helpers
 from inverter import dc2colanderESjson, dc2esmapping
-from rulez import compile_condition
 
+from .. import schemaconv
 from ..app import App
+from ..counting import Count
+from ..querycache import compile_condition
 from .base import BaseStorage
 
 
@@ -149,11 +153,23 @@ def is_text_mapping(collection, field):
     return False
 
 
+def _search_after_value(value):
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    if isinstance(value, date):
+        return int(
+            datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+            .timestamp() * 1000
+        )
+    return value
+
+
 class ElasticSearchStorage(BaseStorage):
 
     refresh: Optional[str] = None
     auto_id = False
     use_transactions = False
+    cursor_field = "uuid"
 
     @property
     def index_name(self):
@@ -180,7 +196,7 @@ class ElasticSearchStorage(BaseStorage):
                 "number_of_replicas": 0,
             }
 
-        mapping = dc2esmapping.convert(collection.schema)
+        mapping = schemaconv.convert(dc2esmapping, collection.schema)
         body.update(mapping)
         self.client.indices.create(
             index=self.index_name, body=body,
@@ -199,8 +215,8 @@ class ElasticSearchStorage(BaseStorage):
 
         existing_fields = list(mappings[self.index_name]["mappings"].keys())
         new_fields = [x for x in fields if x not in existing_fields]
-        new_mapping = dc2esmapping.convert(
-            collection.schema, include_fields=list(new_fields)
+        new_mapping = schemaconv.convert(
+            dc2esmapping, collection.schema, include_fields=list(new_fields)
         )
         self.client.indices.put_mapping(
             index=self.index_name, body=new_mapping["mappings"],
@@ -209,19 +225,27 @@ class ElasticSearchStorage(BaseStorage):
 
     def create(self, collection, data):
         m = self.model(self.request, collection, data)
-        cschema = dc2colanderESjson.convert(
+        cschema = schemaconv.convert(
+            dc2colanderESjson,
             collection.schema,
             request=collection.request,
             default_tzinfo=collection.request.timezone(),
         )
-        esdata = cschema().serialize(data)
+        esdata = schemaconv.serialize(cschema, data, request=self.request)
+        params = {}
+        if not self.auto_id:
+            # fails if the identifier already exists
+            params["op_type"] = "create"
         try:
             r = self.client.index(
                 index=self.index_name,
                 id=m.identifier,
                 body=esdata,
                 refresh=self.refresh,
+                **params,
             )
+        except es_exc.ConflictError as e:
+            raise collection.exist_exc(m.identifier) from e
         except es_exc.TransportError as e:
             print(e.args, e.error, e.info)
             print(data)
@@ -232,7 +256,91 @@ class ElasticSearchStorage(BaseStorage):
             m.save()
         return m
 
-    def search(self, collection, query=None, offset=None, limit=None, order_by=None):
+    def create_many(self, collection, datas):
+        if self.auto_id:
+            return super().create_many(collection, datas)
+        cschema = schemaconv.convert(
+            dc2colanderESjson,
+            collection.schema,
+            request=collection.request,
+            default_tzinfo=collection.request.timezone(),
+        )
+        result = []
+        actions = []
+        for data in datas:
+            m = self.model(self.request, collection, data)
+            actions.append(
+                {
+                    "_op_type": "create",
+                    "_index": self.index_name,
+                    "_id": m.identifier,
+                    "_source": schemaconv.serialize(
+                        cschema, data, request=self.request
+                    ),
+                }
+            )
+            result.append(m)
+        params = {}
+        if self.refresh:
+            params["refresh"] = self.refresh
+        try:
+            es_helpers.bulk(self.client, actions, **params)
+        except es_helpers.BulkIndexError as e:
+            conflicts = [i["create"] for i in e.errors if i["create"]["status"] == 409]
+            if len(conflicts) != len(e.errors):
+                raise
+            raise collection.exist_exc(conflicts[0]["_id"]) from e
+        return result
+
+    def enforces_unique(self, fields):
+        # documents are created with their identifier as id
+        idfield = self.app.get_identifierfield(self.model.schema)
+        fields = [f for f in fields if f != "deleted"]
+        return not self.auto_id and fields == [idfield]
+
+    def upsert(self, collection, data, conflict_fields, values):
+        if not self.enforces_unique(conflict_fields):
+            return super().upsert(collection, data, conflict_fields, values)
+        m = self.model(self.request, collection, data)
+        cschema = schemaconv.convert(
+            dc2colanderESjson,
+            collection.schema,
+            request=collection.request,
+            default_tzinfo=collection.request.timezone(),
+        )
+        doc = {}
+        if values:
+            vschema = schemaconv.convert(
+                dc2colanderESjson,
+                collection.schema,
+                include_fields=values.keys(),
+                request=collection.request,
+                default_tzinfo=collection.request.timezone(),
+            )
+            doc = schemaconv.serialize(vschema, values, request=self.request)
+        r = self.client.update(
+            index=self.index_name,
+            id=m.identifier,
+            body={
+                "doc": doc,
+                "upsert": schemaconv.serialize(cschema, data, request=self.request),
+            },
+            refresh=self.refresh,
+        )
+        if r["result"] == "created":
+            return m, True
+        return self.get(collection, m.identifier), False
+
+    def search(
+        self,
+        collection,
+        query=None,
+        offset=None,
+        limit=None,
+        order_by=None,
+        cursor=None,
+        fields=None,
+    ):
         if limit is None:
             limit = 9999
         if query:
@@ -249,27 +357,72 @@ class ElasticSearchStorage(BaseStorage):
         if limit:
             params["size"] = limit
         if order_by:
-            if is_text_mapping(collection, order_by[0]):
-                params["sort"] = [":".join(["%s.raw" % order_by[0], order_by[1]])]
-            else:
-                params["sort"] = [":".join(order_by)]
+            params["sort"] = self._sort(collection, order_by)
+            if cursor is not None:
+                q["search_after"] = [_search_after_value(v) for v in cursor]
+                q["from"] = 0
+                params.pop("from_", None)
+        elif cursor is not None:
+            raise ValueError("Cursor requires order_by")
+        if fields is not None:
+            params["_source_includes"] = list(fields)
 
         res = self.client.search(index=self.index_name, body=q, **params)
 
         models = []
         for o in res["hits"]["hits"]:
-            data = o["_source"]
-            cschema = dc2colanderESjson.convert(
-                collection.schema,
-                include_fields=data.keys(),
-                request=collection.request,
-                default_tzinfo=collection.request.timezone(),
-            )
-            data = cschema().deserialize(data)
-            models.append(self.model(self.request, collection, data))
+            models.append(self._hit_model(collection, o))
 
         return list(models)
 
+    def iter_search(
+        self,
+        collection,
+        query=None,
+        order_by=None,
+        fields=None,
+        batch_size=1000,
+        detached=False,
+    ):
+        if query:
+            q = {"query": compile_condition("elasticsearch", query)()}
+        else:
+            q = {"query": {"match_all": {}}}
+        params = {}
+        if order_by:
+            params["sort"] = self._sort(collection, order_by)
+        if fields is not None:
+            params["_source_includes"] = list(fields)
+        hits = es_helpers.scan(
+            self.client,
+            query=q,
+            index=self.index_name,
+            size=batch_size,
+            preserve_order=bool(order_by),
+            **params
+        )
+        return (self._hit_model(collection, o) for o in hits)
+
+    def _sort(self, collection, order_by):
+        if is_text_mapping(collection, order_by[0]):
+            sort = [":".join(["%s.raw" % order_by[0], order_by[1]])]
+        else:
+            sort = [":".join(order_by)]
+        sort.append(":".join([self.cursor_field, order_by[1]]))
+        return sort
+
+    def _hit_model(self, collection, hit):
+        data = hit["_source"]
+        cschema = schemaconv.convert(
+            dc2colanderESjson,
+            collection.schema,
+            include_fields=data.keys(),
+            request=collection.request,
+            default_tzinfo=collection.request.timezone(),
+        )
+        data = schemaconv.deserialize(cschema, data, request=self.request)
+        return self.model(self.request, collection, data)
+
     def aggregate(self, query=None, group=None, order_by=None, limit=None):
         if group is None:
             return []
@@ -449,13 +602,14 @@ class ElasticSearchStorage(BaseStorage):
             return None
 
         data = res["_source"]
-        cschema = dc2colanderESjson.convert(
+        cschema = schemaconv.convert(
+            dc2colanderESjson,
             collection.schema,
             include_fields=data.keys(),
             request=collection.request,
             default_tzinfo=collection.request.timezone(),
         )
-        data = cschema().deserialize(data)
+        data = schemaconv.deserialize(cschema, data, request=self.request)
         return self.model(self.request, collection, data)
 
     def get_by_uuid(self, collection, uuid):
@@ -470,23 +624,25 @@ class ElasticSearchStorage(BaseStorage):
     def get_by_id(self, collection, id):
         res = self.client.get(index=self.index_name, id=id)
         data = res["_source"]
-        cschema = dc2colanderESjson.convert(
+        cschema = schemaconv.convert(
+            dc2colanderESjson,
             collection.schema,
             include_fields=data.keys(),
             request=collection.request,
             default_tzinfo=collection.request.timezone(),
         )
-        data = cschema().deserialize(data)
+        data = schemaconv.deserialize(cschema, data, request=self.request)
         return self.model(self.request, collection, data)
 
     def update(self, collection, identifier, data):
-        cschema = dc2colanderESjson.convert(
+        cschema = schemaconv.convert(
+            dc2colanderESjson,
             collection.schema,
             include_fields=data.keys(),
             request=collection.request,
             default_tzinfo=collection.request.timezone(),
         )
-        data = cschema().serialize(data)
+        data = schemaconv.serialize(cschema, data, request=self.request)
         self.client.update(
             index=self.index_name,
             id=identifier,
@@ -497,3 +653,97 @@ class ElasticSearchStorage(BaseStorage):
     def delete(self, identifier, model, **kwargs):
         self.client.delete(index=self.index_name, id=identifier, refresh=True)
 
+    def _query(self, query=None):
+        if query:
+            return {"query": compile_condition("elasticsearch", query)()}
+        return {"query": {"match_all": {}}}
+
+    def count(self, collection, query=None):
+        res = self.client.count(index=self.index_name, body=self._query(query))
+        return Count(res["count"])
+
+    def estimate_count(self, collection, query=None):
+        # total hits are only counted up to the cap, beyond which the
+        # total is a lower bound
+        cap = self.app.get_config("morpfw.crud.count.track_total_hits", 10000)
+        q = self._query(query)
+        q["size"] = 0
+        q["track_total_hits"] = cap
+        total = self.client.search(index=self.index_name, body=q)["hits"]["total"]
+        return Count(total["value"], exact=total["relation"] == "eq")
+
+    def _by_query(self, query, action, refresh=False, batch_size=1000):
+        """
+        Apply bulk ``action`` to the documents matching ``query``, by id, in
+        batches of ``batch_size`` ids scrolled from the index. Returns the
+        ids of the documents the action was applied to. Documents deleted
+        since they were scrolled are skipped, other failures (eg: conflicts
+        that outlast ``retry_on_conflict``) raise ``BulkIndexError`` once
+        all batches are applied
+        """
+        hits = es_helpers.scan(
+            self.client,
+            query=dict(self._query(query), _source=False),
+            index=self.index_name,
+            size=batch_size,
+        )
+        identifiers = []
+        errors = []
+        batch = []
+        for hit in hits:
+            batch.append(hit["_id"])
+            if len(batch) >= batch_size:
+                self._bulk_by_ids(batch, action, refresh, identifiers, errors)
+                batch = []
+        if batch:
+            self._bulk_by_ids(batch, action, refresh, identifiers, errors)
+        if errors:
+            raise es_helpers.BulkIndexError(
+                "%i document(s) failed, %i applied" % (len(errors), len(identifiers)),
+                errors,
+            )
+        return identifiers
+
+    def _bulk_by_ids(self, identifiers, action, refresh, applied, errors):
+        actions = [
+            dict(action, _index=self.index_name, _id=identifier)
+            for identifier in identifiers
+        ]
+        for ok, item in es_helpers.streaming_bulk(
+            self.client,
+            actions,
+            chunk_size=len(actions),
+            raise_on_error=False,
+            refresh=refresh,
+        ):
+            result = list(item.values())[0]
+            if ok:
+                applied.append(result["_id"])
+            elif result["status"] != 404:
+                errors.append(item)
+
+    def update_where(self, collection, query, data):
+        cschema = schemaconv.convert(
+            dc2colanderESjson,
+            collection.schema,
+            include_fields=data.keys(),
+            request=collection.request,
+            default_tzinfo=collection.request.timezone(),
+        )
+        data = schemaconv.serialize(cschema, data, request=self.request)
+        action = {
+            "_op_type": "update",
+            "retry_on_conflict": 3,
+            "script": {
+                "source": (
+                    "for (String k : params.keySet()) { ctx._source[k] = params[k] }"
+                ),
+                "lang": "painless",
+                "params": data,
+            },
+        }
+        return self._by_query(query, action, refresh=bool(self.refresh))
+
+    def delete_where(self, collection, query, permanent=False):
+        return self._by_query(query, {"_op_type": "delete"}, refresh=True)
+
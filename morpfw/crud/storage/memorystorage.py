@@ -1,7 +1,8 @@
 import jsl
 from morepath.request import Request
-from rulez import compile_condition
 
+from ..counting import Count
+from ..querycache import compile_condition
 from .base import BaseStorage
 
 DATA = {}
@@ -11,6 +12,7 @@ class MemoryStorage(BaseStorage):
 
     incremental_id = False
     incremental_column = "id"
+    cursor_field = "uuid"
 
     @property
     def datastore(self):
@@ -34,6 +36,22 @@ class MemoryStorage(BaseStorage):
         DATA[self.typekey][identifier] = obj
         return obj
 
+    def create_many(self, collection, datas):
+        store = DATA[self.typekey]
+        objs = {}
+        for data in datas:
+            assert data["uuid"] is not None
+            obj = self.model(self.request, collection, data.copy())
+            if self.incremental_id:
+                obj.data[self.incremental_column] = len(store) + len(objs) + 1
+            identifier = obj.identifier
+            # the whole batch is checked before anything is stored
+            if identifier in objs or identifier in store:
+                raise collection.exist_exc(identifier)
+            objs[identifier] = obj
+        store.update(objs)
+        return list(objs.values())
+
     def aggregate(self, query=None, group=None, order_by=None, limit=None):
         items = self.search(query)
 
@@ -48,7 +66,16 @@ class MemoryStorage(BaseStorage):
             result.append(row)
         return result
 
-    def search(self, collection, query=None, offset=None, limit=None, order_by=None):
+    def search(
+        self,
+        collection,
+        query=None,
+        offset=None,
+        limit=None,
+        order_by=None,
+        cursor=None,
+        fields=None,
+    ):
         res = []
         if query:
             f = compile_condition("native", query)
@@ -59,17 +86,29 @@ class MemoryStorage(BaseStorage):
             res = list(DATA[self.typekey].values())
         for r in res:
             r.request = self.request
-        if offset is not None:
-            res = res[offset:]
-        if limit is not None:
-            res = res[:limit]
         if order_by is not None:
             col, d = order_by
-            res = list(sorted(res, key=lambda x: x.data[col]))
+            cf = self.cursor_field
+            res = list(sorted(res, key=lambda x: (x.data[col], x.data[cf])))
             if d == "desc":
                 res = list(reversed(res))
+            if cursor is not None:
+                key = tuple(cursor)
+                if d == "desc":
+                    res = [r for r in res if (r.data[col], r.data[cf]) < key]
+                else:
+                    res = [r for r in res if (r.data[col], r.data[cf]) > key]
+        elif cursor is not None:
+            raise ValueError("Cursor requires order_by")
+        if offset is not None:
+            res = res[offset:]
+        if limit is not None:
+            res = res[:limit]
         return res
 
+    def count(self, collection, query=None):
+        return Count(len(self.search(collection, query)))
+
     def get(self, collection, identifier):
         if identifier not in DATA[self.typekey].keys():
             return None
@@ -113,3 +152,17 @@ class MemoryStorage(BaseStorage):
 
     def delete(self, identifier, model, **kwargs):
         del DATA[self.typekey][identifier]
+
+    def update_where(self, collection, query, data):
+        identifiers = []
+        for obj in self.search(collection, query):
+            for k, v in data.items():
+                obj.data[k] = v
+            identifiers.append(obj.identifier)
+        return identifiers
+
+    def delete_where(self, collection, query, permanent=False):
+        identifiers = [o.identifier for o in self.search(collection, query)]
+        for identifier in identifiers:
+            del DATA[self.typekey][identifier]
+        return identifiers
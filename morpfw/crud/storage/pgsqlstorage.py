@@ -17,7 +17,13 @@ from sqlalchemy.types import CHAR, TypeDecorator
 
 from ..app import App
 from .base import BaseStorage
-from .sqlstorage import Base, MappedTable, SQLStorage
+from .sqlstorage import (
+    Base,
+    MappedTable,
+    SQLStorage,
+    create_indexes,
+    unique_indexes,
+)
 
 db_meta = Base.metadata
 
@@ -30,6 +36,9 @@ def construct_orm_model(schema, metadata, *, name=None):
         return existing
 
     table = dc2pgsqla.convert(schema, metadata, name=name)
+    indexes = list(getattr(schema, "__indexes__", None) or [])
+    indexes += unique_indexes(getattr(schema, "__unique_constraint__", None))
+    create_indexes(table, indexes)
 
     class Table(MappedTable):
 
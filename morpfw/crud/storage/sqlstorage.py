@@ -1,3 +1,5 @@
+import contextlib
+import json
 import typing
 import uuid
 from datetime import datetime
@@ -5,19 +7,28 @@ from decimal import Decimal
 
 import jsl
 import pytz
+import rulez
 import sqlalchemy as sa
 import sqlalchemy_jsonfield as sajson
 import sqlalchemy_utils as sautils
 from rulez import compile_condition
 from sqlalchemy import func
+from sqlalchemy import orm as saorm
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.exc import StatementError
+from sqlalchemy.exc import IntegrityError, StatementError
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import load_only
 from sqlalchemy.sql import select
+from sqlalchemy.sql.expression import ClauseElement, Executable
 from sqlalchemy.types import CHAR, TypeDecorator
 from zope.sqlalchemy import mark_changed
 
 from ..app import App
+from ..const import DEFAULT_INDEXES
+from ..counting import Count
+from ..querycache import sql_condition
 from .base import BaseStorage
 
 
@@ -33,6 +44,39 @@ class SQLStorage(BaseStorage):
     def session(self):
         return self.request.db_session
 
+    @property
+    def read_session(self):
+        """
+        Session for ``search``, ``aggregate``, ``get`` and ``count``, on a
+        read replica of the database if the request allows it (see
+        ``DBSessionRequest.get_db_read_session``). Storages that override
+        ``session`` read through it
+        """
+        if type(self).session is not SQLStorage.session:
+            return self.session
+        get_read_session = getattr(self.request, "get_db_read_session", None)
+        if get_read_session is None:
+            return self.session
+        return get_read_session()
+
+    def primary_object(self, obj):
+        """
+        ``obj`` as loaded by the primary ``session``. Objects read through a
+        read replica session are reloaded, as that session refuses writes
+        and may lag behind the primary
+        """
+        session = saorm.object_session(obj)
+        primary = self.session
+        if isinstance(primary, saorm.scoped_session):
+            primary = primary()
+        if session is None or session is primary:
+            return obj
+        ident = saorm.object_mapper(obj).primary_key_from_instance(obj)
+        loaded = primary.get(type(obj), ident)
+        if loaded is None:
+            return obj
+        return loaded
+
     def create(self, collection, data):
         o = self.orm_model()
         dst = self.app.get_dataprovider(self.model.schema, o, self)
@@ -41,11 +85,99 @@ class SQLStorage(BaseStorage):
             dst[k] = v
         m = self.model(self.request, collection, o)
         identifier = m.identifier
-        self.session.add(o)
-        self.session.flush()
+        with self.unique_guard(collection):
+            self.session.add(o)
+            self.session.flush()
         self.session.refresh(o)
         return m
 
+    def create_many(self, collection, datas):
+        # rows are added in one flush so that the ORM can send them as a
+        # single batched INSERT .. RETURNING (psycopg2 execute_values),
+        # rows are not refreshed individually afterwards
+        objs = []
+        result = []
+        for data in datas:
+            o = self.orm_model()
+            dst = self.app.get_dataprovider(self.model.schema, o, self)
+            src = self.app.get_dataprovider(self.model.schema, data, self)
+            for k, v in src.items():
+                dst[k] = v
+            objs.append(o)
+            result.append(self.model(self.request, collection, o))
+        with self.unique_guard(collection):
+            self.session.add_all(objs)
+            self.session.flush()
+        return result
+
+    def enforces_unique(self, fields):
+        key = frozenset(f for f in fields if f != "deleted")
+        return key in unique_keys(self.orm_model.__table__)
+
+    @contextlib.contextmanager
+    def unique_guard(self, collection, identifier=True):
+        """
+        Run the statements flushed within the block in a savepoint, raising
+        unique violations as ``collection.exist_exc``. The transaction can
+        still be used after the violation.
+
+        The savepoint is only used if unique indexes replace the checks of
+        ``collection`` on its ``__unique_constraint__`` (and on its
+        identifier, if ``identifier``)
+        """
+        checks = [getattr(collection.schema, "__unique_constraint__", None)]
+        if identifier:
+            checks.append([self.app.get_identifierfield(collection.schema)])
+        if not any(fields and self.enforces_unique(fields) for fields in checks):
+            yield
+            return
+        try:
+            with self.session.begin_nested():
+                yield
+        except IntegrityError as e:
+            message = unique_violation(e)
+            if message is None:
+                raise
+            raise collection.exist_exc(message) from e
+
+    def upsert(self, collection, data, conflict_fields, values):
+        dialect = self.session.get_bind().dialect.name
+        insert = UPSERT_INSERTS.get(dialect, None)
+        if insert is None or not self.enforces_unique(conflict_fields):
+            return super().upsert(collection, data, conflict_fields, values)
+
+        table = self.orm_model.__table__
+        o = self.orm_model()
+        dst = self.app.get_dataprovider(self.model.schema, o, self)
+        for k, v in data.items():
+            dst[k] = v
+        row = {k: getattr(o, k) for k in data.keys() if k in table.c}
+        if row.get("id", None) is None:
+            row.pop("id", None)
+        stmt = insert(table).values(**row)
+        target = {
+            "index_elements": [table.c[f] for f in conflict_fields],
+            "index_where": unique_where(table, conflict_fields),
+        }
+        update = {k: stmt.excluded[k] for k in values.keys() if k in table.c}
+        if update:
+            stmt = stmt.on_conflict_do_update(set_=update, **target)
+        else:
+            stmt = stmt.on_conflict_do_nothing(**target)
+        self.session.flush()
+        self.session.execute(stmt)
+        mark_changed(self.session())
+
+        query = rulez.and_(*[rulez.field[f] == data[f] for f in conflict_fields])
+        r = (
+            self.session.query(self.orm_model)
+            .filter(self._where(query))
+            .populate_existing()
+            .one()
+        )
+        created = _hex(r.uuid) == _hex(o.uuid)
+        return self.model(self.request, collection, r), created
+
     def aggregate(self, query=None, group=None, order_by=None, limit=None):
         group_bys = []
         group_bys_map = {}
@@ -114,14 +246,14 @@ class SQLStorage(BaseStorage):
         include_deleted = self.request.environ.get(
             "morpfw.sqlstorage.include_deleted", False
         )
+        session = self.read_session
         if query:
-            f = compile_condition("sqlalchemy", query)
-            filterquery = f(self.orm_model)
+            filterquery = sql_condition(query, self.orm_model)
             if not include_deleted:
                 filterquery = sa.and_(self.orm_model.deleted.is_(None), filterquery)
-            q = self.session.query(*fields).filter(filterquery)
+            q = session.query(*fields).filter(filterquery)
         else:
-            q = self.session.query(*fields).filter(self.orm_model.deleted.is_(None))
+            q = session.query(*fields).filter(self.orm_model.deleted.is_(None))
 
         if order_by is not None:
             col = order_by[0]
@@ -165,26 +297,88 @@ class SQLStorage(BaseStorage):
             results.append(d)
         return results
 
-    def search(self, collection, query=None, offset=None, limit=None, order_by=None):
+    def search(
+        self,
+        collection,
+        query=None,
+        offset=None,
+        limit=None,
+        order_by=None,
+        cursor=None,
+        fields=None,
+    ):
+        q = self._search_query(
+            self.read_session, query, order_by=order_by, cursor=cursor, fields=fields
+        )
+        if offset is not None:
+            q = q.offset(offset)
+        if limit is not None:
+            q = q.limit(limit)
+
+        yield_per = self.request.environ.get("morpfw.sqlstorage.yield_per", None)
+        if yield_per is None:
+            try:
+                return [self.model(self.request, collection, o) for o in q.all()]
+            except StatementError:
+                return []
+        else:
+            try:
+                return [
+                    self.model(self.request, collection, o)
+                    for o in q.yield_per(yield_per)
+                ]
+            except StatementError:
+                return []
+
+    def iter_search(
+        self,
+        collection,
+        query=None,
+        order_by=None,
+        fields=None,
+        batch_size=1000,
+        detached=False,
+    ):
+        # rows are fetched through a server-side cursor, batch_size rows
+        # at a time, and are not kept referenced after they are yielded.
+        # A detached search uses its own session, so that it can be
+        # consumed after the request transaction has ended
+        session = self.read_session
+        if detached:
+            session = saorm.Session(bind=session.get_bind())
+        q = self._search_query(session, query, order_by=order_by, fields=fields)
+        q = q.execution_options(stream_results=True).yield_per(batch_size)
+        return self._iter_models(collection, q, session if detached else None)
+
+    def _iter_models(self, collection, q, session=None):
+        try:
+            for o in q:
+                yield self.model(self.request, collection, o)
+        finally:
+            if session is not None:
+                session.close()
+
+    def _search_query(
+        self, session, query=None, order_by=None, cursor=None, fields=None
+    ):
         include_deleted = self.request.environ.get(
             "morpfw.sqlstorage.include_deleted", False
         )
         if query:
-            f = compile_condition("sqlalchemy", query)
-            filterquery = f(self.orm_model)
+            filterquery = sql_condition(query, self.orm_model)
             if not include_deleted:
-                q = self.session.query(self.orm_model).filter(
+                q = session.query(self.orm_model).filter(
                     sa.and_(self.orm_model.deleted.is_(None), filterquery)
                 )
             else:
-                q = self.session.query(self.orm_model).filter(filterquery)
+                q = session.query(self.orm_model).filter(filterquery)
         else:
             if not include_deleted:
-                q = self.session.query(self.orm_model).filter(
+                q = session.query(self.orm_model).filter(
                     self.orm_model.deleted.is_(None)
                 )
             else:
-                q = self.session.query(self.orm_model)
+                q = session.query(self.orm_model)
 
         if order_by is not None:
             col = order_by[0]
@@ -192,29 +386,42 @@ class SQLStorage(BaseStorage):
             if d not in ["asc", "desc"]:
                 raise KeyError(d)
             colattr = getattr(self.orm_model, col)
+            tiebreaker = getattr(self.orm_model, self.cursor_field)
+            if cursor is not None:
+                q = q.filter(self._keyset_filter(colattr, tiebreaker, d, cursor))
             if d == "desc":
-                q = q.order_by(colattr.desc())
+                q = q.order_by(colattr.desc(), tiebreaker.desc())
             else:
-                q = q.order_by(colattr)
-        if offset is not None:
-            q = q.offset(offset)
-        if limit is not None:
-            q = q.limit(limit)
-
-        yield_per = self.request.environ.get("morpfw.sqlstorage.yield_per", None)
-        if yield_per is None:
-            try:
-                return [self.model(self.request, collection, o) for o in q.all()]
-            except StatementError:
-                return []
-        else:
-            try:
-                return [
-                    self.model(self.request, collection, o)
-                    for o in q.yield_per(yield_per)
-                ]
-            except StatementError:
-                return []
+                q = q.order_by(colattr, tiebreaker)
+        elif cursor is not None:
+            raise ValueError("Cursor requires order_by")
+        if fields is not None:
+            columns = self.orm_model.__table__.c
+            q = q.options(
+                load_only(*[getattr(self.orm_model, f) for f in fields if f in columns])
+            )
+        return q
+
+    def _keyset_filter(self, colattr, tiebreaker, direction, cursor):
+        # PostgreSQL sorts NULLs last on ascending and first on descending
+        # order, the seek condition follows the same rule
+        value, last_id = cursor
+        if direction == "desc":
+            if value is None:
+                return sa.or_(
+                    colattr.isnot(None),
+                    sa.and_(colattr.is_(None), tiebreaker < last_id),
+                )
+            return sa.or_(
+                colattr < value, sa.and_(colattr == value, tiebreaker < last_id)
+            )
+        if value is None:
+            return sa.and_(colattr.is_(None), tiebreaker > last_id)
+        return sa.or_(
+            colattr > value,
+            sa.and_(colattr == value, tiebreaker > last_id),
+            colattr.is_(None),
+        )
 
     def get(self, collection, identifier):
         qs = []
@@ -223,15 +430,16 @@ class SQLStorage(BaseStorage):
             "morpfw.sqlstorage.include_deleted", False
         )
 
+        session = self.read_session
         if not include_deleted:
-            q = self.session.query(self.orm_model).filter(
+            q = session.query(self.orm_model).filter(
                 sa.and_(
                     self.orm_model.deleted.is_(None),
                     getattr(self.orm_model, idfield) == identifier,
                 )
             )
         else:
-            q = self.session.query(self.orm_model).filter(
+            q = session.query(self.orm_model).filter(
                 getattr(self.orm_model, idfield) == identifier,
             )
         try:
@@ -243,7 +451,7 @@ class SQLStorage(BaseStorage):
         return self.model(self.request, collection, r)
 
     def get_by_id(self, collection, id):
-        q = self.session.query(self.orm_model).filter(self.orm_model.id == id)
+        q = self.read_session.query(self.orm_model).filter(self.orm_model.id == id)
         r = q.first()
         if not r:
             return None
@@ -256,7 +464,7 @@ class SQLStorage(BaseStorage):
                 "%s does not have %s field" % (self.orm_model, uuid_field)
             )
         qs = getattr(self.orm_model, uuid_field) == uuid
-        q = self.session.query(self.orm_model).filter(qs)
+        q = self.read_session.query(self.orm_model).filter(qs)
         r = q.first()
         if not r:
             return None
@@ -279,10 +487,11 @@ class SQLStorage(BaseStorage):
             raise ValueError(identifier)
 
         d = self.app.get_dataprovider(self.model.schema, r, self)
-        for k, v in data.items():
-            if d.get(k, None) != v:
-                d[k] = v
-        self.session.flush()
+        with self.unique_guard(collection, identifier=False):
+            for k, v in data.items():
+                if d.get(k, None) != v:
+                    d[k] = v
+            self.session.flush()
         return self.model(self.request, collection, r)
 
     def delete(self, identifier, model, **kwargs):
@@ -303,29 +512,276 @@ class SQLStorage(BaseStorage):
         d = self.app.get_dataprovider(self.model.schema, r, self)
         d["deleted"] = datetime.now(tz=pytz.UTC)
 
-    def vacuum(self):
-        affected = select([func.count(self.orm_model.__table__.c.uuid)]).where(
-            self.orm_model.deleted.isnot(None)
-        )
-        delete_q = self.orm_model.__table__.delete().where(
-            self.orm_model.deleted.isnot(None)
+    def _where(self, query=None):
+        include_deleted = self.request.environ.get(
+            "morpfw.sqlstorage.include_deleted", False
         )
-        items = self.session.execute(affected)
-        total = items.fetchone()[0]
-        self.session.execute(delete_q)
+        qs = []
+        if query:
+            qs.append(sql_condition(query, self.orm_model))
+        if not include_deleted:
+            qs.append(self.orm_model.deleted.is_(None))
+        if not qs:
+            return sa.true()
+        return sa.and_(*qs)
+
+    def _execute_where(self, stmt, where):
+        # flush pending changes first so that the statement sees them, and
+        # return identifiers of affected rows, using RETURNING if supported
+        self.session.flush()
+        idfield = self.app.get_identifierfield(self.model.schema)
+        idcol = getattr(self.orm_model, idfield)
+        dialect = self.session.get_bind().dialect
+        if getattr(dialect, "full_returning", False):
+            rows = self.session.execute(stmt.where(where).returning(idcol))
+            identifiers = [r[0] for r in rows]
+        else:
+            rows = self.session.execute(select([idcol]).where(where))
+            identifiers = [r[0] for r in rows]
+            if identifiers:
+                self.session.execute(stmt.where(idcol.in_(identifiers)))
         mark_changed(self.session())
+        for obj in list(self.session.identity_map.values()):
+            if isinstance(obj, self.orm_model):
+                self.session.expire(obj)
+        return [i.hex if isinstance(i, uuid.UUID) else i for i in identifiers]
+
+    def update_where(self, collection, query, data):
+        o = self.orm_model()
+        dst = self.app.get_dataprovider(self.model.schema, o, self)
+        for k, v in data.items():
+            dst[k] = v
+        table = self.orm_model.__table__
+        values = {k: getattr(o, k) for k in data.keys() if k in table.c}
+        stmt = sa.update(table).values(**values)
+        return self._execute_where(stmt, self._where(query))
+
+    def delete_where(self, collection, query, permanent=False):
+        if permanent:
+            stmt = self.orm_model.__table__.delete()
+        else:
+            stmt = sa.update(self.orm_model.__table__).values(
+                deleted=datetime.now(tz=pytz.UTC)
+            )
+        return self._execute_where(stmt, self._where(query))
+
+    def count(self, collection, query=None):
+        stmt = select([func.count()]).select_from(self.orm_model.__table__)
+        session = self.read_session
+        return Count(session.execute(stmt.where(self._where(query))).scalar())
+
+    def estimate_count(self, collection, query=None):
+        # planner statistics are only available on PostgreSQL
+        session = self.read_session
+        if session.get_bind().dialect.name != "postgresql":
+            return self.count(collection, query)
+        include_deleted = self.request.environ.get(
+            "morpfw.sqlstorage.include_deleted", False
+        )
+        if query is None and include_deleted:
+            reltuples = session.execute(
+                sa.text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:t)"),
+                {"t": self.orm_model.__table__.fullname},
+            ).scalar()
+            # reltuples is -1 (or 0, before PostgreSQL 14) if the table
+            # was never analyzed
+            if reltuples and reltuples > 0:
+                return Count(int(reltuples), exact=False)
+        stmt = select([self.orm_model.__table__.c.id]).where(self._where(query))
+        plan = session.execute(Explain(stmt)).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return Count(int(plan[0]["Plan"]["Plan Rows"]), exact=False)
+
+    def vacuum(self, batch_size=1000, older_than=None, commit=None, progress=None):
+        """
+        Permanently remove soft-deleted records, in batches of ``batch_size``
+        records walked in ``id`` order.
+
+        ``older_than`` (a ``timedelta``) only removes records deleted longer
+        than that ago. ``commit`` is called after each batch, so that locks
+        are released and an interrupted vacuum can simply be restarted, and
+        ``progress`` is called with the number of removed records and the
+        last removed ``id``. Returns the number of removed records
+        """
+        table = self.orm_model.__table__
+        where = table.c.deleted.isnot(None)
+        if older_than is not None:
+            where = sa.and_(
+                where, table.c.deleted < datetime.now(tz=pytz.UTC) - older_than
+            )
+        total = 0
+        last_id = None
+        while True:
+            stmt = select([table.c.id]).where(where)
+            if last_id is not None:
+                stmt = stmt.where(table.c.id > last_id)
+            stmt = stmt.order_by(table.c.id).limit(batch_size)
+            ids = [r[0] for r in self.session.execute(stmt)]
+            if not ids:
+                break
+            self._vacuum_batch(ids)
+            mark_changed(self.session())
+            total += len(ids)
+            last_id = ids[-1]
+            if commit is not None:
+                commit()
+            if progress is not None:
+                progress(total, last_id)
+            if len(ids) < batch_size:
+                break
         return total
 
+    def _vacuum_batch(self, ids):
+        table = self.orm_model.__table__
+        self.session.execute(table.delete().where(table.c.id.in_(ids)))
+
+
+class Explain(Executable, ClauseElement):
+    """``EXPLAIN (FORMAT JSON)`` of a select statement, for PostgreSQL"""
+
+    inherit_cache = False
+
+    def __init__(self, stmt):
+        self.statement = stmt
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
 
 GUID = sautils.UUIDType
 
 
+def create_indexes(table, indexes):
+    """
+    Declare composite and partial indexes on ``table`` from a list of index
+    specifications (see ``Schema.__indexes__``), eg::
+
+        {
+            "name": "active_created",
+            "fields": [("created", "desc"), ("id", "desc")],
+            "where": rulez.field["deleted"] == None,
+        }
+
+    ``where`` is a rulez query, the index is created as a partial index on
+    databases that support it. Indexes that already exist on the table are
+    skipped
+    """
+    existing = {i.name for i in table.indexes}
+    result = []
+    for spec in indexes:
+        columns = []
+        names = []
+        for f in spec["fields"]:
+            if isinstance(f, str):
+                f = (f, "asc")
+            name, order = f
+            if order not in ["asc", "desc"]:
+                raise KeyError(order)
+            col = table.c[name]
+            columns.append(col.desc() if order == "desc" else col)
+            names.append(name)
+        suffix = spec.get("name", None) or "_".join(names)
+        index_name = "ix_%s_%s" % (table.name, suffix)
+        if index_name in existing:
+            continue
+        kwargs = {}
+        if spec.get("where", None):
+            where = compile_condition("sqlalchemy", spec["where"])(table.c)
+            kwargs["postgresql_where"] = where
+            kwargs["sqlite_where"] = where
+        result.append(
+            sa.Index(index_name, *columns, unique=spec.get("unique", False), **kwargs)
+        )
+    return result
+
+
+def unique_indexes(fields):
+    """
+    Index specifications (see ``create_indexes``) enforcing a
+    ``__unique_constraint__`` on ``fields``. The index is partial on
+    ``deleted IS NULL``, so that values are unique among records that are
+    not soft-deleted, as searches do not return soft-deleted records.
+    ``deleted`` in ``fields`` is ignored
+    """
+    columns = [f for f in fields or [] if f != "deleted"]
+    if not columns:
+        return []
+    return [
+        {
+            "name": "unique",
+            "fields": columns,
+            "unique": True,
+            "where": {"field": "deleted", "operator": "==", "value": None},
+        }
+    ]
+
+
+_unique_keys: dict = {}
+
+
+def unique_keys(table):
+    """Sets of column names that are unique on ``table``"""
+    result = _unique_keys.get(table, None)
+    if result is None:
+        result = set()
+        for col in table.c:
+            if col.primary_key or col.unique:
+                result.add(frozenset([col.name]))
+        for index in table.indexes:
+            if index.unique:
+                result.add(frozenset(c.name for c in index.columns))
+        for cons in table.constraints:
+            if isinstance(cons, (sa.UniqueConstraint, sa.PrimaryKeyConstraint)):
+                result.add(frozenset(cons.columns.keys()))
+        _unique_keys[table] = result
+    return result
+
+
+def unique_where(table, fields):
+    """Condition of the partial unique index on ``fields`` of ``table``"""
+    key = frozenset(fields)
+    for index in table.indexes:
+        if index.unique and frozenset(c.name for c in index.columns) == key:
+            return index.dialect_options["postgresql"]["where"]
+    return None
+
+
+def unique_violation(exc):
+    """Message of ``IntegrityError`` ``exc`` if it was raised by a unique
+    index or constraint, ``None`` otherwise"""
+    orig = exc.orig
+    if getattr(orig, "pgcode", None) == "23505":
+        diag = getattr(orig, "diag", None)
+        return getattr(diag, "message_detail", None) or str(orig)
+    if str(orig).startswith("UNIQUE constraint failed"):
+        return str(orig)
+    return None
+
+
+def _hex(value):
+    return value.hex if isinstance(value, uuid.UUID) else value
+
+
+# dialects supporting INSERT .. ON CONFLICT
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
 class MappedTable(object):
     pass
 
 
 class BaseMixin(MappedTable):
 
+    #: composite and partial indexes, see ``create_indexes``
+    __indexes__ = DEFAULT_INDEXES
+
+    #: fields unique among records that are not soft-deleted, enforced
+    #: through a unique index, see ``unique_indexes``
+    __unique_constraint__: list = []
+
     id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
     uuid = sa.Column(GUID, default=uuid.uuid4, index=True, unique=True)
     created = sa.Column(
@@ -345,4 +801,13 @@ class BaseMixin(MappedTable):
     xattrs = sa.Column(sajson.JSONField)
 
 
+@sa.event.listens_for(BaseMixin, "instrument_class", propagate=True)
+def _create_mapped_indexes(mapper, cls):
+    table = mapper.local_table
+    if isinstance(table, sa.Table):
+        indexes = list(getattr(cls, "__indexes__", None) or [])
+        indexes += unique_indexes(getattr(cls, "__unique_constraint__", None))
+        create_indexes(table, indexes)
+
+
 Base = declarative_base(cls=BaseMixin)
@@ -18,6 +18,8 @@ def set_uuid(app, request, obj, signal):
 @App.subscribe(signal=signals.OBJECT_CREATED, model=model.Model)
 def set_created(app, request, obj, signal):
     if "created" in obj.schema.__dataclass_fields__.keys():
+        if obj.data.get("created", None) is not None:
+            return
         now = datetime.now(tz=pytz.UTC)
         obj.data["created"] = now
         obj.data["modified"] = now
@@ -26,6 +28,8 @@ def set_created(app, request, obj, signal):
 @App.subscribe(signal=signals.OBJECT_CREATED, model=model.Model)
 def set_creator(app, request, obj, signal):
     if "creator" in obj.schema.__dataclass_fields__.keys():
+        if obj.data.get("creator", None) is not None:
+            return
         obj.data["creator"] = request.identity.userid or None
 
 
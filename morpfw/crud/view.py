@@ -3,15 +3,19 @@ import logging
 import os
 import sys
 import traceback
+from functools import lru_cache
 from urllib.parse import urlencode
 
+import transaction
 from jsonpath_ng import parse as jsonpath_parse
 from morepath.request import Request
 from transitions import MachineError
+from webob import Response
 from webob.exc import HTTPForbidden, HTTPInternalServerError, HTTPNotFound
 
 from . import permission
 from .app import App
+from .cursor import NEXT, PREVIOUS, decode_cursor
 from .errors import (
     AlreadyExistsError,
     FieldValidationError,
@@ -19,11 +23,75 @@ from .errors import (
     UnprocessableError,
     ValidationError,
 )
+from .export import (
+    CONTENT_TYPES,
+    EXTENSIONS,
+    export_fields,
+    export_name,
+    iter_export,
+)
 from .model import Collection, Model
+from .serializer import render_json
 from .validator import get_data, validate_schema
 
 logger = logging.getLogger("morp")
 
+NDJSON = "application/x-ndjson"
+
+
+@lru_cache(maxsize=256)
+def compile_jsonpath(select):
+    return jsonpath_parse(select)
+
+
+def sparse_json(obj, fields, request):
+    data = obj.fields_json(fields)
+    if not obj.linkable:
+        return data
+    return {"data": data, "links": [{"rel": "self", "href": request.link(obj)}]}
+
+
+def detached_app_iter(request, chunks):
+    """
+    Iterate over ``chunks`` of a streamed response body. The body is
+    iterated after the request transaction has been committed and its
+    database sessions closed, so reads made while serializing (permission
+    rules, links, xattrs) are done in a transaction of their own, which is
+    aborted and whose sessions are closed once the body has been sent
+    """
+    transaction.begin()
+    try:
+        yield from chunks
+    finally:
+        transaction.abort()
+        clear = getattr(request, "clear_db_session", None)
+        if clear is not None:
+            clear()
+
+
+def ndjson_response(objs, request, fields=None, select=None):
+    """
+    Response streaming ``objs`` as newline-delimited JSON, one object per
+    line, serialized as they are read from storage
+    """
+    expr = compile_jsonpath(select) if select else None
+
+    def app_iter():
+        for obj in objs:
+            if fields:
+                data = sparse_json(obj, fields, request)
+            else:
+                data = obj.json()
+            if expr is not None:
+                data = [match.value for match in expr.find(data["data"])]
+            yield (json.dumps(data) + "\n").encode("utf8")
+
+    return Response(
+        content_type=NDJSON,
+        charset=None,
+        app_iter=detached_app_iter(request, app_iter()),
+    )
+
 
 @get_data.register(model=Collection, request=Request)
 def get_collection_data(model, request):
@@ -51,6 +119,8 @@ def aggregate(context, request):
 
     order_by = request.GET.get("order_by", None)
     limit = request.GET.get("limit", None)
+    if limit is not None:
+        limit = int(limit)
 
     gs = request.GET.get("group", "").strip()
     group = None
@@ -65,7 +135,9 @@ def aggregate(context, request):
     return objs
 
 
-@App.json(model=Collection, name="search", permission=permission.Search)
+@App.json(
+    model=Collection, name="search", permission=permission.Search, render=render_json
+)
 def search(context, request):
     if not context.search_view_enabled:
         raise HTTPNotFound()
@@ -83,42 +155,82 @@ def search(context, request):
     if limit > max_limit:
         limit = max_limit
     offset = int(request.GET.get("offset", 0))
+    cursor = request.GET.get("cursor", None) or None
     order_by = request.GET.get("order_by", None)
     select = request.GET.get("select", None)
+    fields = request.GET.get("fields", None)
+    if fields:
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    fields = fields or None
     if order_by:
         order_by = order_by.split(":")
         if len(order_by) == 1:
             order_by = order_by + ["asc"]
+    if NDJSON in request.headers.get("Accept", ""):
+        objs = context.iter_search(
+            query, order_by=order_by, secure=True, fields=fields, detached=True
+        )
+        return ndjson_response(objs, request, fields=fields, select=select)
     # HACK: +1 to ensure next page links is triggered
     searchlimit = limit
     if limit:
         searchlimit = limit + 1
+    if cursor:
+        offset = 0
+        direction = decode_cursor(cursor)[1]
+    else:
+        direction = NEXT
     objs = context.search(
-        query, offset=offset, limit=searchlimit, order_by=order_by, secure=True
+        query,
+        offset=offset,
+        limit=searchlimit,
+        order_by=order_by,
+        secure=True,
+        cursor=cursor,
+        fields=fields,
     )
     # and limit back to actual limit
-    objs = [obj.json() for obj in objs]
     has_next = False
-    if limit:
-        if len(objs) > limit:
+    has_previous = offset > 0 or (cursor is not None)
+    if limit and len(objs) > limit:
+        if direction == PREVIOUS:
+            # previous page is fetched in reverse, the extra item
+            # is at the beginning
+            objs = objs[-limit:]
+            has_previous = True
             has_next = True
-        objs = objs[:limit]
+        else:
+            objs = objs[:limit]
+            has_next = True
+    elif direction == PREVIOUS:
+        has_previous = False
+        has_next = True
+    next_cursor = previous_cursor = None
+    if objs:
+        next_cursor = context.cursor(objs[-1], order_by, NEXT)
+        previous_cursor = context.cursor(objs[0], order_by, PREVIOUS)
+    if fields:
+        objs = [sparse_json(obj, fields, request) for obj in objs]
+    else:
+        objs = [obj.json() for obj in objs]
     if select:
-        expr = jsonpath_parse(select)
+        expr = compile_jsonpath(select)
         results = []
         for obj in objs:
             results.append([match.value for match in expr.find(obj["data"])])
     else:
         results = objs
     params = {}
+    if qs:
+        params["q"] = qs
     if select:
         params["select"] = select
+    if fields:
+        params["fields"] = ",".join(fields)
     if limit:
         params["limit"] = limit
     if order_by:
         params["order_by"] = request.GET.get("order_by", "")
-    params["offset"] = offset + (limit or 0)
-    qs = urlencode(params)
     res = {
         "results": results,
         "q": query,
@@ -127,24 +239,74 @@ def search(context, request):
         "offset": offset,
         "result_count": len(results),
     }
-    if has_next:
+    if cursor:
+        res["cursor"] = cursor
+    if next_cursor:
+        res["next_cursor"] = next_cursor
+    if has_next and next_cursor:
+        params["cursor"] = next_cursor
         res.setdefault("links", [])
         res["links"].append(
-            {"rel": "next", "href": request.link(context, "+search?%s" % qs)}
+            {
+                "rel": "next",
+                "href": request.link(context, "+search?%s" % urlencode(params)),
+            }
         )
-    if offset > 0:
-        prev_offset = offset - (limit or 0)
-        if prev_offset < 0:
-            prev_offset = 0
-        params["offset"] = prev_offset
-        qs = urlencode(params)
+    if has_previous:
+        if cursor and previous_cursor:
+            params["cursor"] = previous_cursor
+        else:
+            params.pop("cursor", None)
+            prev_offset = offset - (limit or 0)
+            if prev_offset < 0:
+                prev_offset = 0
+            params["offset"] = prev_offset
         res.setdefault("links", [])
         res["links"].append(
-            {"rel": "previous", "href": request.link(context, "+search?%s" % qs)}
+            {
+                "rel": "previous",
+                "href": request.link(context, "+search?%s" % urlencode(params)),
+            }
         )
     return res
 
 
+@App.view(model=Collection, name="export", permission=permission.Search)
+def export(context, request):
+    if not context.search_view_enabled or not context.export_view_enabled:
+        raise HTTPNotFound()
+
+    qs = request.GET.get("q", "").strip()
+    query = None
+    if qs:
+        query = context.searchprovider().parse_query(qs)
+    format = request.GET.get("format", "ndjson")
+    if format not in CONTENT_TYPES:
+        raise UnprocessableError("Unknown export format %s" % format)
+    fields = request.GET.get("fields", None)
+    if fields:
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    fields = export_fields(context, fields or None)
+    order_by = request.GET.get("order_by", None)
+    if order_by:
+        order_by = order_by.split(":")
+        if len(order_by) == 1:
+            order_by = order_by + ["asc"]
+
+    objs = context.iter_search(
+        query, order_by=order_by, secure=True, fields=fields, detached=True
+    )
+    filename = "%s.%s" % (export_name(context), EXTENSIONS[format])
+    return Response(
+        content_type=CONTENT_TYPES[format],
+        charset=None,
+        content_disposition='attachment; filename="%s"' % filename,
+        app_iter=detached_app_iter(
+            request, iter_export(context, objs, format, fields=fields)
+        ),
+    )
+
+
 @App.json(model=Collection, request_method="POST", permission=permission.Create)
 def create(context, request):
     if not context.create_view_enabled:
@@ -160,12 +322,12 @@ def get_obj_data(model, request):
     return data
 
 
-@App.json(model=Model, permission=permission.View)
+@App.json(model=Model, permission=permission.View, render=render_json)
 def read(context, request):
     select = request.GET.get("select", None)
     obj = context.json()
     if select:
-        expr = jsonpath_parse(select)
+        expr = compile_jsonpath(select)
         obj = [match.value for match in expr.find(obj["data"])]
     return obj
 
@@ -4,6 +4,7 @@ from inverter import dc2jsl
 from jsonschema import ValidationError, validate
 
 from ...interfaces import IXattrProvider
+from .. import schemaconv
 
 _marker = object()
 
@@ -19,7 +20,8 @@ class XattrProvider(IXattrProvider):
         self.app = context.request.app
 
     def jsonschema(self):
-        schema = dc2jsl.convert(
+        schema = schemaconv.convert(
+            dc2jsl,
             self.schema,
             ignore_required=True,
             additional_properties=self.additional_properties,
@@ -0,0 +1,113 @@
+import os
+import threading
+
+import sqlalchemy
+from sqlalchemy import event, exc
+from sqlalchemy.pool import NullPool, QueuePool
+
+DEFAULT_POOL_OPTIONS = {
+    "poolclass": "queue",
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_timeout": 30,
+    "pool_recycle": 3600,
+    "pool_pre_ping": True,
+}
+
+POOL_CLASSES = {"queue": QueuePool, "null": NullPool}
+
+
+class EngineRegistry(object):
+    """
+    Process-wide registry of SQLAlchemy engines.
+
+    Engines are keyed by database URL and pool options so that all threads
+    (and all requests) in a process share the same connection pool. Pools
+    are reset in the child process after ``fork()`` so that connections
+    inherited from the parent (eg: gunicorn master, celery parent) are never
+    reused by the child.
+    """
+
+    def __init__(self):
+        self.engines = {}
+        self.inherited_pools = []
+        self.lock = threading.Lock()
+
+    def _key(self, dburl, options):
+        return (dburl, tuple(sorted(options.items())))
+
+    def get_engine(self, dburl, connect_args=None, **options):
+        opts = DEFAULT_POOL_OPTIONS.copy()
+        opts.update(options)
+        key = self._key(dburl, opts)
+        engine = self.engines.get(key, None)
+        if engine is not None:
+            return engine
+        with self.lock:
+            engine = self.engines.get(key, None)
+            if engine is not None:
+                return engine
+            engine = self._create_engine(dburl, connect_args, opts)
+            self.engines[key] = engine
+        return engine
+
+    def _create_engine(self, dburl, connect_args, opts):
+        opts = opts.copy()
+        poolclass = POOL_CLASSES[opts.pop("poolclass")]
+        kwargs = {"poolclass": poolclass, "connect_args": connect_args or {}}
+        if poolclass is QueuePool:
+            kwargs.update(opts)
+        else:
+            kwargs["pool_pre_ping"] = opts["pool_pre_ping"]
+        engine = sqlalchemy.create_engine(dburl, **kwargs)
+        _install_pid_guard(engine)
+        return engine
+
+    def find(self, dburl):
+        return [e for k, e in self.engines.items() if k[0] == dburl]
+
+    def dispose(self, dburl=None):
+        with self.lock:
+            for key in list(self.engines.keys()):
+                if dburl is not None and key[0] != dburl:
+                    continue
+                self.engines[key].dispose()
+                del self.engines[key]
+
+    def reset_after_fork(self):
+        """Drop connections inherited from parent process without closing
+        them, as they are still in use by the parent"""
+        self.lock = threading.Lock()
+        for engine in self.engines.values():
+            try:
+                engine.dispose(close=False)
+            except TypeError:
+                # SQLAlchemy < 1.4.33 does not support close=False,
+                # keep a reference to the old pool so that its
+                # connections are not garbage collected (and closed)
+                self.inherited_pools.append(engine.pool)
+                engine.pool = engine.pool.recreate()
+
+
+def _install_pid_guard(engine):
+    # https://docs.sqlalchemy.org/en/14/core/pooling.html#pooling-multiprocessing
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        connection_record.info["pid"] = os.getpid()
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        pid = os.getpid()
+        if connection_record.info.get("pid", pid) != pid:
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError(
+                "Connection record belongs to pid %s, "
+                "attempting to check out in pid %s"
+                % (connection_record.info["pid"], pid)
+            )
+
+
+engine_registry = EngineRegistry()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=engine_registry.reset_after_fork)
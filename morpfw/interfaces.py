@@ -1,5 +1,16 @@
 import abc
-from typing import Any, BinaryIO, List, Optional, Sequence, Type, Union
+from typing import (
+    Any,
+    BinaryIO,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
 
 import morepath
 import webob
@@ -22,6 +33,8 @@ class IDataProvider(abc.ABC):
     data from model.
     """
 
+    __slots__ = ()
+
     @abc.abstractmethod
     def __init__(self, schema: Type[ISchema], data: dict, storage: "IStorageBase"):
         super().__init__()
@@ -148,6 +161,36 @@ class IStorageBase(abc.ABC):
         """Create a model from submitted data"""
         raise NotImplementedError
 
+    def create_many(self, collection, datas: Sequence[dict]) -> Sequence["IModel"]:
+        """Create models from a batch of prepared data, in as few
+        round-trips to the backend as possible"""
+        raise NotImplementedError
+
+    def update_where(self, collection, query: Optional[dict], data: dict) -> list:
+        """Set ``data`` on all records matching rulez ``query`` in a single
+        set-based operation, return identifiers of affected records"""
+        raise NotImplementedError
+
+    def delete_where(
+        self, collection, query: Optional[dict], permanent: bool = False
+    ) -> list:
+        """Delete all records matching rulez ``query`` in a single set-based
+        operation, return identifiers of affected records"""
+        raise NotImplementedError
+
+    def enforces_unique(self, fields: Sequence[str]) -> bool:
+        """Whether the backend rejects records duplicating the values of
+        ``fields``, raising ``collection.exist_exc``"""
+        raise NotImplementedError
+
+    def upsert(
+        self, collection, data: dict, conflict_fields: Sequence[str], values: dict
+    ) -> Tuple["IModel", bool]:
+        """Create a record from ``data``, or write ``values`` on the record
+        having the same ``conflict_fields`` values, return the model and
+        whether it was created"""
+        raise NotImplementedError
+
     @abc.abstractmethod
     def get(self, identifier) -> Optional["IModel"]:
         """return model from identifier"""
@@ -160,8 +203,44 @@ class IStorageBase(abc.ABC):
         offset: Optional[int] = None,
         limit: Optional[int] = None,
         order_by: Union[None, list, tuple] = None,
+        cursor: Optional[list] = None,
+        fields: Optional[list] = None,
     ) -> Sequence["IModel"]:
-        """return search result based on specified rulez query"""
+        """return search result based on specified rulez query.
+
+        ``cursor`` is a list of ``[order_by value, cursor_field value]``
+        of the last item of the previous page, when specified, only items
+        after it in ``order_by`` order are returned.
+
+        ``fields``, when specified, is the list of fields to be loaded,
+        storages may skip loading other fields"""
+        raise NotImplementedError
+
+    def count(self, collection, query: Optional[dict] = None) -> int:
+        """return exact number of records matching rulez query, as a
+        ``morpfw.crud.counting.Count``"""
+        raise NotImplementedError
+
+    def estimate_count(self, collection, query: Optional[dict] = None) -> int:
+        """return a cheap estimate of the number of records matching rulez
+        query, as a ``morpfw.crud.counting.Count`` with ``exact`` set to
+        False if it is an estimate"""
+        raise NotImplementedError
+
+    def iter_search(
+        self,
+        collection,
+        query: Optional[dict] = None,
+        order_by: Union[None, list, tuple] = None,
+        fields: Optional[list] = None,
+        batch_size: int = 1000,
+        detached: bool = False,
+    ) -> Iterator["IModel"]:
+        """iterate over search result based on specified rulez query,
+        fetching ``batch_size`` records at a time from the backend.
+
+        When ``detached`` is True, records are read through a connection
+        that is independent from the request transaction"""
         raise NotImplementedError
 
     @abc.abstractmethod
@@ -379,6 +458,8 @@ class ICollection(abc.ABC):
         limit: Optional[int] = None,
         order_by: Optional[tuple] = None,
         secure: bool = False,
+        cursor: Optional[str] = None,
+        fields: Optional[list] = None,
     ) -> List[IModel]:
         """Search for models
 
@@ -391,18 +472,61 @@ class ICollection(abc.ABC):
         : param order_by: Tuple of ``(field, order)`` where ``order`` is
                          ``'asc'`` or ``'desc'``
         : param secure: When set to True, this will filter out any object which
-                       current logged in user is not allowed to see
+                       current logged in user is not allowed to see. Where
+                       permission rules provide a permission filter, it is
+                       pushed into the storage query, otherwise objects are
+                       checked one by one
+        : param cursor: Opaque cursor token returned by ``cursor()``, when
+                       specified, ``offset`` is ignored and results continue
+                       from the cursor position (keyset pagination)
+        : param fields: List of fields needed from the results, only these
+                       (and fields needed for identification and
+                       pagination) are loaded from storage
 
         : todo: ``order_by`` need to allow multiple field ordering
         """
         raise NotImplementedError
 
+    def count(
+        self,
+        query: Optional[dict] = None,
+        secure: bool = False,
+        strategy: Optional[str] = None,
+    ) -> int:
+        """Number of models matching rulez ``query``
+
+        : param strategy: ``'exact'``, ``'estimate'`` (backend statistics,
+                         may be inexact) or ``'cached'`` (exact count reused
+                         for ``morpfw.crud.count.cache_ttl`` seconds)
+        """
+        raise NotImplementedError
+
+    def iter_search(
+        self,
+        query: Optional[dict] = None,
+        order_by: Optional[tuple] = None,
+        secure: bool = False,
+        fields: Optional[list] = None,
+        batch_size: int = 500,
+        detached: bool = False,
+    ) -> Iterator[IModel]:
+        """Iterate over models matching rulez ``query`` without loading the
+        whole result set in memory, see ``search`` for parameters.
+
+        : param batch_size: Number of records fetched from storage at a time
+        : param detached: When set to True, storage may use a connection
+                         independent from the request transaction, so that
+                         iteration can continue after it is committed
+        """
+        raise NotImplementedError
+
     @abc.abstractmethod
     def aggregate(
         self,
         query: Optional[dict] = None,
         group: Optional[dict] = None,
         order_by: Optional[tuple] = None,
+        secure: bool = False,
     ) -> List[IModel]:
         """Get aggregated results
 
@@ -410,6 +534,8 @@ class ICollection(abc.ABC):
         : param group: Grouping structure
         : param order_by: Tuple of ``(field, order)`` where ``order`` is
                          ``'asc'`` or ``'desc'``
+        : param secure: When set to True, the permission filter of current
+                       logged in user is applied to the query
 
         : todo: Grouping structure need to be documented
 
@@ -421,6 +547,36 @@ class ICollection(abc.ABC):
         """Create a model from data"""
         raise NotImplementedError
 
+    def create_many(
+        self, items: Iterable[dict], batch_size: int = 500
+    ) -> Sequence[IModel]:
+        """Create models from an iterable of data, in batches of
+        ``batch_size``"""
+        raise NotImplementedError
+
+    def update_where(
+        self, query: Optional[dict], values: dict, deserialize: bool = True
+    ) -> list:
+        """Update ``values`` on all models matching rulez ``query``, return
+        identifiers of affected models"""
+        raise NotImplementedError
+
+    def delete_where(self, query: Optional[dict], permanent: bool = False) -> list:
+        """Delete all models matching rulez ``query``, return identifiers
+        of affected models"""
+        raise NotImplementedError
+
+    def upsert(
+        self,
+        data: dict,
+        conflict_fields: Optional[Sequence[str]] = None,
+        deserialize: bool = True,
+        secure: bool = False,
+    ) -> IModel:
+        """Create a model from data, or update the model having the same
+        values on ``conflict_fields``"""
+        raise NotImplementedError
+
     @abc.abstractmethod
     def get(self, identifier) -> IModel:
         """Get model by url identifier key"""
@@ -24,6 +24,7 @@ from .authn.pas.user.path import get_user_collection
 from .exc import ConfigurationError
 from .request import Request, default_settings, request_factory
 from .sql import Base
+from .warmup import warmup_app
 
 
 def create_app(settings, scan=True, **kwargs):
@@ -74,6 +75,7 @@ def create_app(settings, scan=True, **kwargs):
     celery_settings = config["morpfw.celery"]
     app.celery.conf.update(**celery_settings)
     application = app()
+    morepath_app = application
 
     # wrap with beaker session and cache manager
 
@@ -88,6 +90,8 @@ def create_app(settings, scan=True, **kwargs):
         application = BeakerMiddleware(application, beaker_settings)
     if "cache.type" in beaker_settings:
         application = BeakerCacheMiddleware(application, beaker_settings)
+
+    warmup_app(morepath_app, application, settings)
     return application
 
 
@@ -117,7 +121,25 @@ def run(app, settings, host="127.0.0.1", port=5000, ignore_cli=True):
     morepath.run(app, host=host, port=port, ignore_cli=ignore_cli)
 
 
-def runprod(app, settings, host="127.0.0.1", port=5000, ignore_cli=True, workers=None):
+#: gunicorn worker classes serving concurrent requests from one process
+THREADED_WORKER_CLASSES = ["gthread", "gevent", "eventlet"]
+
+#: default threads per worker of the gthread worker class, matching the
+#: default database connection pool (pool_size + max_overflow)
+DEFAULT_THREADS = 15
+
+
+def runprod(
+    app,
+    settings,
+    host="127.0.0.1",
+    port=5000,
+    ignore_cli=True,
+    workers=None,
+    worker_class=None,
+    threads=None,
+    preload=None,
+):
     service = "gunicorn"
     server_listen = {"listen_address": host, "listen_port": port}
     server = settings["server"].copy()
@@ -185,8 +207,13 @@ class=logging.Formatter
     """
         % opts
     )
+    if worker_class is None:
+        worker_class = server.get("worker_class", "sync")
     if workers is None:
-        workers = (multiprocessing.cpu_count() * 2) + 1
+        if worker_class in THREADED_WORKER_CLASSES:
+            workers = multiprocessing.cpu_count()
+        else:
+            workers = (multiprocessing.cpu_count() * 2) + 1
 
     logconf = tempfile.mktemp()
     with open(logconf, "w") as f:
@@ -207,9 +234,27 @@ class=logging.Formatter
         str(server.get("worker_connections", 1000)),
         "--timeout",
         str(server.get("worker_timeout", 30)),
+        "--worker-class",
+        worker_class,
     ]
-
-    subprocess.call([service] + opts + ["morpfw.wsgi:app"])
+    if worker_class == "gthread":
+        if threads is None:
+            threads = server.get("threads", DEFAULT_THREADS)
+        opts += ["--threads", str(threads)]
+
+    if preload is None:
+        preload = server.get("preload", False)
+    if preload:
+        # build the app once in the master, workers share it copy-on-write
+        opts.append("--preload")
+        target = "morpfw.wsgi:preload_app()"
+    elif settings["configuration"].get("morpfw.warmup.enabled", False):
+        # build and warm up the app before the worker accepts requests
+        target = "morpfw.wsgi:load_wsgi_app()"
+    else:
+        target = "morpfw.wsgi:app"
+
+    subprocess.call([service] + opts + [target])
 
 
 def set_buildout_environ(config: str) -> None:
@@ -1,12 +1,12 @@
+import contextvars
 import inspect
-import threading
 from datetime import datetime, timedelta
 
 import pytz
 
 from .interfaces import ICollection, IModel
 
-threadlocal = threading.local()
+classmemoize = contextvars.ContextVar("morpfw.classmemoize", default=None)
 
 
 class ModelMemoizer(object):
@@ -17,21 +17,16 @@ class ModelMemoizer(object):
         seconds = self.seconds
 
         def MemoizeWrapper(self, *args):
-            klass = self.__class__
             nomemoize = self.request.environ.get("morpfw.nomemoize", False)
             if nomemoize:
                 return method(self, *args)
             nomemoize = self.request.headers.get("X-MORP-NOMEMOIZE", None)
             if nomemoize is not None:
                 return method(self, *args)
-            if getattr(klass, "__memoize__", None) is None:
-
-                memoizer = getattr(threadlocal, "mfw_classmemoize", None)
-                if memoizer is None:
-                    memoizer = {}
-                    threadlocal.mfw_classmemoize = memoizer
-                klass.__memoize__ = memoizer
-            cachemgr = klass.__memoize__
+            cachemgr = classmemoize.get()
+            if cachemgr is None:
+                cachemgr = {}
+                classmemoize.set(cachemgr)
             if isinstance(self, IModel):
                 key = hash((self.__class__, method, self.uuid, args))
             elif isinstance(self, ICollection):
@@ -1,5 +1,7 @@
 import importlib
 
+import rulez
+
 from .authn.pas import permission as authperm
 from .authn.pas.apikey.model import APIKeyCollection, APIKeyModel
 from .authn.pas.user.model import CurrentUserModel, UserCollection, UserModel
@@ -56,6 +58,65 @@ def eval_config_groupperms(request, model, permission, identity):
     return None
 
 
+def eval_config_groupfilters(request, collection, permission, identity):
+    usercol = request.get_collection("morpfw.pas.user")
+    user = usercol.get_by_userid(identity.userid)
+    if user["is_administrator"]:
+        return True
+
+    rules = []
+    groups = [g["groupname"] for g in user.groups()]
+    model_class = collection.storage.model
+
+    config = request.app.get_config("morpfw.authz.type_permissions", {})
+    typeinfo = request.app.get_typeinfo_by_schema(collection.schema, request)
+    type_conf = config.get(typeinfo["name"], {})
+    for groupname in groups:
+        rule_name = type_conf.get(groupname, None)
+        if rule_name:
+            rules.append((groupname, rule_name))
+
+    config = request.app.get_config("morpfw.authz.model_permissions", {})
+    for model_name in config.keys():
+        model_klass = import_name(model_name)
+        if issubclass(model_class, model_klass):
+            model_conf = config[model_name]
+            for groupname in groups:
+                rule_name = model_conf.get(groupname, None)
+                if rule_name:
+                    rules.append((groupname, rule_name))
+            break
+
+    filters = []
+    for groupname, rule_name in rules:
+        filter_func = request.app.get_authz_filter(rule_name)
+        if filter_func is None:
+            return None
+        f = filter_func(groupname, identity, collection, permission)
+        if f is True or f is None:
+            return f
+        if f is not False:
+            filters.append(f)
+
+    if not filters:
+        return False
+    if len(filters) == 1:
+        return filters[0]
+    return rulez.or_(*filters)
+
+
+def currentuser_filter(identity, collection, permission):
+    request = collection.request
+    usercol = request.get_collection("morpfw.pas.user")
+    user = usercol.get_by_userid(identity.userid)
+    if user["is_administrator"]:
+        return True
+    if issubclass(collection.storage.model, UserModel):
+        uuid_field = request.app.get_uuidfield(collection.schema)
+        return rulez.field[uuid_field] == identity.userid
+    return rulez.field["userid"] == identity.userid
+
+
 def currentuser_permission(identity, model, permission):
     request = model.request
     usercol = request.get_collection("morpfw.pas.user")
@@ -83,6 +144,11 @@ def allow_user_crud(identity, model, permission):
     return currentuser_permission(identity, model, permission)
 
 
+@Policy.permission_filter(model=UserModel, permission=crudperms.All)
+def filter_user_crud(identity, collection, permission):
+    return currentuser_filter(identity, collection, permission)
+
+
 @Policy.permission_rule(model=UserModel, permission=authperm.ChangePassword)
 def allow_change_all_user_password(identity, model, permission):
     request = model.request
@@ -113,6 +179,11 @@ def allow_apikey_management(identity, model, permission):
     return currentuser_permission(identity, model, permission)
 
 
+@Policy.permission_filter(model=APIKeyModel, permission=crudperms.All)
+def filter_apikey_management(identity, collection, permission):
+    return currentuser_filter(identity, collection, permission)
+
+
 @Policy.permission_rule(model=Collection, permission=All)
 def collection_permission(identity, model, permission):
     return eval_config_groupperms(model.request, model, permission, identity)
@@ -122,3 +193,8 @@ def collection_permission(identity, model, permission):
 def model_permission(identity, model, permission):
     return eval_config_groupperms(model.request, model, permission, identity)
 
+
+@Policy.permission_filter(model=Model, permission=All)
+def model_permission_filter(identity, collection, permission):
+    request = collection.request
+    return eval_config_groupfilters(request, collection, permission, identity)
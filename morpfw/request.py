@@ -1,7 +1,12 @@
+import contextvars
 import copy
+import hashlib
 import importlib
+import json
 import os
+import random
 import threading
+import time
 import typing
 import warnings
 from importlib import import_module
@@ -12,22 +17,45 @@ import pytz
 import sqlalchemy.orm
 import transaction
 import yaml
+from beaker.middleware import CacheMiddleware as BeakerCacheMiddleware
+from beaker.middleware import SessionMiddleware as BeakerSessionMiddleware
+from beaker.session import SessionObject
 from cryptography.fernet import Fernet
 from elasticsearch import Elasticsearch
 from morepath.publish import resolve_model
 from morepath.request import SAME_APP, LinkError
 from morepath.request import Request as BaseRequest
 from morepath.traject import parse_path
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import scoped_session, sessionmaker
-from sqlalchemy.pool import NullPool, QueuePool
 from zope.sqlalchemy import ZopeTransactionEvents
 from zope.sqlalchemy import register as register_session
 
 import morpfw
 
-from .exc import ConfigurationError
+from .engine import engine_registry
+from .exc import ConfigurationError, ReadOnlySessionError
 
-threadlocal = threading.local()
+# database sessions and elasticsearch clients are scoped to the execution
+# context, ie: to the thread, or to the greenlet on gevent workers
+db_sessions = contextvars.ContextVar("morpfw.db_sessions", default=None)
+es_clients = contextvars.ContextVar("morpfw.es_clients", default=None)
+
+#: methods of requests whose storage reads may be served by read replicas
+REPLICA_READ_METHODS = ["GET", "HEAD"]
+
+# set in the environ of requests (and the beaker session) that wrote to
+# a primary database
+WRITTEN_KEY = "morpfw.sqlstorage.written"
+LAST_WRITE_KEY = "morpfw.sqlstorage.last_write"
+WRITE_TRANSACTION_KEY = "morpfw.sqlstorage.write_transaction"
+
+# set to False in the environ of requests whose reads must not be served by
+# read replicas. ``make_environ`` sets it for requests that are not served
+# over WSGI (cli, celery tasks, cron jobs), which commonly modify what they
+# read
+REPLICA_READS_KEY = "morpfw.sqlstorage.replica_reads"
 
 default_settings = open(
     os.path.join(os.path.dirname(__file__), "default_settings.yml")
@@ -81,7 +109,6 @@ class Request(BaseRequest):
         return super().host_url
 
     def __enter__(self):
-        self._cm_cwd = os.getcwd()
         transaction.begin()
         self.savepoint = transaction.savepoint()
 
@@ -94,9 +121,19 @@ class Request(BaseRequest):
 
     def commit(self):
         transaction.commit()
-        if os.path.exists(self._cm_cwd):
-            os.chdir(self._cm_cwd)
-        self.dispose_db_engines()
+
+    def get_home_dir(self):
+        """Home directory of the application, from the environment variable
+        named by ``app.home_env``, defaulting to the current directory"""
+        home_env = self.app.home_env
+        if home_env not in os.environ:
+            if "MORP_WORKDIR" in os.environ:
+                warnings.warn(
+                    "MORP_WORKDIR environment is deprecated, use %s" % home_env,
+                    DeprecationWarning,
+                )
+                home_env = "MORP_WORKDIR"
+        return os.environ.get(home_env, os.getcwd())
 
     def timezone(self):
         cache_key = "morpfw.cache.timezone"
@@ -184,79 +221,201 @@ class Request(BaseRequest):
         return self.app.resolve_metalink(link, self)
 
 
+def absolute_db_url(dburl, home_dir):
+    """``dburl`` with relative sqlite database paths resolved against
+    ``home_dir``, so that engines do not depend on the current directory"""
+    url = make_url(dburl)
+    database = url.database
+    if not url.drivername.startswith("sqlite") or not database:
+        return dburl
+    if database == ":memory:" or database.startswith("file:"):
+        return dburl
+    if os.path.isabs(database):
+        return dburl
+    url = url.set(database=os.path.join(home_dir, database))
+    return url.render_as_string(hide_password=False)
+
+
+def _mark_written(session):
+    environ = session.info.get("morpfw.environ", None)
+    if environ is None:
+        return
+    environ[WRITTEN_KEY] = True
+    beaker_session = environ.get("beaker.session", None)
+    if beaker_session is None:
+        return
+    # the beaker session is stamped and saved once, when the transaction
+    # that wrote commits
+    txn = transaction.get()
+    if environ.get(WRITE_TRANSACTION_KEY, None) is not txn:
+        environ[WRITE_TRANSACTION_KEY] = txn
+        txn.addAfterCommitHook(_save_last_write, args=(beaker_session,))
+
+
+def _save_last_write(success, beaker_session):
+    if success:
+        beaker_session[LAST_WRITE_KEY] = time.time()
+        beaker_session.save()
+
+
+def _after_flush(session, flush_context):
+    _mark_written(session)
+
+
+def _is_dml(orm_execute_state):
+    return (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    )
+
+
+def _do_orm_execute(orm_execute_state):
+    if _is_dml(orm_execute_state):
+        _mark_written(orm_execute_state.session)
+
+
+def _refuse_flush(session, flush_context, instances):
+    # replica sessions are read-only, writes go through the primary session
+    if (
+        session.new
+        or session.deleted
+        or any(session.is_modified(obj) for obj in session.dirty)
+    ):
+        raise ReadOnlySessionError("Read replica sessions can not be written to")
+
+
+def _refuse_execute(orm_execute_state):
+    if _is_dml(orm_execute_state):
+        raise ReadOnlySessionError("Read replica sessions can not be written to")
+
+
 class DBSessionRequest(Request):
+    def commit(self):
+        super().commit()
+        # closing the sessions returns the connections to the pool
+        self.clear_db_session()
+
     @property
     def _db_session(self):
-        sessions = getattr(threadlocal, "mfw_db_sessions", None)
+        sessions = db_sessions.get()
         if sessions is None:
             sessions = {}
-            threadlocal.mfw_db_sessions = sessions
+            db_sessions.set(sessions)
 
-        return threadlocal.mfw_db_sessions
-
-    @property
-    def _db_engines(self):
-        engines = getattr(threadlocal, "mfw_db_engines", None)
-        if engines is None:
-            engines = {}
-            threadlocal.mfw_db_engines = engines
-
-        return threadlocal.mfw_db_engines
+        return sessions
 
     @property
     def db_session(self) -> sqlalchemy.orm.Session:
         return self.get_db_session("default")
 
-    def get_db_engine(self, name="default"):
-        # FIXME: Allow safe pooling, especially on the
-        # worker side. Currently NullPool is used
-        # to force worker to clean up connections
-        # upon completion of tasks
-        existing = self._db_engines.get(name, None)
-        if existing:
-            return existing
+    def get_db_url(self, name="default"):
+        if "://" in name:
+            return absolute_db_url(name, self.get_home_dir())
 
-        settings = self.app._raw_settings
-        config = settings["configuration"]
+        config = self.app._raw_settings["configuration"]
+        key = "morpfw.storage.sqlstorage.dburl"
+        if name != "default":
+            key = "morpfw.storage.sqlstorage.dburl.{}".format(name)
 
-        home_env = self.app.home_env
-        if home_env not in os.environ:
-            if "MORP_WORKDIR" in os.environ:
-                warnings.warn(
-                    "MORP_WORKDIR environment is deprecated, use %s" % home_env,
-                    DeprecationWarning,
-                )
-                home_env = "MORP_WORKDIR"
+        if not config.get(key, None):
+            raise ConfigurationError("{} not found".format(key))
 
-        cwd = os.environ.get(home_env, os.getcwd())
-        os.chdir(cwd)
+        return absolute_db_url(config[key], self.get_home_dir())
 
-        key = "morpfw.storage.sqlstorage.dburl"
-        if "://" in name:
-            dburl = name
-        else:
-            if name != "default":
-                key = "morpfw.storage.sqlstorage.dburl.{}".format(name)
-
-            if not config.get(key, None):
-                raise ConfigurationError("{} not found".format(key))
+    def get_db_pool_options(self, name="default"):
+        config = self.app._raw_settings["configuration"]
+        key = "morpfw.storage.sqlstorage.pool"
+        options = dict(config.get(key, None) or {})
+        if name != "default" and "://" not in name:
+            key = "morpfw.storage.sqlstorage.pool.{}".format(name)
+            options.update(config.get(key, None) or {})
+        return options
 
-            dburl = config[key]
-        engine = sqlalchemy.create_engine(
-            dburl, poolclass=NullPool, connect_args={"options": "-c timezone=utc"}
+    def get_db_engine(self, name="default"):
+        dburl = self.get_db_url(name)
+        return engine_registry.get_engine(
+            dburl,
+            connect_args={"options": "-c timezone=utc"},
+            **self.get_db_pool_options(name)
         )
 
-        self._db_engines[name] = engine
-        return engine
-
     def get_db_session(self, name="default"):
 
         if self._db_session.get(name, None) is None:
             engine = self.get_db_engine(name)
             Session = sessionmaker(bind=engine)
             register_session(Session)
+            event.listen(Session, "after_flush", _after_flush)
+            event.listen(Session, "do_orm_execute", _do_orm_execute)
             self._db_session[name] = scoped_session(Session)
-        return self._db_session[name]
+        session = self._db_session[name]
+        if self.get_db_replica_urls(name):
+            # writes are tracked on the request using the session, to
+            # route its reads (see get_db_read_session)
+            session.info["morpfw.environ"] = self.environ
+        return session
+
+    def get_db_replica_urls(self, name="default"):
+        """URLs of read replicas of database ``name``, configured through
+        ``morpfw.storage.sqlstorage.replicas[.<name>]``"""
+        if "://" in name:
+            return []
+        config = self.app._raw_settings["configuration"]
+        key = "morpfw.storage.sqlstorage.replicas"
+        if name != "default":
+            key = "morpfw.storage.sqlstorage.replicas.{}".format(name)
+        return config.get(key, None) or []
+
+    def db_written(self):
+        """
+        Whether reads of this request should see writes made to the
+        primary databases: the request has written to them, or the beaker
+        session did within ``morpfw.storage.sqlstorage.replica_stickiness``
+        seconds
+        """
+        if self.environ.get(WRITTEN_KEY, False):
+            return True
+        beaker_session = self.environ.get("beaker.session", None)
+        if beaker_session is None:
+            return False
+        last_write = beaker_session.get(LAST_WRITE_KEY, None)
+        if last_write is None:
+            return False
+        stickiness = self.app.get_config(
+            "morpfw.storage.sqlstorage.replica_stickiness", 5
+        )
+        return time.time() - last_write < stickiness
+
+    def get_db_read_session(self, name="default"):
+        """
+        Session for reads of database ``name``. Reads of GET and HEAD
+        requests are served by one of its read replicas (the same for the
+        whole request), unless ``db_written``. Other requests, requests
+        with replica reads disabled in the environ (eg: those of
+        ``request_factory``), and databases without replicas, read from the
+        primary session
+        """
+        replicas = self.get_db_replica_urls(name)
+        if not replicas or self.method not in REPLICA_READ_METHODS:
+            return self.get_db_session(name)
+        if not self.environ.get(REPLICA_READS_KEY, True):
+            return self.get_db_session(name)
+        if self.db_written():
+            return self.get_db_session(name)
+        key = "morpfw.sqlstorage.replica.{}".format(name)
+        url = self.environ.get(key, None)
+        if url is None:
+            url = random.choice(replicas)
+            self.environ[key] = url
+        if self._db_session.get(url, None) is None:
+            engine = self.get_db_engine(url)
+            Session = sessionmaker(bind=engine)
+            register_session(Session)
+            event.listen(Session, "before_flush", _refuse_flush)
+            event.listen(Session, "do_orm_execute", _refuse_execute)
+            self._db_session[url] = scoped_session(Session)
+        return self._db_session[url]
 
     def clear_db_session(self, name=None):
         if name:
@@ -282,34 +441,26 @@ class DBSessionRequest(Request):
         self.environ["morpfw.memoize"] = {}  # noqa
 
     def dispose_db_engines(self, name=None):
+        """Close sessions and dispose the pooled engines, closing
+        all idle connections of the pool"""
         if name:
-            if name in self._db_engines.keys():
-                if name in self._db_session.keys():
-                    self._db_session[name].expunge_all()
-                    self._db_session[name].close()
-                    del self._db_session[name]
-                self._db_engines[name].dispose()
-                del self._db_engines[name]
+            self.clear_db_session(name)
+            engine_registry.dispose(self.get_db_url(name))
         else:
-            for k in list(self._db_engines.keys()):
-                if k in self._db_session.keys():
-                    self._db_session[k].expunge_all()
-                    self._db_session[k].close()
-                    del self._db_session[k]
-                self._db_engines[k].dispose()
-                del self._db_engines[k]
+            self.clear_db_session()
+            engine_registry.dispose()
         self.environ["morpfw.memoize"] = {}  # noqa
 
 
 class ESCapableRequest(DBSessionRequest):
     @property
     def _es_client(self):
-        clients = getattr(threadlocal, "mfw_es_clients", None)
+        clients = es_clients.get()
         if clients is None:
             clients = {}
-            threadlocal.mfw_es_clients = clients
+            es_clients.set(clients)
 
-        return threadlocal.mfw_es_clients
+        return clients
 
     def get_es_client(self, name="default"):
 
@@ -330,21 +481,33 @@ class ESCapableRequest(DBSessionRequest):
         return self._es_client[name]
 
 
+def reset_after_fork():
+    """Drop database sessions and elasticsearch clients inherited from the
+    parent process, their connections are still in use by the parent"""
+    db_sessions.set(None)
+    es_clients.set(None)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+
 COMMITTED_APPS = []
 
 
-def request_factory(
-    settings: dict,
-    extra_environ: typing.Optional[dict] = None,
-    scan: bool = True,
-    app_factory_opts: typing.Optional[dict] = None,
-    path: str = "/",
-    request_method: str = "GET",
-):
-    app_factory_opts = app_factory_opts or {}
-    app_factory_opts["scan"] = scan
-    extra_environ = extra_environ or {}
+#: applications built by ``request_factory``, by settings fingerprint
+APP_CACHE: dict = {}
+_app_cache_lock = threading.RLock()
+
 
+def settings_fingerprint(settings: dict, **opts) -> str:
+    """Fingerprint of ``settings`` and app factory ``opts``"""
+    data = json.dumps([settings, opts], sort_keys=True, default=repr)
+    return hashlib.sha1(data.encode("utf8")).hexdigest()
+
+
+def merge_settings(settings: dict) -> dict:
+    """``settings`` over a copy of the default settings"""
     s = copy.deepcopy(default_settings)
     for k in settings.keys():
         if k in s.keys():
@@ -352,9 +515,10 @@ def request_factory(
                 s[k][j] = v
         else:
             s[k] = settings[k]
+    return s
 
-    settings = s
 
+def _build_app(settings: dict, app_factory_opts: dict):
     if "application" not in settings:
         raise KeyError("'application' section is required in settings")
     if "factory" not in settings["application"]:
@@ -368,22 +532,7 @@ def request_factory(
 
     app_path = settings["application"]["class"]
     mod, clsname = app_path.split(":")
-    app_cls = getattr(importlib.import_module(mod), clsname)
-
-    server_url = settings.get("server", {}).get("server_url", "http://localhost")
-    parsed = urlparse(server_url)
-    if "?" not in path:
-        path += "?"
-    path_info, qs = path.split("?")
-    environ = {
-        "PATH_INFO": path,
-        "QUERY_STRING": qs,
-        "wsgi.url_scheme": parsed.scheme,
-        "SERVER_PROTOCOL": "HTTP/1.1",
-        "HTTP_HOST": parsed.netloc,
-        "REQUEST_METHOD": request_method,
-    }
-    environ.update(extra_environ)
+    importlib.import_module(mod)
 
     sys_environ = settings.get("environment", {}) or {}
     for k, v in sys_environ.items():
@@ -392,6 +541,7 @@ def request_factory(
 
     app = factory(settings, **app_factory_opts)
     wrapped_app = app
+    environ = make_environ(settings)
     app(environ, lambda *args: (lambda chunk: None))
     while not isinstance(app, morepath.App):
         wrapped = getattr(app, "app", None)
@@ -399,5 +549,107 @@ def request_factory(
             app = wrapped
         else:
             raise ValueError("Unable to locate app object from middleware")
+    return wrapped_app, app
+
+
+def middleware_environ(wsgi_app, environ):
+    """Set what the beaker middlewares of ``wsgi_app`` provide to requests
+    in ``environ``, without going through the middlewares"""
+    app = wsgi_app
+    while not isinstance(app, morepath.App):
+        if isinstance(app, BeakerSessionMiddleware):
+            environ[app.environ_key] = SessionObject(environ, **app.options)
+            environ["beaker.get_session"] = app._get_session
+        elif isinstance(app, BeakerCacheMiddleware):
+            environ[app.environ_key] = app.cache_manager
+        app = app.app
+    return environ
+
+
+def get_app(
+    settings: dict,
+    scan: bool = True,
+    app_factory_opts: typing.Optional[dict] = None,
+    cache: bool = True,
+):
+    """
+    Application built from ``settings``, as a ``(wsgi_app, app, settings)``
+    tuple where ``app`` is the morepath application wrapped by the
+    middlewares of ``wsgi_app``, and ``settings`` are merged with the
+    defaults.
+
+    Applications are built once per process for the same settings and
+    options, unless ``cache`` is false
+    """
+    app_factory_opts = dict(app_factory_opts or {})
+    app_factory_opts["scan"] = scan
+    key = settings_fingerprint(settings, **app_factory_opts)
+    if cache:
+        cached = APP_CACHE.get(key, None)
+        if cached is not None:
+            return cached
+    with _app_cache_lock:
+        if cache and key in APP_CACHE:
+            return APP_CACHE[key]
+        merged = merge_settings(settings)
+        wrapped_app, app = _build_app(merged, app_factory_opts)
+        result = (wrapped_app, app, merged)
+        if cache:
+            APP_CACHE[key] = result
+    return result
+
+
+def clear_app_cache():
+    APP_CACHE.clear()
+
+
+def make_environ(
+    settings: dict,
+    path: str = "/",
+    request_method: str = "GET",
+    extra_environ: typing.Optional[dict] = None,
+) -> dict:
+    """WSGI environ of a request to ``path`` on the ``server_url`` of
+    ``settings``. Reads of the request are served by the primary databases,
+    unless ``extra_environ`` enables replica reads"""
+    server_url = settings.get("server", {}).get("server_url", "http://localhost")
+    parsed = urlparse(server_url)
+    if "?" not in path:
+        path += "?"
+    path_info, qs = path.split("?")
+    environ = {
+        "PATH_INFO": path_info,
+        "QUERY_STRING": qs,
+        "wsgi.url_scheme": parsed.scheme,
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "HTTP_HOST": parsed.netloc,
+        "REQUEST_METHOD": request_method,
+        REPLICA_READS_KEY: False,
+    }
+    environ.update(extra_environ or {})
+    return environ
+
+
+def request_factory(
+    settings: dict,
+    extra_environ: typing.Optional[dict] = None,
+    scan: bool = True,
+    app_factory_opts: typing.Optional[dict] = None,
+    path: str = "/",
+    request_method: str = "GET",
+    cache: bool = True,
+):
+    """
+    New request on the application built from ``settings``. The
+    application is built on the first call and reused by later calls with
+    the same settings (see ``get_app``)
+    """
+    wrapped_app, app, settings = get_app(
+        settings, scan=scan, app_factory_opts=app_factory_opts, cache=cache
+    )
+    environ = make_environ(
+        settings, path=path, request_method=request_method, extra_environ=extra_environ
+    )
+    middleware_environ(wrapped_app, environ)
     environ["morpfw.wsgi.app"] = wrapped_app
     return app.request_class(app=app, environ=environ)
@@ -0,0 +1,70 @@
+"""
+Serialization benchmark of ``SQLAlchemyModelProvider``: search, field
+access, ``as_dict`` and ``as_json`` of 10k rows of the test page type.
+
+Runs against the database of the settings file given as argument, by
+default the PostgreSQL test database of ``test_sqlstorage-settings.yml``.
+Rows are created in a transaction that is aborted at the end::
+
+    python -m morpfw.tests.bench.bench_serialization [settings.yml] [rows]
+"""
+import os
+import sys
+import time
+
+import transaction
+
+from ..common import get_client, make_request
+from ..crud_test.test_sqlstorage import Base, collection_factory
+
+SETTINGS = os.path.join(
+    os.path.dirname(__file__), "..", "crud_test", "test_sqlstorage-settings.yml"
+)
+
+
+def best_of(func, repeat=3):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(settings=SETTINGS, rows=10000):
+    c = get_client(settings)
+    request = make_request(c.app)
+    Base.metadata.create_all(bind=request.db_session.bind)
+    col = collection_factory(request)
+    try:
+        col.create_many(
+            [{"title": "t%d" % i, "body": "b", "value": i} for i in range(rows)]
+        )
+        request.db_session.flush()
+        objs = col.search(limit=rows)
+        assert len(objs) == rows
+
+        results = [
+            ("search", best_of(lambda: col.search(limit=rows), repeat=1)),
+            (
+                "field access",
+                best_of(lambda: [[o.data[k] for k in o.data.keys()] for o in objs]),
+            ),
+            ("as_dict", best_of(lambda: [o.data.as_dict() for o in objs])),
+            ("as_json", best_of(lambda: [o.data.as_json() for o in objs])),
+        ]
+    finally:
+        transaction.abort()
+
+    for name, elapsed in results:
+        print("%-14s %8.3fs" % (name, elapsed))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        settings=args[0] if args else SETTINGS,
+        rows=int(args[1]) if len(args) > 1 else 10000,
+    )
@@ -11,6 +11,7 @@ import jsl
 import morepath
 import morpfw.crud.signals as signals
 import pytz
+import rulez
 import yaml
 from more.basicauth import BasicAuthIdentityPolicy
 from morpfw.app import BaseApp
@@ -174,10 +175,57 @@ def get_object_by_uuid(context, request):
     return context.get_by_uuid(uuid).json()
 
 
+@App.json(model=NamedObjectCollection, name="create_many", request_method="POST")
+def create_many_objects(context, request):
+    objs = context.create_many(request.json, batch_size=2)
+    return {"data": [o.json()["data"] for o in objs]}
+
+
+@App.json(model=NamedObjectCollection, name="update_where", request_method="POST")
+def update_where_objects(context, request):
+    return {
+        "data": context.update_where(request.json["query"], request.json["values"])
+    }
+
+
+@App.json(model=NamedObjectCollection, name="delete_where", request_method="POST")
+def delete_where_objects(context, request):
+    return {"data": context.delete_where(request.json["query"])}
+
+
+@App.json(model=NamedObjectCollection, name="count")
+def count_objects(context, request):
+    query = None
+    if request.GET.get("q"):
+        query = context.searchprovider().parse_query(request.GET["q"])
+    result = {}
+    for strategy in ["exact", "estimate", "cached"]:
+        count = context.count(query, secure=True, strategy=strategy)
+        result[strategy] = {"count": count, "exact": count.exact}
+    result["default"] = context.count()
+    return result
+
+
 class NamedObjectModel(Model):
     schema = NamedObjectSchema
 
 
+@App.permission_rule(model=NamedObjectModel, permission=crudperm.View)
+def allow_named_object_view(identity, context, permission):
+    return context["body"] != "secret"
+
+
+@App.permission_filter(model=NamedObjectModel, permission=crudperm.View)
+def filter_named_object_view(identity, collection, permission):
+    return rulez.field["body"] != "secret"
+
+
+@App.subscribe(signal=signals.OBJECTS_CREATED, model=NamedObjectCollection)
+def named_objects_created(app, request, batch, signal):
+    for obj in batch:
+        obj.data["body"] = "%s (%s)" % (obj.data["body"], len(batch))
+
+
 class BlobObjectSchema(Schema):
     pass
 
@@ -313,6 +361,22 @@ def run_jslcrud_test(c, skip_aggregate=False):
 
     assert r.json["results"] == [["Hello", "World"]]
 
+    r = c.get("/pages/+search", {"fields": "title,value", "q": 'title in ["Hello"]'})
+
+    assert r.json["results"][0]["data"] == {"title": "Hello", "value": None}
+    assert r.json["results"][0]["links"][0]["rel"] == "self"
+
+    r = c.get(
+        "/pages/+search",
+        {"fields": "title", "select": "$.title", "q": 'title in ["Hello"]'},
+    )
+
+    assert r.json["results"] == [["Hello"]]
+
+    r = c.get("/pages/+search", {"fields": "nonexistent"}, expect_errors=True)
+
+    assert r.status_code == 422
+
     r = c.get("/pages/+search", {"order_by": "title"})
 
     assert list([i["data"]["title"] for i in r.json["results"]]) == (
@@ -343,6 +407,28 @@ def run_jslcrud_test(c, skip_aggregate=False):
         ["page%s" % i for i in range(5)]
     )
 
+    # cursor pagination
+    r = c.get("/pages/+search", {"order_by": "title", "limit": 5})
+
+    next_link = [l["href"] for l in r.json["links"] if l["rel"] == "next"][0]
+    r = c.get(next_link)
+
+    assert list([i["data"]["title"] for i in r.json["results"]]) == (
+        ["page%s" % i for i in range(4, 9)]
+    )
+
+    prev_link = [l["href"] for l in r.json["links"] if l["rel"] == "previous"][0]
+    r = c.get(prev_link)
+
+    assert list([i["data"]["title"] for i in r.json["results"]]) == (
+        ["Hello"] + ["page%s" % i for i in range(4)]
+    )
+    assert "previous" not in [l["rel"] for l in r.json.get("links", [])]
+
+    r = c.get("/pages/+search", {"cursor": "invalid"}, expect_errors=True)
+
+    assert r.status_code == 422
+
     # lets create another with wrong invalid values
     r = c.post_json(
         "/pages/", {"title": "page2", "body": 123, "footer": 123}, expect_errors=True
@@ -524,6 +610,147 @@ def run_jslcrud_test(c, skip_aggregate=False):
 
     assert r.status_code == 200
 
+    # bulk creation
+    r = c.post_json(
+        "/named_objects/+create_many",
+        [{"name": "bulk%s" % i, "body": "hello"} for i in range(3)],
+    )
+
+    assert [o["name"] for o in r.json["data"]] == ["bulk0", "bulk1", "bulk2"]
+
+    r = c.get("/named_objects/bulk1")
+
+    assert r.json["data"]["body"] == "hello (2)"
+
+    r = c.get("/named_objects/bulk2")
+
+    assert r.json["data"]["body"] == "hello (1)"
+
+    # duplicates within batch or against existing objects should fail
+    r = c.post_json(
+        "/named_objects/+create_many",
+        [{"name": "bulk3", "body": "hello"}, {"name": "bulk3", "body": "hello"}],
+        expect_errors=True,
+    )
+
+    assert r.status_code == 422
+
+    r = c.post_json(
+        "/named_objects/+create_many",
+        [{"name": "bulk4", "body": "hello"}, {"name": "bulk0", "body": "hello"}],
+        expect_errors=True,
+    )
+
+    assert r.status_code == 422
+
+    # set-based update and delete
+    r = c.get("/named_objects/bulk0")
+    modified = r.json["data"]["modified"]
+
+    bulk01 = {"field": "name", "operator": "in", "value": ["bulk0", "bulk1"]}
+    r = c.post_json(
+        "/named_objects/+update_where",
+        {"query": bulk01, "values": {"body": "updated"}},
+    )
+
+    assert list(sorted(r.json["data"])) == ["bulk0", "bulk1"]
+
+    r = c.get("/named_objects/bulk0")
+
+    assert r.json["data"]["body"] == "updated"
+    assert r.json["data"]["modified"] > modified
+
+    r = c.get("/named_objects/bulk2")
+
+    assert r.json["data"]["body"] == "hello (1)"
+
+    r = c.post_json(
+        "/named_objects/+update_where",
+        {"query": bulk01, "values": {"unknown": "updated"}},
+        expect_errors=True,
+    )
+
+    assert r.status_code == 422
+
+    r = c.post_json(
+        "/named_objects/+delete_where",
+        {"query": {"field": "name", "operator": "==", "value": "bulk2"}},
+    )
+
+    assert r.json["data"] == ["bulk2"]
+
+    r = c.post_json(
+        "/named_objects/+delete_where", {"query": None}, expect_errors=True
+    )
+
+    assert r.status_code == 422
+
+    r = c.get("/named_objects/bulk2", expect_errors=True)
+
+    assert r.status_code == 404
+
+    # permission filter is applied on secure search
+    r = c.post_json("/named_objects/", {"name": "secret1", "body": "secret"})
+    r = c.get("/named_objects/+search?limit=2")
+
+    assert len(r.json["results"]) == 2
+    names = [o["data"]["name"] for o in r.json["results"]]
+    assert "secret1" not in names
+
+    r = c.get("/named_objects/+search")
+
+    names = [o["data"]["name"] for o in r.json["results"]]
+    assert "secret1" not in names
+    assert "bulk0" in names
+
+    r = c.get("/named_objects/+search", {"fields": "name", "order_by": "name"})
+
+    assert r.json["results"][0]["data"] == {"name": "bulk0"}
+
+    # streamed search
+    r = c.get(
+        "/named_objects/+search",
+        {"fields": "name", "order_by": "name"},
+        headers={"Accept": "application/x-ndjson"},
+    )
+
+    assert r.headers["Content-Type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    names = [o["data"]["name"] for o in lines]
+    assert names[0] == "bulk0"
+    assert "secret1" not in names
+    assert len(names) == len(set(names))
+
+    # counting strategies
+    r = c.get("/named_objects/+count", {"q": 'name in ["bulk0", "bulk1", "secret1"]'})
+
+    assert r.json["exact"] == {"count": 2, "exact": True}
+    assert r.json["cached"] == {"count": 2, "exact": True}
+    assert r.json["estimate"]["count"] > 0
+    assert r.json["default"] == len(names) + 1
+
+    # export
+    r = c.get(
+        "/named_objects/+export",
+        {"format": "csv", "fields": "name,body", "order_by": "name"},
+    )
+
+    assert r.headers["Content-Type"] == "text/csv"
+    rows = r.text.splitlines()
+    assert rows[0] == "name,body"
+    assert rows[1].startswith("bulk0,")
+    assert len(rows) == len(names) + 1
+
+    r = c.get("/named_objects/+export", {"q": 'name=="bulk0"'})
+
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert len(lines) == 1
+    assert lines[0]["name"] == "bulk0"
+
+    r = c.get("/named_objects/+export", {"format": "xml"}, expect_errors=True)
+
+    assert r.status_code == 422
+
     # blob upload test
 
     r = c.post_json("/blob_objects", {})
@@ -1,13 +1,25 @@
+import asyncio
+import copy
+import io
 import os
+from datetime import date, datetime
 
 import jsl
 import morpfw.crud.signals as signals
+import pytest
+import pytz
+import rulez
 from more.basicauth import BasicAuthIdentityPolicy
 from more.transaction import TransactionApp
+from morpfw.cli.cli import load_settings
 from morpfw.crud.blobstorage.fsblobstorage import FSBlobStorage
+from morpfw.crud.errors import UnprocessableError
+from morpfw.crud.export import iter_export
+from morpfw.crud.storage.asyncstorage import AsyncStorage
 from morpfw.crud.storage.memorystorage import MemoryStorage
+from morpfw.request import request_factory
 
-from ..common import get_client
+from ..common import get_client, make_request
 from .crud_common import FSBLOB_DIR
 from .crud_common import App as BaseApp
 from .crud_common import (
@@ -121,3 +133,109 @@ def test_memorystorage():
     config = os.path.join(os.path.dirname(__file__), "test_memorystorage-settings.yml")
     client = get_client(config)
     run_jslcrud_test(client, skip_aggregate=True)
+
+
+def test_upsert():
+    config = os.path.join(os.path.dirname(__file__), "test_memorystorage-settings.yml")
+    client = get_client(config)
+    request = make_request(client.app)
+    col = namedobject_collection_factory(request)
+
+    obj = col.upsert({"name": "upsert1", "body": "first"}, conflict_fields=["name"])
+    assert obj["body"] == "first"
+
+    updated = col.upsert(
+        {"name": "upsert1", "body": "second"}, conflict_fields=["name"]
+    )
+    assert updated.uuid == obj.uuid
+    assert updated["body"] == "second"
+    assert len(col.search(rulez.field["name"] == "upsert1")) == 1
+
+    try:
+        col.upsert({"name": "upsert2"})
+    except UnprocessableError:
+        pass
+    else:
+        assert False, "UnprocessableError not raised"
+
+
+def test_avro_export():
+    fastavro = pytest.importorskip("fastavro")
+    config = os.path.join(os.path.dirname(__file__), "test_memorystorage-settings.yml")
+    client = get_client(config)
+    request = make_request(client.app)
+    col = collection_factory(request)
+    epoch = date(1970, 1, 1)
+    publish_datetime = datetime(2019, 1, 1, 1, 1, tzinfo=pytz.UTC)
+    page = col.create(
+        {
+            "title": "avro1",
+            "body": "full",
+            "publish_date": (date(2019, 1, 1) - epoch).days,
+            "publish_datetime": int(publish_datetime.timestamp() * 1000),
+            "value": 3,
+        }
+    )
+    page.data["xattrs"] = {"note": "x", "tags": ["a", "b"]}
+    col.create({"title": "avro2", "body": "empty"})
+
+    objs = col.search(rulez.field["title"].in_(["avro1", "avro2"]))
+    objs = sorted(objs, key=lambda o: o["title"])
+    data = b"".join(iter_export(col, objs, "avro", chunk_size=1))
+    reader = fastavro.reader(io.BytesIO(data))
+    types = {f["name"]: f["type"] for f in reader.writer_schema["fields"]}
+    assert types["title"] == "string"
+    assert types["value"] == ["null", "long"]
+    assert types["publish_date"] == ["null", {"type": "int", "logicalType": "date"}]
+    assert types["publish_datetime"][1]["logicalType"] == "timestamp-millis"
+    assert types["xattrs"] == ["null", {"type": "map", "values": "string"}]
+
+    full, empty = list(reader)
+    assert full["title"] == "avro1"
+    assert full["publish_date"] == date(2019, 1, 1)
+    assert full["publish_datetime"] == publish_datetime
+    assert full["value"] == 3
+    assert full["xattrs"] == {"note": "x", "tags": '["a", "b"]'}
+    assert full["created"].tzinfo is not None
+    assert empty["title"] == "avro2"
+    assert empty["publish_date"] is None
+    assert empty["publish_datetime"] is None
+    assert empty["value"] is None
+    assert empty["deleted"] is None
+
+
+def test_asyncstorage():
+    config = os.path.join(os.path.dirname(__file__), "test_memorystorage-settings.yml")
+    client = get_client(config)
+    request = make_request(client.app)
+    col = namedobject_collection_factory(request)
+
+    async def run():
+        async with AsyncStorage(col.storage) as storage:
+            data = col.set_create_defaults({"name": "async1", "body": "hello"})
+            obj = await storage.create(col, data)
+            await storage.update(col, obj.identifier, {"body": "world"})
+            found = await storage.search(col, rulez.field["name"] == "async1")
+            return storage, obj, found, await storage.get(col, "async1")
+
+    storage, obj, found, fetched = asyncio.run(run())
+    assert [o.identifier for o in found] == [obj.identifier]
+    assert fetched["body"] == "world"
+    try:
+        storage.executor.submit(print)
+    except RuntimeError:
+        pass
+    else:
+        assert False, "executor was not shut down"
+
+
+def test_request_factory_cache():
+    config = os.path.join(os.path.dirname(__file__), "test_memorystorage-settings.yml")
+    settings = load_settings(config)
+    request = request_factory(settings, scan=False)
+    other = request_factory(copy.deepcopy(settings), path="/pages?a=1", scan=False)
+    assert other.app is request.app
+    assert other.environ is not request.environ
+    assert other.path == "/pages"
+    assert other.GET["a"] == "1"
+    assert request_factory(settings, scan=False, cache=False).app is not request.app
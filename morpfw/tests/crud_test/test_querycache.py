@@ -0,0 +1,72 @@
+import rulez
+import sqlalchemy as sa
+from morpfw.crud import querycache
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+
+class Page(Base):
+
+    __tablename__ = "test_querycache_page"
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    title = sa.Column(sa.String(length=1024))
+    value = sa.Column(sa.Integer)
+    deleted = sa.Column(sa.DateTime(timezone=True))
+
+
+def compile_params(query):
+    expr = querycache.sql_condition(query, Page)
+    compiled = expr.compile(dialect=postgresql.dialect())
+    return str(compiled), compiled.params
+
+
+def test_sql_condition_cache():
+    querycache.condition_cache.clear()
+
+    def query(title, values):
+        return rulez.and_(
+            rulez.field["title"] == title,
+            rulez.field["value"].in_(values),
+            {"field": "title", "operator": "~", "value": title},
+            rulez.field["deleted"] == None,
+        )
+
+    sql1, params1 = compile_params(query("hello", [1, 2]))
+    assert len(querycache.condition_cache) == 1
+    sql2, params2 = compile_params(query("world", [3]))
+    assert len(querycache.condition_cache) == 1
+
+    assert sql1 == sql2
+    assert "deleted IS NULL" in sql1
+    assert sorted(params1.values(), key=str) == ["%hello%", [1, 2], "hello"]
+    assert sorted(params2.values(), key=str) == ["%world%", [3], "world"]
+
+    # queries of another shape are compiled separately
+    compile_params(rulez.field["title"] == "hello")
+    assert len(querycache.condition_cache) == 2
+
+
+def test_validate_condition_cache():
+    querycache.condition_cache.clear()
+    querycache.validate_condition(rulez.field["title"] == "a", ["=="])
+    querycache.validate_condition(rulez.field["title"] == "b", ["=="])
+    assert len(querycache.condition_cache) == 1
+
+    try:
+        querycache.validate_condition(rulez.field["title"] == "a", ["in"])
+    except rulez.OperatorNotAllowedError:
+        pass
+    else:
+        assert False, "OperatorNotAllowedError not raised"
+
+
+def test_parse_dsl_cache():
+    querycache.dsl_cache.clear()
+    q1 = querycache.parse_dsl('title == "hello"')
+    q1["value"] = "changed"
+    q2 = querycache.parse_dsl('title == "hello"')
+    assert q2 == rulez.parse_dsl('title == "hello"')
+    assert len(querycache.dsl_cache) == 1
@@ -0,0 +1,207 @@
+import os
+import typing
+from dataclasses import dataclass
+
+from morpfw.crud import signals
+from morpfw.crud.errors import UnprocessableError
+from morpfw.crud.model import Collection, Model
+from morpfw.crud.relationship import BackReference, Reference
+from morpfw.crud.schema import Schema
+from morpfw.crud.storage.memorystorage import MemoryStorage
+
+from ..common import get_client, make_request
+from .crud_common import App as BaseApp
+
+
+class App(BaseApp):
+    pass
+
+
+@dataclass
+class ParentSchema(Schema):
+
+    title: typing.Optional[str] = None
+
+    __backreferences__ = [
+        BackReference("children", "tests.relchild", "parent_uuid")
+    ]  # type: ignore
+
+
+@dataclass
+class ChildSchema(Schema):
+
+    title: typing.Optional[str] = None
+    parent_uuid: typing.Optional[str] = None
+    parent_child_uuid: typing.Optional[str] = None
+
+    __references__ = [
+        Reference("parent_uuid", "tests.relparent"),
+        Reference("parent_child_uuid", "tests.relchild"),
+    ]  # type: ignore
+
+    __backreferences__ = [
+        BackReference("subchildren", "tests.relchild", "parent_child_uuid")
+    ]  # type: ignore
+
+
+class ParentCollection(Collection):
+    schema = ParentSchema
+
+
+class ParentModel(Model):
+    schema = ParentSchema
+
+
+class ChildCollection(Collection):
+    schema = ChildSchema
+
+
+class ChildModel(Model):
+    schema = ChildSchema
+
+
+queries = []
+
+
+class ParentStorage(MemoryStorage):
+    model = ParentModel
+
+    def search(self, collection, query=None, *args, **kwargs):
+        queries.append(("parent", query))
+        return super().search(collection, query, *args, **kwargs)
+
+
+class ChildStorage(MemoryStorage):
+    model = ChildModel
+
+    def search(self, collection, query=None, *args, **kwargs):
+        queries.append(("child", query))
+        return super().search(collection, query, *args, **kwargs)
+
+
+@App.path(model=ParentCollection, path="relparents")
+def parent_collection_factory(request):
+    return ParentCollection(request, ParentStorage(request))
+
+
+@App.path(model=ChildCollection, path="relchildren")
+def child_collection_factory(request):
+    return ChildCollection(request, ChildStorage(request))
+
+
+@App.typeinfo(name="tests.relparent", schema=ParentSchema)
+def get_parent_typeinfo(request):
+    return {
+        "title": "Parent",
+        "description": "Parent type",
+        "schema": ParentSchema,
+        "collection": ParentCollection,
+        "collection_factory": parent_collection_factory,
+        "model": ParentModel,
+    }
+
+
+@App.typeinfo(name="tests.relchild", schema=ChildSchema)
+def get_child_typeinfo(request):
+    return {
+        "title": "Child",
+        "description": "Child type",
+        "schema": ChildSchema,
+        "collection": ChildCollection,
+        "collection_factory": child_collection_factory,
+        "model": ChildModel,
+    }
+
+
+tobedeleted = []
+
+
+@App.subscribe(signal=signals.OBJECTS_TOBEDELETED, model=ChildCollection)
+def record_tobedeleted(app, request, obj, signal):
+    tobedeleted.append(sorted(o["title"] for o in obj))
+
+
+def test_prefetch():
+    config = os.path.join(os.path.dirname(__file__), "test_relationship-settings.yml")
+    client = get_client(config)
+    request = make_request(client.app)
+    parents = parent_collection_factory(request)
+    children = child_collection_factory(request)
+
+    p1 = parents.create({"title": "p1"})
+    p2 = parents.create({"title": "p2"})
+    parents.create({"title": "p3"})
+    for i in range(5):
+        children.create({"title": "c%d" % i, "parent_uuid": [p1, p2][i % 2].uuid})
+    children.create({"title": "orphan"})
+
+    ref = ChildSchema.__references__[0]
+    bref = ParentSchema.__backreferences__[0]
+
+    del queries[:]
+    objs = children.search(prefetch=["parent_uuid"])
+    assert len(queries) == 2
+    result = {o["title"]: o.resolve_reference(ref) for o in objs if o["parent_uuid"]}
+    assert len(queries) == 2
+    assert result["c0"].uuid == p1.uuid
+    assert result["c1"].uuid == p2.uuid
+
+    del queries[:]
+    objs = parents.search(prefetch=["children"])
+    assert len(queries) == 2
+    result = {o["title"]: o.resolve_backreference(bref) for o in objs}
+    assert len(queries) == 2
+    assert sorted(c["title"] for c in result["p1"]) == ["c0", "c2", "c4"]
+    assert sorted(c["title"] for c in result["p2"]) == ["c1", "c3"]
+    assert result["p3"] == []
+
+    # changed references are resolved again
+    objs = children.search(prefetch=["parent_uuid"])
+    obj = [o for o in objs if o["title"] == "c0"][0]
+    obj["parent_uuid"] = p2.uuid
+    assert obj.resolve_reference(ref).uuid == p2.uuid
+
+    del queries[:]
+    objs = list(children.iter_search(prefetch=["parent_uuid"], batch_size=2))
+    assert len(objs) == 6
+    assert len(queries) == 4
+    assert all(o.resolve_reference(ref) for o in objs if o["parent_uuid"])
+    assert len(queries) == 4
+
+    try:
+        children.search(prefetch=["unknown"])
+    except UnprocessableError:
+        pass
+    else:
+        assert False, "UnprocessableError not raised"
+
+
+def test_cascade_delete():
+    config = os.path.join(os.path.dirname(__file__), "test_relationship-settings.yml")
+    client = get_client(config)
+    request = make_request(client.app)
+    parents = parent_collection_factory(request)
+    children = child_collection_factory(request)
+
+    p1 = parents.create({"title": "cp1"})
+    p2 = parents.create({"title": "cp2"})
+    c1 = children.create({"title": "cc1", "parent_uuid": p1.uuid})
+    c2 = children.create({"title": "cc2", "parent_uuid": p1.uuid})
+    children.create({"title": "cc3", "parent_uuid": p2.uuid})
+    s1 = children.create({"title": "cs1", "parent_child_uuid": c1.uuid})
+    children.create({"title": "cs2", "parent_child_uuid": c2.uuid})
+    children.create({"title": "cs3", "parent_child_uuid": s1.uuid})
+
+    del queries[:]
+    del tobedeleted[:]
+    p1.delete()
+    # one query per level to walk the graph (the last one finding nothing)
+    # and one set-based delete per level
+    assert [q[0] for q in queries] == ["child"] * 7
+    assert tobedeleted == [["cs3"], ["cs1", "cs2"], ["cc1", "cc2"]]
+    titles = [o["title"] for o in children.search()]
+    assert not [t for t in titles if t.startswith("cs")]
+    assert "cc3" in titles
+    assert "cc1" not in titles
+    assert parents.get(p1.uuid) is None
+    assert parents.get(p2.uuid) is not None
@@ -0,0 +1,145 @@
+import typing
+import uuid
+from dataclasses import dataclass, field
+
+import morepath
+import morpfw
+import pytest
+import pytz
+import sqlalchemy as sa
+from morpfw.crud.dataprovider import samodelprovider
+from morpfw.crud.dataprovider.dictprovider import DictProvider
+from morpfw.crud.dataprovider.samodelprovider import (
+    SQLAlchemyModelProvider,
+    get_accessors,
+)
+from morpfw.crud.schema import Schema
+from morpfw.crud.storage.sqlstorage import BaseMixin, SQLStorage
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base(cls=BaseMixin)
+
+
+class Note(Base):
+
+    __tablename__ = "test_samodelprovider_note"
+
+    title = sa.Column(sa.String(length=1024))
+
+
+@dataclass
+class NoteSchema(Schema):
+
+    title: typing.Optional[str] = None
+    # not columns of Note
+    priority: int = 5
+    tags: list = field(default_factory=list)
+
+
+@dataclass
+class OtherNoteSchema(Schema):
+
+    title: typing.Optional[str] = None
+
+
+class App(morpfw.SQLApp):
+    pass
+
+
+class FakeRequest(object):
+    def __init__(self, app=None):
+        self.app = app
+
+    def timezone(self):
+        return pytz.UTC
+
+
+class FakeStorage(object):
+
+    request = FakeRequest()
+
+    def primary_object(self, obj):
+        return obj
+
+
+def test_accessors_cache():
+    accessors = get_accessors(NoteSchema, Note)
+    assert get_accessors(NoteSchema, Note) is accessors
+    assert get_accessors(OtherNoteSchema, Note) is not accessors
+
+    assert accessors.getters["title"] is samodelprovider._get_value
+    assert accessors.getters["created"] is samodelprovider._get_datetime
+    assert accessors.getters["uuid"] is samodelprovider._get_guid
+    assert accessors.getters["xattrs"] is samodelprovider._get_json
+    assert accessors.setters["uuid"] is samodelprovider._set_guid
+    assert "priority" not in accessors.getters
+    assert accessors.defaults["priority"] == (False, 5)
+    assert accessors.defaults["tags"] == (True, list)
+
+    # providers share the accessors of their schema and model
+    provider = SQLAlchemyModelProvider(NoteSchema, Note(), FakeStorage())
+    assert provider.accessors is accessors
+
+
+def test_get():
+    provider = SQLAlchemyModelProvider(NoteSchema, Note(title="hello"), FakeStorage())
+    assert provider["title"] == "hello"
+    assert provider.get("title", "other") == "hello"
+
+    # column values are returned even if empty
+    provider["title"] = None
+    assert provider.get("title", "other") is None
+
+    # fields that are not columns get their schema default, default
+    # factories are called on each get
+    with pytest.raises(KeyError):
+        provider["priority"]
+    assert provider.get("priority") == 5
+    assert provider.get("priority", 1) == 1
+    tags = provider.get("tags")
+    assert tags == []
+    assert provider.get("tags") is not tags
+
+    # unknown fields
+    assert provider.get("missing", None) is None
+    with pytest.raises(KeyError):
+        provider.get("missing")
+
+
+def test_set():
+    note = Note()
+    provider = SQLAlchemyModelProvider(NoteSchema, note, FakeStorage())
+    identifier = uuid.uuid4()
+    provider["uuid"] = identifier.hex
+    assert note.uuid == identifier
+    assert provider["uuid"] == identifier.hex
+
+    provider["xattrs"] = {"a": [1]}
+    xattrs = provider["xattrs"]
+    xattrs["a"].append(2)
+    assert note.xattrs == {"a": [1]}
+
+    # fields that are not columns are not stored
+    provider["priority"] = 1
+    assert provider.get("priority") == 5
+
+
+def test_slots():
+    provider = SQLAlchemyModelProvider(NoteSchema, Note(), FakeStorage())
+    assert not hasattr(provider, "__dict__")
+    with pytest.raises(AttributeError):
+        provider.extra = 1
+
+
+def test_get_dataprovider():
+    morepath.scan(morpfw)
+    App.commit()
+    app = App()
+    storage = SQLStorage(FakeRequest(app))
+
+    provider = app.get_dataprovider(NoteSchema, Note(title="hello"), storage)
+    assert isinstance(provider, SQLAlchemyModelProvider)
+    assert provider["title"] == "hello"
+    provider = app.get_dataprovider(NoteSchema, {"title": "hello"}, storage)
+    assert isinstance(provider, DictProvider)
+    assert provider["title"] == "hello"
@@ -0,0 +1,69 @@
+import typing
+from dataclasses import dataclass, field
+from uuid import uuid4
+
+from inverter import dc2colanderjson
+from morpfw.crud import schemaconv
+
+
+class FakeRequest(object):
+    def __init__(self, name):
+        self.name = name
+
+
+seen = []
+
+
+def check_title(request, schema, field, value, mode=None):
+    seen.append(request.name)
+
+
+@dataclass
+class PageSchema(object):
+
+    title: typing.Optional[str] = field(
+        default=None, metadata={"validators": [check_title]}
+    )
+    uuid: typing.Optional[str] = field(default_factory=lambda: uuid4().hex)
+    tags: typing.Optional[list] = field(default_factory=list)
+
+
+def test_convert_cache():
+    schemaconv.schema_cache.clear()
+    req1 = FakeRequest("req1")
+    req2 = FakeRequest("req2")
+
+    cschema = schemaconv.convert(dc2colanderjson, PageSchema, request=req1)
+    assert len(schemaconv.schema_cache) == 1
+    assert (
+        schemaconv.convert(dc2colanderjson, PageSchema, request=req2) is cschema
+    )
+    assert (
+        schemaconv.convert(
+            dc2colanderjson, PageSchema, request=req2, include_fields=["title"]
+        )
+        is not cschema
+    )
+    assert len(schemaconv.schema_cache) == 2
+
+    # validators receive the request the schema is used with
+    del seen[:]
+    cs1 = schemaconv.bind(cschema, request=req1)
+    schemaconv.deserialize(
+        cschema, {"title": "b", "uuid": "x", "tags": []}, request=req2
+    )
+    cs1.deserialize({"title": "a"})
+    assert seen == ["req2", "req1"]
+    assert schemaconv.current_request() is None
+
+
+def test_default_factories():
+    request = FakeRequest("req")
+    cschema = schemaconv.convert(dc2colanderjson, PageSchema, request=request)
+    data1 = schemaconv.bind(cschema, request=request).deserialize({"title": "a"})
+    data2 = schemaconv.deserialize(cschema, {"title": "a"}, request=request)
+    assert data1["uuid"] != data2["uuid"]
+
+    data1["tags"].append("x")
+    assert data2["tags"] == []
+    assert schemaconv.serialize(cschema, {"title": "a"}, request=request)["tags"] == []
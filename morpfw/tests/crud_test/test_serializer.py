@@ -0,0 +1,108 @@
+import uuid
+from datetime import date, datetime
+
+import pytest
+import pytz
+from inverter import dc2colanderjson
+from inverter.common import dataclass_get_type
+from morpfw.authn.pas.apikey.schema import APIKeySchema
+from morpfw.authn.pas.group.schema import GroupSchema
+from morpfw.authn.pas.user.schema import UserSchema
+from morpfw.crud import schemaconv, serializer
+
+from ..test_sqlapp import PageSchema as SQLPageSchema
+from .crud_common import NamedObjectSchema, ObjectSchema, PageSchema
+from .workflow_common import DeliveryOrderSchema, OrderSchema
+
+SCHEMAS = [
+    PageSchema,
+    ObjectSchema,
+    NamedObjectSchema,
+    OrderSchema,
+    DeliveryOrderSchema,
+    SQLPageSchema,
+    UserSchema,
+    GroupSchema,
+    APIKeySchema,
+]
+
+NOW = datetime(2020, 2, 29, 23, 59, 59, 999999, tzinfo=pytz.UTC)
+TZ = pytz.timezone("Asia/Kuala_Lumpur")
+
+# values of each type, the first value of each is used for fields that
+# are not varied
+VALUES = {
+    str: ["hello", "", None, 123, uuid.UUID(int=1)],
+    int: [42, 0, None, True, 3.9, -(2 ** 70)],
+    float: [1.5, 0.0, None, 3, float("inf")],
+    bool: [True, False, None, 0, "yes"],
+    date: [date(2020, 2, 29), date(1969, 12, 31), None, NOW],
+    datetime: [
+        NOW,
+        NOW.astimezone(TZ),
+        TZ.localize(datetime(1960, 1, 1, 0, 0, 0, 1)),
+        datetime(2020, 1, 1),
+        None,
+    ],
+    dict: [{"a": [1, {"b": None}], "c": "d"}, {}, None, {1: (1, 2)}],
+    list: [[1, "a", {"b": 2}], [], None],
+}
+
+
+def samples(schema):
+    fields = schema.__dataclass_fields__
+    base = {}
+    for name, field in fields.items():
+        values = VALUES.get(dataclass_get_type(field)["type"], [None])
+        base[name] = values[0]
+    yield dict(base)
+    for name, field in fields.items():
+        for value in VALUES.get(dataclass_get_type(field)["type"], [None])[1:]:
+            yield dict(base, **{name: value})
+        # missing values are filled with defaults
+        yield {k: v for k, v in base.items() if k != name}
+
+
+def pin_factories(cschema, data):
+    # default factories return a new value on every call
+    for name in schemaconv._template(cschema).factories.keys():
+        data.setdefault(name, None)
+    return data
+
+
+@pytest.mark.parametrize("schema", SCHEMAS, ids=lambda s: s.__name__)
+@pytest.mark.parametrize(
+    "params",
+    [{}, {"exclude_fields": ["id", "uuid"]}, {"include_fields": ["created"]}],
+    ids=["all", "exclude", "include"],
+)
+def test_serializer_parity(schema, params):
+    cschema = schemaconv.convert(dc2colanderjson, schema, **params)
+    assert serializer.compile_serializer(cschema) is not None
+    count = 0
+    for data in samples(schema):
+        data = pin_factories(cschema, data)
+        try:
+            expected = schemaconv.serialize(cschema, dict(data))
+        except Exception as e:
+            with pytest.raises(type(e)):
+                serializer.serialize(cschema, dict(data))
+            continue
+        result = serializer.serialize(cschema, dict(data))
+        assert result == expected, data
+        assert [type(v) for v in result.values()] == [
+            type(v) for v in expected.values()
+        ]
+        count += 1
+    assert count
+
+
+def test_serializer_copies_values():
+    cschema = schemaconv.convert(dc2colanderjson, ObjectSchema)
+    attrs = {"a": {"b": [1]}}
+    result = serializer.serialize(cschema, {"attrs": attrs})
+    result["attrs"]["a"]["b"].append(2)
+    assert attrs == {"a": {"b": [1]}}
+    assert result["blobs"] == {}
+    assert serializer.serialize(cschema, {})["blobs"] is not result["blobs"]
+    assert serializer.serialize(cschema, {})["uuid"] != result["uuid"]
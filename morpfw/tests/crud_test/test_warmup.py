@@ -0,0 +1,115 @@
+import copy
+import json
+import os
+import threading
+
+import morepath
+import morpfw
+import webob
+from inverter import dc2colanderjson
+from morpfw import warmup, wsgi
+from morpfw.cli import cli
+from morpfw.crud import schemaconv
+from morpfw.crud.storage.memorystorage import MemoryStorage
+from morpfw.request import request_factory
+
+from ..common import get_client
+from .crud_common import App as BaseApp
+from .crud_common import PageCollection, PageModel, PageSchema
+
+
+class App(BaseApp):
+    pass
+
+
+App.hook_readiness_model()
+
+REQUESTED = []
+
+
+class ErrorRoot(object):
+    pass
+
+
+class PageStorage(MemoryStorage):
+    model = PageModel
+
+
+@App.path(model=PageCollection, path="pages")
+def collection_factory(request):
+    REQUESTED.append(request.path)
+    return PageCollection(request, PageStorage(request))
+
+
+@App.path(model=ErrorRoot, path="error")
+def get_errorroot(request):
+    return ErrorRoot()
+
+
+@App.json(model=ErrorRoot)
+def error(context, request):
+    raise ValueError("broken")
+
+
+@App.typeinfo(name="tests.warmup.page", schema=PageSchema)
+def get_page_typeinfo(request):
+    return {
+        "title": "Page",
+        "description": "Page type",
+        "schema": PageSchema,
+        "collection": PageCollection,
+        "collection_factory": collection_factory,
+        "model": PageModel,
+    }
+
+
+CONFIG = os.path.join(os.path.dirname(__file__), "test_warmup-settings.yml")
+
+
+def test_warmup():
+    client = get_client(CONFIG)
+    app = client.mfw_request.app
+    assert warmup.WARMED_APPS[app] is True
+    # the collection was built for the type, and through the warm-up url
+    assert REQUESTED[:2] == ["/", "/pages"]
+    cschema = schemaconv.convert(dc2colanderjson, PageSchema, exclude_fields=set())
+    assert schemaconv._template(cschema).serializer is not None
+
+    assert client.get("/__ready__").json == {"ready": True}
+
+
+def test_warmup_failed():
+    settings = copy.deepcopy(cli.load(CONFIG)["settings"])
+    settings["configuration"]["morpfw.warmup.urls"] = ["/error"]
+    morepath.scan(morpfw)
+    request = request_factory(settings, scan=False)
+    assert warmup.WARMED_APPS[request.app] is False
+    application = request.environ["morpfw.wsgi.app"]
+    response = webob.Request.blank("/__ready__").get_response(application)
+    assert response.status_code == 503
+    assert response.json == {"ready": False}
+
+
+def test_wsgi_readiness(monkeypatch):
+    settings = cli.load(CONFIG)["settings"]
+    monkeypatch.setenv("MORP_SETTINGS", json.dumps(settings))
+    monkeypatch.setitem(wsgi.APP, "instance", None)
+    loading = threading.Event()
+
+    def hello(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [b"hello"]
+
+    def app_factory(settings):
+        loading.wait(10)
+        return hello
+
+    application = wsgi.wsgi_factory(app_factory)
+    response = webob.Request.blank("/__ready__").get_response(application)
+    assert response.status_code == 503
+    assert response.json == {"ready": False}
+    loading.set()
+    # the probe started loading the application
+    assert wsgi.load_app(app_factory) is hello
+    response = webob.Request.blank("/__ready__").get_response(application)
+    assert response.body == b"hello"
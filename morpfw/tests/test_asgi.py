@@ -0,0 +1,50 @@
+import asyncio
+import threading
+
+from morpfw.asgi import ASGIApplication
+
+
+def wsgi_app(environ, start_response):
+    body = environ["wsgi.input"].read()
+    start_response("201 Created", [("Content-Type", "text/plain"), ("X-Test", "1")])
+    return [
+        environ["REQUEST_METHOD"].encode(),
+        environ["PATH_INFO"].encode("latin1"),
+        b"?" + environ["QUERY_STRING"].encode(),
+        b" " + environ["HTTP_COOKIE"].encode(),
+        b" " + body,
+        b" " + threading.current_thread().name.encode(),
+    ]
+
+
+async def call(app, scope, chunks):
+    messages = [{"type": "http.request", "body": c, "more_body": True} for c in chunks]
+    messages[-1]["more_body"] = False
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent
+
+
+def test_asgi():
+    app = ASGIApplication(wsgi_app, threads=2)
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/pages/café",
+        "query_string": b"a=1",
+        "headers": [(b"cookie", b"a=1"), (b"cookie", b"b=2")],
+    }
+    sent = asyncio.run(call(app, scope, [b"hello ", b"world"]))
+    assert sent[0]["type"] == "http.response.start"
+    assert sent[0]["status"] == 201
+    assert (b"x-test", b"1") in sent[0]["headers"]
+    assert sent[-1] == {"type": "http.response.body", "body": b"", "more_body": False}
+    body = b"".join(m["body"] for m in sent[1:]).decode("utf8")
+    assert body.startswith("POST/pages/café?a=1 a=1; b=2 hello world morpfw-asgi")
@@ -4,9 +4,11 @@ from dataclasses import dataclass
 
 import morpfw
 import sqlalchemy as sa
+import transaction
 from morpfw import sql as morpsql
 from morpfw.crud import Collection, Model
 from morpfw.crud import permission as crudperm
+from morpfw.crud import rollup
 from morpfw.crud.schema import Schema
 
 from .common import get_client, make_request
@@ -43,6 +45,18 @@ class PageSchema(Schema):
     title: typing.Optional[str] = None
     body: typing.Optional[str] = None
 
+    __rollups__ = {
+        "by_title": {
+            "title": "title",
+            "count": {"function": "count", "field": "uuid"},
+        },
+        "by_month": {
+            "year": {"function": "year", "field": "created"},
+            "month": {"function": "month", "field": "created"},
+            "count": {"function": "count", "field": "uuid"},
+        },
+    }
+
 
 @App.identifierfield(schema=PageSchema)
 def page_schema_identifier(schema):
@@ -78,6 +92,7 @@ def test_morp_framework(pgsql_db):
     c = get_client(os.path.join(os.path.dirname(__file__), "test_sqlapp-settings.yml"))
     req = make_request(c.app)
     morpsql.Base.metadata.create_all(bind=req.db_session.bind)
+    rollup.metadata.create_all(bind=req.db_session.bind)
     r = c.get("/")
 
     assert len(r.json["schema"]["properties"]) == 11
@@ -101,3 +116,21 @@ def test_morp_framework(pgsql_db):
     r = c.get(page_url, expect_errors=True)
 
     assert r.status_code == 404
+
+    # aggregates answered from a rollup
+    for title in ["a", "b", "b"]:
+        c.post_json("/", {"title": title, "body": ""})
+    req = make_request(c.app)
+    col = get_pagecollection(req)
+    assert rollup.reconcile(col) == {"by_title": 2, "by_month": 1}
+    transaction.commit()
+
+    r = c.get(
+        "/+aggregate",
+        {
+            "group": "title:title, count:count(uuid)",
+            "order_by": "title:desc",
+            "limit": "1",
+        },
+    )
+    assert r.json == [{"title": "b", "count": 2}]
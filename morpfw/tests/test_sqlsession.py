@@ -1,9 +1,13 @@
 import os
+from datetime import timedelta
 
 import morepath
 import morpfw
 import morpfw.sql
+import rulez
 import yaml
+from morpfw.crud import rollup
+from morpfw.request import absolute_db_url
 from sqlalchemy.sql import func, select
 
 from .test_sqlapp import get_pagecollection
@@ -16,6 +20,7 @@ def test_sqlsession(pgsql_db):
 
     with morpfw.request_factory(settings, scan=False) as request:
         morpfw.sql.Base.metadata.create_all(bind=request.db_session.bind)
+        rollup.metadata.create_all(bind=request.db_session.bind)
 
     with morpfw.request_factory(settings, scan=False) as request:
         col = get_pagecollection(request)
@@ -42,7 +47,14 @@ def test_sqlsession(pgsql_db):
         res = session.execute(sel_stmt)
         assert res.fetchone()[0] == 1
 
-        col.storage.vacuum()
+        # recently deleted records are kept
+        assert col.storage.vacuum(older_than=timedelta(days=1)) == 0
+
+        progress = []
+        assert col.storage.vacuum(
+            batch_size=1, progress=lambda total, last_id: progress.append(total)
+        ) == 1
+        assert progress == [1]
 
         res = session.execute(sel_stmt)
         assert res.fetchone()[0] == 0
@@ -56,3 +68,61 @@ def test_sqlsession(pgsql_db):
         sel_stmt = select([func.count(tbl.c.uuid)]).where(orm_model.deleted.isnot(None))
         res = session.execute(sel_stmt)
         assert res.fetchone()[0] == 0
+
+    # test rollups
+    group = {"title": "title", "count": {"function": "count", "field": "uuid"}}
+    order_by = ("title", "asc")
+    with morpfw.request_factory(settings, scan=False) as request:
+        col = get_pagecollection(request)
+        for title in ["a", "a", "b"]:
+            col.create({"title": title, "body": ""})
+
+        # rollups are only used once reconciled
+        assert rollup.aggregate(col, group) is None
+        assert rollup.reconcile(col) == {"by_title": 2, "by_month": 1}
+
+    with morpfw.request_factory(settings, scan=False) as request:
+        col = get_pagecollection(request)
+        assert col.aggregate(group=group, order_by=order_by) == [
+            {"title": "a", "count": 2},
+            {"title": "b", "count": 1},
+        ]
+        col.search(rulez.field["title"] == "b")[0].update({"title": "c"})
+        col.create({"title": "c", "body": ""})
+        col.search(rulez.field["title"] == "a")[0].delete()
+        expected = [{"title": "a", "count": 1}, {"title": "c", "count": 2}]
+        assert rollup.aggregate(col, group, order_by=order_by) == expected
+        assert col.storage.aggregate(group=group, order_by=order_by) == expected
+
+        # rollups return the same values as the storage
+        month_group = {
+            "year": {"function": "year", "field": "created"},
+            "month": {"function": "month", "field": "created"},
+            "count": {"function": "count", "field": "uuid"},
+        }
+        result = rollup.aggregate(col, month_group)
+        assert result == col.storage.aggregate(group=month_group)
+        assert [type(r["year"]) for r in result] == [float]
+
+        # set-based updates can not be rolled up incrementally
+        col.update_where(rulez.field["title"] == "c", {"title": "d"})
+        assert rollup.aggregate(col, group) is None
+        assert rollup.reconcile(col, stale_only=True) == {"by_title": 2}
+        assert rollup.aggregate(col, group, order_by=("count", "desc")) == [
+            {"title": "d", "count": 2},
+            {"title": "a", "count": 1},
+        ]
+
+
+def test_absolute_db_url():
+    assert (
+        absolute_db_url("sqlite:///data/app.db", "/srv/app")
+        == "sqlite:////srv/app/data/app.db"
+    )
+    for dburl in [
+        "sqlite:////var/app.db",
+        "sqlite://",
+        "sqlite:///:memory:",
+        "postgresql://postgres@localhost:5432/app",
+    ]:
+        assert absolute_db_url(dburl, "/srv/app") == dburl
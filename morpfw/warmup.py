@@ -0,0 +1,168 @@
+"""
+Warm-up of applications before they accept traffic, enabled through
+``morpfw.warmup.enabled``. ``create_app`` warms each application up
+before returning it: typeinfos are resolved, storages and their ORM mappings
+built, schema conversions and serializers cached, pool connections opened
+and ``morpfw.warmup.urls`` requested.
+"""
+import logging
+import weakref
+
+import transaction
+import webob
+from inverter import dc2colanderjson, dc2jsl
+
+from .app import BaseApp as App
+from .crud import schemaconv, serializer
+from .crud.storage.sqlstorage import SQLStorage
+from .engine import engine_registry
+
+logger = logging.getLogger("morp.warmup")
+
+#: default path of the readiness endpoint
+READINESS_PATH = "/__ready__"
+
+#: outcome of the warm-up of application instances, True if every step
+#: succeeded
+WARMED_APPS = weakref.WeakKeyDictionary()
+
+
+class ReadinessRoot(object):
+    def __init__(self, request):
+        self.request = request
+
+
+def is_ready(app):
+    return WARMED_APPS.get(app, False)
+
+
+def warmup_types(request):
+    """Build the collection, storage and cached schemas of registered
+    types. Types that can not be built, such as those without a storage
+    in this application, are logged and skipped"""
+    for name in request.app.config.type_registry.types:
+        try:
+            warmup_type(request, name)
+        except Exception:
+            logger.warning("Warm-up of type %s failed", name, exc_info=True)
+
+
+def warmup_type(request, name):
+    collection = request.get_collection(name)
+    schema = collection.schema
+    storage = collection.storage
+    if isinstance(storage, SQLStorage):
+        # maps the ORM model, and creates the engines of the primary and
+        # replica databases
+        storage.orm_model
+        storage.session.get_bind()
+        storage.read_session.get_bind()
+    schemaconv.convert(dc2jsl, schema)
+    schemaconv.convert(dc2colanderjson, schema, request=request)
+    hidden = set()
+    for fn, fo in schema.__dataclass_fields__.items():
+        if fo.metadata.get("hidden", False):
+            hidden.add(fn)
+    cschema = schemaconv.convert(
+        dc2colanderjson, schema, exclude_fields=hidden, request=request
+    )
+    if serializer.get_backend(request.app) == serializer.CODEGEN:
+        serializer._serializer(cschema)
+
+
+def warmup_pools(connections=1):
+    """Open ``connections`` connections on every engine, leaving them idle
+    in the pool"""
+    for engine in list(engine_registry.engines.values()):
+        conns = []
+        try:
+            for i in range(connections):
+                conns.append(engine.connect())
+        finally:
+            for conn in conns:
+                conn.close()
+
+
+def warmup_urls(application, urls, base_url="http://localhost"):
+    """Request ``urls`` from wsgi ``application``, returns False if any of
+    them raised or returned a server error"""
+    ok = True
+    for url in urls:
+        request = webob.Request.blank(url, base_url=base_url)
+        try:
+            response = request.get_response(application)
+        except Exception:
+            logger.exception("Warm-up of %s failed", url)
+            ok = False
+            continue
+        if response.status_code >= 400:
+            logger.warning("Warm-up of %s returned %s", url, response.status)
+        if response.status_code >= 500:
+            ok = False
+    return ok
+
+
+def warmup(app, application, settings):
+    """
+    Warm up morepath ``app``, and ``application``, the wsgi application
+    wrapping it, according to ``settings``. Errors are logged, warm-up
+    carries on with the next step. Returns True if every step succeeded
+    """
+    config = settings["configuration"]
+    base_url = settings.get("server", {}).get("server_url", "http://localhost")
+    environ = webob.Request.blank("/", base_url=base_url).environ
+    request = app.request_class(app=app, environ=environ)
+    transaction.begin()
+    try:
+        warmup_types(request)
+    finally:
+        # nothing is written during warm-up
+        transaction.abort()
+        clear = getattr(request, "clear_db_session", None)
+        if clear is not None:
+            clear()
+
+    ok = True
+    try:
+        warmup_pools(config.get("morpfw.warmup.connections", 1))
+    except Exception:
+        logger.exception("Warm-up of connection pools failed")
+        ok = False
+
+    # requests are handled in their own transaction
+    urls = config.get("morpfw.warmup.urls", None) or []
+    return warmup_urls(application, urls, base_url) and ok
+
+
+def warmup_app(app, application, settings):
+    """Warm ``app`` up if enabled, and record whether it is ready"""
+    if app in WARMED_APPS:
+        return WARMED_APPS[app]
+    ok = True
+    if settings["configuration"].get("morpfw.warmup.enabled", False):
+        ok = warmup(app, application, settings)
+        if not ok:
+            logger.error("Warm-up failed, %s is not ready", app.__class__.__name__)
+    WARMED_APPS[app] = ok
+    return ok
+
+
+@App.json(model=ReadinessRoot)
+def readiness(context, request):
+    if is_ready(request.app):
+        return {"ready": True}
+
+    @request.after
+    def adjust_response(response):
+        response.status = 503
+
+    return {"ready": False}
+
+
+def hook_readiness_model(cls, path=READINESS_PATH):
+    @cls.path(model=ReadinessRoot, path=path)
+    def get_readinessroot(request):
+        return ReadinessRoot(request)
+
+
+App.hook_readiness_model = classmethod(hook_readiness_model)
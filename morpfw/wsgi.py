@@ -3,10 +3,39 @@ import morpfw
 import yaml
 import os
 from wsgigzip import gzip
+import gc
 import json
 import importlib
+import threading
+
+from .engine import engine_registry
+from .warmup import READINESS_PATH
 
 APP = {'instance': None}
+LOAD_LOCK = threading.Lock()
+
+
+def get_settings():
+    return json.loads(os.environ.get('MORP_SETTINGS'))
+
+
+def load_app(app_factory):
+    """Build the application from ``MORP_SETTINGS``, once per process"""
+    with LOAD_LOCK:
+        if APP['instance'] is None:
+            APP['instance'] = app_factory(get_settings())
+    return APP['instance']
+
+
+def load_app_in_background(app_factory):
+    if LOAD_LOCK.locked():
+        return
+    threading.Thread(target=load_app, args=(app_factory,), daemon=True).start()
+
+
+def not_ready(environ, start_response):
+    start_response('503 Service Unavailable', [('Content-Type', 'application/json')])
+    return [b'{"ready": false}']
 
 
 def wsgi_factory(app_factory):
@@ -16,16 +45,49 @@ def wsgi_factory(app_factory):
         if APP['instance']:
             return APP['instance'](environ, start_response)
 
-        settings = json.loads(os.environ.get('MORP_SETTINGS'))
+        config = get_settings()['configuration']
+        path = config.get('morpfw.warmup.readiness_path', READINESS_PATH)
+        if environ.get('PATH_INFO') == path:
+            # probes are answered while the application is being built and
+            # warmed up, and start building it if nothing else did
+            load_app_in_background(app_factory)
+            return not_ready(environ, start_response)
 
-        application = app_factory(settings)
-        APP['instance'] = application
+        application = load_app(app_factory)
         return application(environ, start_response)
 
     return app
 
 
-def app(environ, start_response):
+def get_app_factory():
     app_mod, app_fname = os.environ['MORP_APP_FACTORY'].split(':')
-    app_factory = getattr(importlib.import_module(app_mod), app_fname)
-    return wsgi_factory(app_factory)(environ, start_response)
+    return getattr(importlib.import_module(app_mod), app_fname)
+
+
+def app(environ, start_response):
+    return wsgi_factory(get_app_factory())(environ, start_response)
+
+
+def load_wsgi_app():
+    """Application factory for gunicorn, building the application when the
+    worker loads, before it accepts requests"""
+    app_factory = get_app_factory()
+    load_app(app_factory)
+    return wsgi_factory(app_factory)
+
+
+def preload_app():
+    """
+    Application factory for ``gunicorn --preload``, building and committing
+    the application once in the master process. Objects that exist after
+    loading are moved to the permanent GC generation, so that garbage
+    collections in workers do not touch (and copy) the pages they share
+    with the master
+    """
+    app_factory = get_app_factory()
+    load_app(app_factory)
+    # connections opened while loading would be dropped in workers
+    engine_registry.dispose()
+    gc.collect()
+    gc.freeze()
+    return wsgi_factory(app_factory)
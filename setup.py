@@ -102,6 +102,8 @@ setup(
             "mirakuru",
         ],
         "docs": ["sphinxcontrib-httpdomain", "sphinx-click"],
+        "avro": ["fastavro"],
+        "fast": ["orjson"],
     },
     entry_points={
         "morepath": ["scan=morpfw"],